@@ -1,8 +1,12 @@
 import os
 import re
 import logging
-import pandas as pd
-from typing import Optional, Tuple, List
+from typing import TYPE_CHECKING, Optional, Tuple, List
+
+# pandas and numpy are imported where they are used, so that parsing result
+# files does not load them.
+if TYPE_CHECKING:
+    import pandas as pd
 
 US_STATE_IDS = [
     "AL",
@@ -73,23 +77,96 @@ _mx_dirtbike_brands = [
     "STARK",
 ]
 
-_mx_numbers_found_results = []
-_mx_riders_found_results = []
-_mx_hometowns_found_results = []
-_mx_brands_found_results = []
-_mx_tracks_found_results = []
-_mx_track_locations_found_results = []
-_mx_races = []
-_mx_race_results = []
+# Abbreviations, misspellings and model names the results give instead of the
+# brand of the bike
+_mx_dirtbike_brand_aliases = {
+    "HON": "HONDA",
+    "CR": "HONDA",
+    "CRF": "HONDA",
+    "YAM": "YAMAHA",
+    "YZ": "YAMAHA",
+    "YZF": "YAMAHA",
+    "AYMAHA": "YAMAHA",
+    "KAW": "KAWASAKI",
+    "KX": "KAWASAKI",
+    "KXF": "KAWASAKI",
+    "AWASAKI": "KAWASAKI",
+    "KAWASAI": "KAWASAKI",
+    "KAWSAKI": "KAWASAKI",
+    "SUZ": "SUZUKI",
+    "RM": "SUZUKI",
+    "RMZ": "SUZUKI",
+    "HQV": "HUSQVARNA",
+    "HUSKY": "HUSQVARNA",
+    "FC": "HUSQVARNA",
+    "TC": "HUSQVARNA",
+    "SX": "KTM",
+    "SXF": "KTM",
+    "GAS": "GASGAS",
+    "MC": "GASGAS",
+}
+
+# Spelling of the brands that are not written like a title
+_mx_dirtbike_brand_names = {"KTM": "KTM", "GASGAS": "GasGas"}
+
+
+class ParseStatistics:
+    """
+    Collects all data found during parsing files with parse_result_file().
+
+    Only the parser adds to a collector. Results that are created for prompts
+    at runtime are never collected, so a long-running server does not grow.
+    """
+
+    def __init__(self):
+        self.numbers = []
+        self.riders = []
+        self.hometowns = []
+        self.brands = []
+        self.tracks = []
+        self.track_locations = []
+        self.races = []
+        self.race_results = []
+
+    def add_race_result(self, race_result: "RaceResult"):
+        self.tracks.append(race_result.track_name)
+        self.track_locations.append(race_result.track_location)
+        self.races.append(
+            f"{race_result.race_date}: race on track '{race_result.track_name}' in {race_result.track_location}"
+        )
+        self.race_results.extend(race_result.to_csv())
+
+        for result in race_result.results:
+            self.add_result(result)
 
+    def add_result(self, result: "Result"):
+        self.riders.append(f"{result.driver_name}")
+        self.numbers.append(result.num)
+        if result.hometown is not None:
+            self.hometowns.append(result.hometown)
 
-def export_found_data():
+        pattern = r"[a-zA-Z]"
+        bike = result.bike
+        if bike is not None and len(bike) > 0:
+            if bike[0] != "," and re.match(pattern, bike):
+                self.brands.append(bike)
+
+
+# Collector used by parse_result_file() if no other collector is given
+PARSE_STATISTICS = ParseStatistics()
+
+
+def export_found_data(statistics: Optional[ParseStatistics] = None):
     """
     Export all data found during parsing files with parse_result_file()
     """
+    if statistics is None:
+        statistics = PARSE_STATISTICS
+
+    import pandas as pd
 
     csv_filename = "race_results.csv"
-    df = pd.DataFrame(_mx_race_results)
+    df = pd.DataFrame(statistics.race_results)
     df = df.drop(columns=["round", "kind_of_result", "hometown"])
     df.to_csv(csv_filename, index=False)
 
@@ -103,7 +180,42 @@ def ordinal_suffix(n: int) -> str:
     return f"{n}{suffix}"
 
 
+def get_bike_brand(bike: Optional[str]) -> Optional[str]:
+    """
+    Return the brand of a bike like "YAM YZ450F" or "Yamaha YZ 250F", i.e.
+    "Yamaha", or None if the bike names no known brand.
+    """
+    if bike is None:
+        return None
+
+    # Some bikes start with the rest of the hometown, e.g. "Morlaix KAW"
+    for word in re.split(r"[\s/,]+", bike.strip().upper()):
+        brand = _get_brand_of_word(word)
+        if brand is not None:
+            return _mx_dirtbike_brand_names.get(brand, brand.title())
+
+    return None
+
+
+def _get_brand_of_word(word: str) -> Optional[str]:
+    for brand in _mx_dirtbike_brands:
+        # Also names like "YAMAHAYZ250F" without space before the model
+        if word.startswith(brand):
+            return brand
+
+    # Abbreviations and models like "KX450" or "CRF250R"
+    match = re.match(r"[A-Z]+", word)
+    if match is None:
+        return None
+
+    return _mx_dirtbike_brand_aliases.get(match.group(0))
+
+
 class Result:
+    # Results are created in large numbers for every prompt, therefore they
+    # do without an instance dict.
+    __slots__ = ("pos", "num", "driver_name", "hometown", "bike")
+
     def __init__(
         self,
         pos: int,
@@ -118,22 +230,7 @@ class Result:
         self.hometown = hometown
         self.bike = bike
 
-        logging.debug(f"New race result created: {repr(self)}")
-
-        global _mx_numbers_found_results
-        global _mx_riders_found_results
-        global _mx_hometowns_found_results
-        global _mx_brands_found_results
-
-        _mx_riders_found_results.append(f"{driver_name}")
-        _mx_numbers_found_results.append(num)
-        if hometown is not None:
-            _mx_hometowns_found_results.append(hometown)
-
-        pattern = r"[a-zA-Z]"
-        if bike is not None and len(bike) > 0:
-            if bike[0] != "," and re.match(pattern, bike):
-                _mx_brands_found_results.append(bike)
+        logging.debug("New race result created: %r", self)
 
     def __str__(self) -> str:
         # Basic format: "#<position>. <driver> (#<number>)"
@@ -155,15 +252,21 @@ class Result:
         )
 
     def as_prompt(self) -> str:
-        result = f"  {self.num}      {self.pos}     {self.driver_name}    "
-
-        if self.bike:
-            result += f"{self.bike}"
-
-        return result
+        return _result_prompt_line(self.num, self.pos, self.driver_name, self.bike)
 
 
 class RaceResult:
+    __slots__ = (
+        "track_name",
+        "track_location",
+        "round",
+        "race_date",
+        "class_name",
+        "kind_of_result",
+        "results",
+        "source",
+    )
+
     def __init__(
         self,
         track_name: Optional[str],
@@ -174,7 +277,6 @@ class RaceResult:
         kind_of_result: Optional[str],
         results: List[Result],
         source: str,
-        store_to_static_vars: bool = True,
     ):
         self.track_name = track_name
         self.track_location = track_location
@@ -185,22 +287,6 @@ class RaceResult:
         self.results = results
         self.source = source
 
-        if store_to_static_vars:
-            global _mx_tracks_found_results
-            global _mx_track_locations_found_results
-            global _mx_race_results
-            global _mx_races
-
-            _mx_tracks_found_results.append(track_name)
-            _mx_track_locations_found_results.append(track_location)
-            _mx_races.append(
-                f"{self.race_date}: race on track '{self.track_name}' in {self.track_location}"
-            )
-
-            csv_data = self.to_csv()
-            for d in csv_data:
-                _mx_race_results.append(d)
-
     def __str__(self) -> str:
         # Build header with available information
         header_parts = []
@@ -236,17 +322,9 @@ class RaceResult:
         )
 
     def as_prompt(self, only_top10: bool = False, only_top3: bool = False) -> str:
-        if (
-            self.track_name
-            and self.race_date
-            and self.track_location
-            and self.class_name
-        ):
-            header = f"### Race Results from track {self.track_name} on {self.race_date} of class {self.class_name}\n\n"
-        else:
-            header = "### Race Results\n\n"
-
-        header += "number  position  name              bike"
+        header = _race_prompt_header(
+            self.track_name, self.track_location, self.race_date, self.class_name
+        )
 
         # Format results
         if only_top3:
@@ -308,12 +386,17 @@ class RaceResult:
 
 
 def parse_result_file(
-    path: str, race_track: Optional[str] = None
+    path: str,
+    race_track: Optional[str] = None,
+    statistics: Optional[ParseStatistics] = None,
 ) -> Optional[RaceResult]:
     """
     Opens a .txt file with AMA motocross results. This .txt file is assumed to
     be created by library pdfplumber from the original PDF file from the
     website of americanmotocross.com.
+
+    The race result found is added to the given statistics collector, by
+    default to PARSE_STATISTICS.
     """
     global _current_pos
     global _result_handler
@@ -393,7 +476,7 @@ def parse_result_file(
     if len(results) == 0:
         return None
 
-    return RaceResult(
+    race_result = RaceResult(
         track_name,
         track_location,
         round,
@@ -404,6 +487,12 @@ def parse_result_file(
         path,
     )
 
+    if statistics is None:
+        statistics = PARSE_STATISTICS
+    statistics.add_race_result(race_result)
+
+    return race_result
+
 
 def _get_track_location(line: str) -> Optional[str]:
     for state_id in US_STATE_IDS:
@@ -767,34 +856,57 @@ def _get_result(line: str) -> Optional[Result]:
     return None
 
 
-def from_dataframe_to_race_results(df: pd.DataFrame) -> List[RaceResult]:
+def _result_prompt_line(num, pos, driver_name, bike) -> str:
+    result = f"  {num}      {pos}     {driver_name}    "
+
+    if bike:
+        result += f"{bike}"
+
+    return result
+
+
+def _race_prompt_header(track_name, track_location, race_date, class_name) -> str:
+    if track_name and race_date and track_location and class_name:
+        header = f"### Race Results from track {track_name} on {race_date} of class {class_name}\n\n"
+    else:
+        header = "### Race Results\n\n"
+
+    header += "number  position  name              bike"
+
+    return header
+
+
+def from_dataframe_to_race_results(df: "pd.DataFrame") -> List[RaceResult]:
+    import pandas as pd
+
     sorted_df = df.sort_values(by=["source", "position"])
     if isinstance(sorted_df, pd.Series):
         sorted_df = sorted_df.to_frame()
 
-    sources = sorted_df["source"].unique().tolist()
-
     race_results = []
-    for source in sources:
-        filtered_df = sorted_df[sorted_df["source"] == source]
-
-        results = []
+    # Grouping visits each row once, instead of filtering the whole data frame
+    # again for every source.
+    for source, filtered_df in sorted_df.groupby("source", sort=True, observed=True):
         track_name = filtered_df.iloc[0]["track_name"]
         track_location = filtered_df.iloc[0]["track_location"]
         race_date = filtered_df.iloc[0]["race_date"]
         class_name = filtered_df.iloc[0]["class_name"]
-        source = filtered_df.iloc[0]["source"]
 
-        for row in filtered_df.itertuples(index=False):
-            result = Result(
-                pos=int(row.position),
-                num=int(row.number),
-                driver_name=str(row.driver_name),
+        results = [
+            Result(
+                pos=int(position),
+                num=int(number),
+                driver_name=str(driver_name),
                 hometown=None,
-                bike=str(row.mx_bike),
+                bike=str(mx_bike),
             )
-
-            results.append(result)
+            for position, number, driver_name, mx_bike in zip(
+                filtered_df["position"],
+                filtered_df["number"],
+                filtered_df["driver_name"],
+                filtered_df["mx_bike"],
+            )
+        ]
 
         race_result = RaceResult(
             track_name=track_name,
@@ -805,9 +917,115 @@ def from_dataframe_to_race_results(df: pd.DataFrame) -> List[RaceResult]:
             kind_of_result=None,
             results=results,
             source=source,
-            store_to_static_vars=False,
         )
 
         race_results.append(race_result)
 
     return race_results
+
+
+class RacePromptBlocks:
+    """
+    Prompt text of all races rendered once when the race results are loaded.
+    The text of a race never changes, so the complete block of every race is
+    kept per number of positions listed, and the line of every row is kept for
+    races that are retrieved only in part, e.g. the rows of one driver.
+    Rendering a result set is then a concatenation of these strings and gives
+    the same text as RaceResult.as_prompt.
+    """
+
+    # Positions listed for only_top3, only_top10 and all results
+    MAX_POSITIONS = (3, 10, 50)
+
+    def __init__(self, df: Optional["pd.DataFrame"] = None):
+        import pandas as pd
+
+        self._lines = pd.Series([], dtype=object)
+        self._headers = {}
+        self._race_sizes = {}
+        self._blocks = {}
+
+        if df is not None:
+            self.add(df)
+
+    def add(self, df: "pd.DataFrame"):
+        """
+        Render the races of further rows, e.g. of a partition that was just
+        loaded. The rows must not overlap with the rows added before, and all
+        rows of a race must be added at once.
+        """
+        import pandas as pd
+
+        sorted_df = df.sort_values(by=["source", "position"])
+
+        all_lines = pd.Series(
+            [
+                _result_prompt_line(int(num), int(pos), str(driver_name), str(bike))
+                for num, pos, driver_name, bike in zip(
+                    sorted_df["number"],
+                    sorted_df["position"],
+                    sorted_df["driver_name"],
+                    sorted_df["mx_bike"],
+                )
+            ],
+            index=sorted_df.index,
+            dtype=object,
+        )
+
+        for source, race_df in sorted_df.groupby("source", sort=True, observed=True):
+            first = race_df.iloc[0]
+            header = _race_prompt_header(
+                first["track_name"],
+                first["track_location"],
+                first["race_date"],
+                first["class_name"],
+            )
+            lines = all_lines[race_df.index].to_numpy()
+            positions = race_df["position"].to_numpy()
+
+            self._headers[source] = header
+            self._race_sizes[source] = len(race_df)
+            for max_position in self.MAX_POSITIONS:
+                self._blocks[(source, max_position)] = _race_prompt_block(
+                    header, lines[positions <= max_position]
+                )
+
+        # The lines are replaced last, so that a concurrent render() never
+        # finds lines of a race whose blocks are missing.
+        if len(self._lines) > 0:
+            all_lines = pd.concat([self._lines, all_lines])
+        self._lines = all_lines
+
+    def render(self, results: "pd.DataFrame", max_position: int = 50) -> List[str]:
+        """
+        Return the prompt blocks of all races in the results. The results must
+        be rows of the data frame these blocks were built from.
+        """
+        import numpy as np
+
+        sorted_df = results.sort_values(by=["source", "position"])
+
+        sources = sorted_df["source"].to_numpy()
+        positions = sorted_df["position"].to_numpy()
+        lines = self._lines[sorted_df.index].to_numpy()
+
+        # Rows of one race are adjacent after sorting
+        starts = np.flatnonzero(np.r_[True, sources[1:] != sources[:-1]])
+        ends = np.r_[starts[1:], len(sources)]
+
+        blocks = []
+        for start, end in zip(starts, ends):
+            source = sources[start]
+            if end - start == self._race_sizes[source]:
+                blocks.append(self._blocks[(source, max_position)])
+            else:
+                race_lines = lines[start:end][positions[start:end] <= max_position]
+                blocks.append(_race_prompt_block(self._headers[source], race_lines))
+
+        return blocks
+
+
+def _race_prompt_block(header: str, lines) -> str:
+    results_section = "\n".join(lines)
+
+    return f"{header}\n{results_section}\n"
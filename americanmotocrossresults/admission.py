@@ -0,0 +1,188 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Upper bound of concurrent requests per model
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+# Requests per second per model. 0 does not limit the rate.
+LLM_REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "0"))
+
+# Requests per model that may be sent at once after a quiet period
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+
+# Seconds a request waits in the queue before it is rejected
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+# Upper bound of the pause after the upstream answered with 429
+MAX_BACKOFF_SECONDS = 60.0
+
+
+class AdmissionTimeout(Exception):
+    """The request waited longer than the queue timeout."""
+
+
+class RateLimitedError(Exception):
+    """The upstream rejected the request with 429 Too Many Requests."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admission of the requests to one model. Requests are admitted in the order
+    of their arrival as long as fewer than max_concurrency requests are active
+    and the token bucket is not empty.
+
+    After a 429 of the upstream no request is admitted for a backoff period
+    that doubles with every further 429 after this period, and the rate is
+    halved. Every successful request restores a tenth of the configured rate.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        requests_per_second: float = 0.0,
+        burst: int = 10,
+        queue_timeout: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self._queue = deque()
+        self._active = 0
+        self._rate = requests_per_second
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._backoff = 0.0
+
+    @contextmanager
+    def admit(self):
+        """Wait for admission and yield the seconds waited in the queue."""
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def acquire(self) -> float:
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        ticket = object()
+
+        with self._condition:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = self._delay(now)
+                    if self._queue[0] is ticket and delay == 0.0:
+                        break
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise AdmissionTimeout(
+                            f"No admission within {self.queue_timeout} seconds"
+                        )
+
+                    # Only the first request of the queue waits for the delay,
+                    # all others wait until they are notified.
+                    if self._queue[0] is ticket:
+                        remaining = min(remaining, delay)
+                    self._condition.wait(remaining)
+            except BaseException:
+                self._queue.remove(ticket)
+                self._condition.notify_all()
+                raise
+
+            self._queue.popleft()
+            self._active += 1
+            if self._rate > 0:
+                self._tokens -= 1.0
+
+            # The next request of the queue may be admitted as well
+            self._condition.notify_all()
+
+        return time.monotonic() - start
+
+    def release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def succeeded(self):
+        with self._condition:
+            self._backoff = 0.0
+            if self._rate < self.requests_per_second:
+                self._rate = min(
+                    self.requests_per_second,
+                    self._rate + self.requests_per_second / 10,
+                )
+
+    def rate_limited(self, retry_after: Optional[float] = None):
+        with self._condition:
+            now = time.monotonic()
+
+            # Requests sent before the pause fail together, only a 429 after
+            # the pause doubles it.
+            if now >= self._paused_until:
+                self._backoff = min(max(2 * self._backoff, 1.0), MAX_BACKOFF_SECONDS)
+                if self._rate > 0:
+                    self._rate = max(self._rate / 2, self.requests_per_second / 16)
+
+            pause = retry_after if retry_after is not None else self._backoff
+            self._paused_until = max(self._paused_until, now + pause)
+
+            logging.warning(
+                f"LLM rate limit hit, pausing for {pause:.1f} seconds "
+                f"at {self._rate:.2f} requests per second"
+            )
+
+    def _delay(self, now: float) -> float:
+        """Return the seconds until the next request may be admitted."""
+        if self._active >= self.max_concurrency:
+            return math.inf
+
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        if self._rate > 0:
+            self._tokens = min(
+                float(self.burst), self._tokens + (now - self._refilled) * self._rate
+            )
+            self._refilled = now
+            if self._tokens < 1.0:
+                return (1.0 - self._tokens) / self._rate
+
+        return 0.0
+
+
+_CONTROLLERS: Dict[str, AdmissionController] = {}
+_CONTROLLERS_LOCK = threading.Lock()
+
+
+def get_controller(model: str) -> AdmissionController:
+    """Return the admission controller of the given model."""
+    with _CONTROLLERS_LOCK:
+        controller = _CONTROLLERS.get(model)
+        if controller is None:
+            controller = AdmissionController(
+                LLM_MAX_CONCURRENCY,
+                LLM_REQUESTS_PER_SECOND,
+                LLM_BURST,
+                LLM_QUEUE_TIMEOUT,
+            )
+            _CONTROLLERS[model] = controller
+
+        return controller
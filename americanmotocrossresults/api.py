@@ -0,0 +1,153 @@
+import json
+import logging
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel
+from typing import Dict, Iterator, List, Optional, Union
+
+from . import chat
+from . import profiler
+
+# Upper bound of the rows returned by one request
+MAX_ROWS = 5000
+
+# Upper bound of the chat calls profiled at once
+MAX_PROFILED_CALLS = 1000
+
+
+class ChatRequest(BaseModel):
+    query: str
+    history: List[Dict] = []
+    session_id: Optional[str] = None
+
+
+class RowsRequest(BaseModel):
+    # Values per column like the lines of the headline response, e.g.
+    # {"driver_name": ["Eli Tomac"], "year": [2019]}
+    criteria: Dict[str, List[Union[str, int]]]
+    limit: int = 1000
+
+
+class ProfileRequest(BaseModel):
+    calls: int = 10
+    interval: Optional[float] = None
+
+
+def create_api() -> FastAPI:
+    """
+    Create the HTTP API for programmatic clients. It shares the loaded race
+    results and name indexes with the chat UI of the same process.
+
+    POST /api/chat streams the answer to a query as Server-Sent Events. Every
+    "delta" event carries the text added to the answer, a "replace" event the
+    whole answer if it was not continued, and a "done" event ends the stream.
+
+    POST /api/rows returns the race results found for the given criteria as
+    JSON without calling the LLM.
+
+    With PROFILER_ENABLED, POST /api/profile profiles the next chat calls of
+    the process, GET /api/profile returns the state of the profiler and GET
+    /api/profile/folded the stacks sampled so far for flamegraph.pl.
+    """
+    api = FastAPI()
+
+    @api.post("/api/chat")
+    def chat_endpoint(request: ChatRequest):
+        updates = chat.chat(request.query, request.history, request.session_id)
+        return StreamingResponse(_sse_events(updates), media_type="text/event-stream")
+
+    @api.post("/api/rows")
+    def rows_endpoint(request: RowsRequest):
+        return Response(
+            _find_rows(request.criteria, request.limit), media_type="application/json"
+        )
+
+    if profiler.PROFILER_ENABLED:
+
+        @api.post("/api/profile")
+        def start_profile_endpoint(request: ProfileRequest):
+            if request.calls < 1 or request.calls > MAX_PROFILED_CALLS:
+                raise HTTPException(
+                    400, f"calls must be between 1 and {MAX_PROFILED_CALLS}"
+                )
+            if request.interval is not None and request.interval <= 0:
+                raise HTTPException(400, "interval must be positive")
+
+            profiler.PROFILER.start(request.calls, request.interval)
+            return profiler.PROFILER.status()
+
+        @api.get("/api/profile")
+        def profile_status_endpoint():
+            return profiler.PROFILER.status()
+
+        @api.get("/api/profile/folded")
+        def folded_profile_endpoint():
+            return PlainTextResponse(profiler.PROFILER.folded())
+
+    return api
+
+
+def _sse_events(updates: Iterator[str]) -> Iterator[str]:
+    # The chat yields the whole answer so far with every update, but only the
+    # new text is sent.
+    answer = ""
+    for update in updates:
+        if update is None:
+            continue
+
+        if update.startswith(answer):
+            if len(update) > len(answer):
+                yield _sse_event("delta", update[len(answer) :])
+        else:
+            yield _sse_event("replace", update)
+        answer = update
+
+    yield _sse_event("done", "")
+
+
+def _sse_event(event: str, text: str) -> str:
+    return f"event: {event}\ndata: {json.dumps({"text": text})}\n\n"
+
+
+def _find_rows(criteria: Dict[str, List], limit: int) -> str:
+    chat._ensure_snapshot()
+
+    if limit < 1 or limit > MAX_ROWS:
+        raise HTTPException(400, f"limit must be between 1 and {MAX_ROWS}")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        builder = chat._SearchCriteriaBuilder(
+            chat.RACE_RESULTS, executor, race_partitions=chat.RACE_PARTITIONS
+        )
+        for header_name, values in criteria.items():
+            for value in values:
+                builder.add(f"{header_name}: {value}")
+
+        if builder.is_empty():
+            raise HTTPException(400, "No valid search criteria given")
+
+        search_criterias, results = builder.build()
+
+    logging.info(f"API found {len(results)} rows for {search_criterias}")
+
+    rows = results.head(limit).drop(columns=["race_day"], errors="ignore")
+
+    return (
+        f'{{"criteria": {json.dumps(search_criterias, default=_to_json)}, '
+        f'"num_of_results": {len(results)}, '
+        f'"rows": {rows.to_json(orient="records")}}}'
+    )
+
+
+def _to_json(value):
+    # NumPy and pandas scalars of the resolved criteria
+    if hasattr(value, "item"):
+        return value.item()
+
+    if pd.isna(value):
+        return None
+
+    return str(value)
@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List
+
+import chromadb
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
+from . import admission
+from . import drivers
+from . import llm
+from . import names
+from . import tracks
+
+# Model of the embeddings, the same that the vector databases use for queries
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Names embedded with one request of the embeddings API. The OpenAI API takes
+# at most 2048 texts per request.
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "256"))
+
+# Requests of the embeddings API at the same time
+INDEX_CONCURRENCY = int(os.getenv("INDEX_CONCURRENCY", "4"))
+
+# Attempts of a batch that the upstream rejects with 429
+INDEX_MAX_ATTEMPTS = int(os.getenv("INDEX_MAX_ATTEMPTS", "8"))
+
+# Seconds a batch may wait for admission, e.g. during the pause after a 429
+INDEX_QUEUE_TIMEOUT = 600.0
+
+
+def name_id(name: str) -> str:
+    """
+    Return the id of a name in a vector database. It depends only on the name,
+    so every build gives a name the same id.
+    """
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()[:32]
+
+
+def build_collection(
+    collection,
+    all_names: List[str],
+    embed: Callable[[List[str]], List[List[float]]],
+    batch_size: int = INDEX_BATCH_SIZE,
+    concurrency: int = INDEX_CONCURRENCY,
+) -> int:
+    """
+    Add the names that are missing in the collection and return how many were
+    added. The names are embedded in batches with up to concurrency requests
+    at the same time, and a batch rejected with 429 is sent again after a
+    backoff. Every batch is added to the collection as soon as it is embedded,
+    so an interrupted build resumes with the names still missing.
+    """
+    # Names are compared instead of ids, so that collections built with other
+    # ids are completed without duplicates.
+    present = set(collection.get(include=["documents"])["documents"])
+    missing = [
+        (name_id(name), name)
+        for name in dict.fromkeys(all_names)
+        if name not in present
+    ]
+
+    logging.info(
+        f"Collection {collection.name}: {len(present)} names present, "
+        f"embedding {len(missing)}"
+    )
+    if len(missing) == 0:
+        return 0
+
+    controller = admission.AdmissionController(
+        concurrency, queue_timeout=INDEX_QUEUE_TIMEOUT
+    )
+    batches = [
+        missing[start : start + batch_size]
+        for start in range(0, len(missing), batch_size)
+    ]
+
+    added = 0
+    error = None
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(
+                _embed_batch, embed, [name for _, name in batch], controller
+            ): batch
+            for batch in batches
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                embeddings = future.result()
+            except Exception as e:
+                # The other batches are still added for the next build
+                logging.error(f"Embedding of {len(batch)} names failed: {e}")
+                error = e
+                continue
+
+            collection.add(
+                ids=[i for i, _ in batch],
+                documents=[name for _, name in batch],
+                embeddings=embeddings,
+            )
+            added += len(batch)
+            logging.info(f"Collection {collection.name}: {added} of {len(missing)}")
+
+    if error is not None:
+        raise error
+
+    return added
+
+
+def _embed_batch(
+    embed: Callable[[List[str]], List[List[float]]],
+    batch: List[str],
+    controller: admission.AdmissionController,
+) -> List[List[float]]:
+    error = None
+    for _ in range(INDEX_MAX_ATTEMPTS):
+        try:
+            with controller.admit():
+                embeddings = embed(batch)
+            controller.succeeded()
+            return embeddings
+        except admission.RateLimitedError as e:
+            controller.rate_limited(e.retry_after)
+            error = e
+
+    raise error
+
+
+def _openai_embed(texts: List[str]) -> List[List[float]]:
+    return llm.BACKENDS[llm.DEFAULT_BACKEND].embeddings(EMBEDDING_MODEL, texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the vector databases of driver and track names"
+    )
+    parser.add_argument(
+        "--collections", nargs="+", choices=["drivers", "tracks"], default=None
+    )
+    parser.add_argument("--batch-size", type=int, default=INDEX_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=INDEX_CONCURRENCY)
+    parser.add_argument(
+        "--rebuild", action="store_true", help="delete the collections first"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logging.error("OPENAI_API_KEY is not set")
+        raise SystemExit(1)
+
+    # The chat module loads the race results
+    from . import chat
+
+    race_results = chat._load_results_csv()
+    embedding_function = OpenAIEmbeddingFunction(
+        api_key=api_key, model_name=EMBEDDING_MODEL
+    )
+
+    targets = {
+        "drivers": (drivers.DRIVERS_DB_PATH, "driver_name"),
+        "tracks": (tracks.TRACKS_DB_PATH, "track_name"),
+    }
+    for collection_name in args.collections or list(targets):
+        path, column = targets[collection_name]
+        chroma_client = chromadb.PersistentClient(path=path)
+
+        if args.rebuild and collection_name in chroma_client.list_collections():
+            chroma_client.delete_collection(collection_name)
+
+        collection = chroma_client.get_or_create_collection(
+            name=collection_name, embedding_function=embedding_function
+        )
+
+        start = time.perf_counter()
+        added = build_collection(
+            collection,
+            names.column_names(race_results[column]),
+            _openai_embed,
+            args.batch_size,
+            args.concurrency,
+        )
+        logging.info(
+            f"Collection {collection_name}: added {added} names in "
+            f"{time.perf_counter() - start:.1f} seconds"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import numbers
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+
+# Upper bound of rendered result sets kept in memory. 0 disables the cache.
+RESULTS_CACHE_SIZE = int(os.getenv("RESULTS_CACHE_SIZE", "128"))
+
+
+class ResultsCache:
+    """
+    Thread-safe LRU cache of rendered result sets keyed by the canonical
+    search criteria. All entries are dropped as soon as they are requested for
+    another version of the dataset.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._version = None
+        self._entries: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, version: Hashable, key: Hashable):
+        with self._lock:
+            self._check_version(version)
+
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+            return value
+
+    def put(self, version: Hashable, key: Hashable, value):
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._check_version(version)
+
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _check_version(self, version: Hashable):
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+
+def canonical_criteria(search_criterias: Dict, spec=None) -> Tuple:
+    """
+    Return a hashable form of the search criteria that is the same for
+    criteria that find the same rows, i.e. independent of the order of columns
+    and values, of duplicates, of upper and lower case and of 2019 vs. 2019.0.
+    The query spec of the SQLite query engine is part of the key if given.
+    """
+    criteria = tuple(
+        sorted(
+            (header_name, tuple(sorted({_canonical_value(p) for p in patterns})))
+            for header_name, patterns in search_criterias.items()
+        )
+    )
+
+    if spec is None:
+        return (criteria,)
+
+    return (
+        criteria,
+        tuple(sorted(spec.conditions, key=repr)),
+        tuple(spec.group_by),
+        tuple(spec.aggregates),
+        spec.limit,
+    )
+
+
+def _canonical_value(value) -> str:
+    if isinstance(value, numbers.Number):
+        return repr(float(value))
+    return str(value).lower()
+
+
+RESULTS_CACHE = ResultsCache(RESULTS_CACHE_SIZE)
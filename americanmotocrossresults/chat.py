@@ -1,29 +1,140 @@
 import logging
-import openai
+import json
 import os
+import re
+import numpy as np
 import pandas as pd
 import copy
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from jinja2 import Environment, FileSystemLoader
 from pprint import pprint
-from typing import List, Dict, Optional
-
-from . import drivers, from_dataframe_to_race_results
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from . import drivers, from_dataframe_to_race_results, get_bike_brand, RacePromptBlocks
+from . import llm
+from . import cache
+from . import compact
+from . import conversation
+from . import metrics
+from . import names
+from . import once
+from . import partitions
+from . import profiler
+from . import query
+from . import session
+from . import singleflight
 from . import tracks
 
-MODEL_FOR_CSV_HEADER = "gpt-4o-mini"
-MODEL_FOR_USER_RESPONSE = "gpt-4o-mini"
+# Models are given as "<backend>:<model>" or as plain OpenAI model name, see
+# module llm for the available backends.
+MODEL_FOR_CSV_HEADER = os.getenv("MODEL_FOR_CSV_HEADER", "gpt-4o-mini")
+MODEL_FOR_USER_RESPONSE = os.getenv("MODEL_FOR_USER_RESPONSE", "gpt-4o-mini")
 
 MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 RACE_RESULTS_CSV_FILENAME = os.path.join(MODULE_DIR, "race_results.csv")
 
+# Declared schema of the CSV file data. Strings repeat a lot, e.g. the source
+# URL in every row of a race, so they are kept as categoricals.
+RACE_RESULTS_DTYPES = {
+    "track_name": "category",
+    "track_location": "category",
+    "year": "Int16",
+    "race_date": "category",
+    "class_name": "category",
+    "position": "int16",
+    "number": "int16",
+    "driver_name": "category",
+    "mx_bike": "category",
+    "source": "category",
+}
+
 # Global object for CSV file data
 RACE_RESULTS = None
 
+# Version of the loaded CSV file data. Cached result sets of other versions are
+# not used.
+RACE_RESULTS_VERSION = None
+
+# Prompt text of all races of the CSV file data rendered when it is loaded
+RACE_PROMPT_BLOCKS = None
+
+# Loads the CSV file data once although the first requests come all at once
+SNAPSHOT_ONCE = once.Once("CSV file data")
+
+# Partitions of the CSV file data by year and class if the data is loaded from
+# partitions.PARTITIONS_DIR. RACE_RESULTS then holds no rows but only the
+# columns and categories, and the rows are loaded per partition on demand.
+RACE_PARTITIONS = None
+
+# Upper bound of results handed to the LLM
+MAX_RESULTS = 15000
+
+# Format of the race results in the prompt of the final response. "markdown"
+# gives every race a header and padded columns, "compact" gives races of the
+# same event one header, rows of comma-separated values and keys for repeated
+# drivers and bikes, see module compact.
+RESULTS_FORMAT = os.getenv("RESULTS_FORMAT", "markdown")
+
+# Data shown to the LLM for the extraction of the CSV headlines. "compact"
+# describes the columns and lists only the tracks similar to names in the user
+# query, "full" shows a sample of the CSV file and all tracks.
+HEADLINE_PROMPT = os.getenv("HEADLINE_PROMPT", "compact")
+
+# Upper bound of the tracks listed in the compact headline prompt
+HEADLINE_CANDIDATE_TRACKS = int(os.getenv("HEADLINE_CANDIDATE_TRACKS", "5"))
+
+# Tracks farther away from every name of the user query are no candidates
+HEADLINE_TRACK_MAX_DISTANCE = 1.0
+
+# Data of the headline prompt, i.e. the compact description of the columns, a
+# sample and the tracks, and the index of the track names for the candidate
+# tracks, both made when the data is loaded
+HEADLINE_DATA = None
+HEADLINE_TRACK_INDEX = None
+
+# Meaning of the columns shown in the compact headline prompt
+COLUMN_DESCRIPTIONS = {
+    "track_name": "name of the track",
+    "track_location": "town and state of the track",
+    "year": "year of the race",
+    "race_date": "day of the race",
+    "class_name": "class of the race",
+    "position": "finishing position, 1 is the winner",
+    "number": "race number of the driver",
+    "driver_name": "first and last name of the driver",
+    "mx_bike": "brand and model of the bike",
+    "mx_brand": "brand of the bike",
+}
+
+# Identical headline extractions and retrievals in flight at the same time run
+# only once, e.g. when many users ask who won the race that just ended.
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "1") == "1"
+
+# Identical final answers in flight at the same time are streamed from one
+# upstream response to all waiting sessions.
+COALESCE_ANSWERS = os.getenv("COALESCE_ANSWERS", "1") == "1"
+
+FLIGHTS = singleflight.SingleFlight()
+
+# Requests for a plain list of results are answered with a Markdown table
+# rendered from the retrieved rows instead of a call of the LLM, as long as
+# there are not more rows than this. 0 turns this off.
+TABLE_MAX_ROWS = int(os.getenv("TABLE_MAX_ROWS", "500"))
+
+# Rows of the Markdown table per streamed update
+TABLE_ROWS_PER_UPDATE = 20
+
 J2_FILE_PROMPT_HEADLINES = "prompt_for_involved_csv_headlines.j2"
 J2_FILE_PROMPT_FINAL_OUTPUT = "prompt_for_final_output.j2"
+J2_FILE_INSTRUCTIONS_FINAL_OUTPUT = "instructions_for_final_output.j2"
+
+# Environment of the prompt templates, created with the first prompt. It keeps
+# the compiled templates.
+TEMPLATE_ENVIRONMENT = None
+TEMPLATE_ONCE = once.Once("Environment of the prompt templates")
 
 SYSTEM_PROMPT_FOR_FINDING_HEADLINES = """
 You are an helpful assistant in transforming user queries into names of CSV 
@@ -43,36 +154,138 @@ Don't make something up.
 """
 
 
-def chat(message, history):
+def chat(message, history, session_id: Optional[str] = None):
     logging.basicConfig(level=logging.INFO)
 
-    global RACE_RESULTS
+    _ensure_snapshot()
+
+    trace = metrics.Trace()
+    updates = profiler.PROFILER.profile(
+        _chat(message, history, session_id, trace), trace
+    )
+    try:
+        yield from updates
+    finally:
+        trace.finish()
+
+
+def _chat(message, history, session_id: Optional[str], trace: metrics.Trace):
+    # The headline response is streamed. Every complete line starts the name
+    # resolution and the filtering of its column right away, so the retrieval
+    # is ready as soon as the first LLM response ends.
+    if session_id is not None:
+        session_state = session.SESSIONS.get(session_id)
+        criteria_history = session_state.criteria_history
+    else:
+        session_state = None
+        criteria_history = []
 
-    if RACE_RESULTS is None:
-        RACE_RESULTS = _load_results_csv()
+    # Only the last turns are sent verbatim to the LLM, older turns are
+    # replaced by a summary of their search criteria.
+    history, summary = conversation.bound_history(history, criteria_history)
 
-    headlines = _find_csv_headlines(RACE_RESULTS, message, history)
-    if len(headlines) == 0:
-        yield from _create_final_response(message, pd.DataFrame(), {}, history)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        builder = _SearchCriteriaBuilder(
+            RACE_RESULTS, executor, session_state, RACE_PARTITIONS
+        )
+        with trace.stage("headlines"):
+            for lines in _find_csv_headlines(
+                RACE_RESULTS, message, history, summary, trace
+            ):
+                for line in lines:
+                    builder.add(line)
+                builder.flush()
+
+        if builder.redirected or builder.is_empty():
+            headlines_found = False
+        else:
+            headlines_found = True
+            with trace.stage("retrieval"):
+                search_criterias = builder.resolve()
+                rendered = _get_rendered_results(builder, trace)
+            table_only = builder.table_only
+
+    if not headlines_found:
+        if session_state is not None:
+            session_state.remember_no_search()
+
+        yield from _create_final_response(
+            message, _render_results(pd.DataFrame()), {}, history, summary, trace
+        )
 
         return
 
-    search_criterias = _get_search_criterias(RACE_RESULTS, headlines)
     pprint(search_criterias)
 
-    results = _get_filtered_results(RACE_RESULTS, search_criterias)
+    # A plain list of results needs no LLM to be written
+    if (
+        table_only
+        and rendered.row_ids is not None
+        and 0 < rendered.num_of_results <= TABLE_MAX_ROWS
+    ):
+        trace.count("results", rendered.num_of_results)
+        trace.count("table_answers", 1)
+        results = _get_rows(RACE_RESULTS, RACE_PARTITIONS, rendered.row_ids)
+        yield from _stream_results_table(results, trace)
+
+        return
+
+    # Call LLM to get user response
+    yield from _create_final_response(
+        message, rendered, search_criterias, history, summary, trace
+    )
+
+
+def _get_rendered_results(
+    builder: "_SearchCriteriaBuilder", trace: metrics.Trace
+) -> "RenderedResults":
+    """
+    Return the rendered results of the resolved search criteria. Identical
+    criteria of other turns and users are served from the results cache
+    without filtering and rendering again.
+    """
+    key = builder.cache_key()
+
+    rendered = cache.RESULTS_CACHE.get(RACE_RESULTS_VERSION, key)
+    if rendered is not None:
+        logging.info("Results were found in results cache")
+        trace.count("results_cache_hits", 1)
+        builder.remember(rendered.row_ids)
+        return rendered
+
+    if not COALESCE_REQUESTS:
+        return _filter_and_render(builder, key, trace)
+
+    rendered, leader = FLIGHTS.do(
+        ("retrieval", key), lambda: _filter_and_render(builder, key, trace)
+    )
+    if not leader:
+        logging.info("Results were retrieved by an identical request in flight")
+        trace.count("coalesced_retrievals", 1)
+        builder.remember(rendered.row_ids)
+
+    return rendered
+
+
+def _filter_and_render(
+    builder: "_SearchCriteriaBuilder", key, trace: metrics.Trace
+) -> "RenderedResults":
+    results = builder.filter()
     pprint(results)
 
     # If too many results then don't overload LLM
-    max_results = 15000
-    if len(results) > max_results:
+    if len(results) > MAX_RESULTS:
         logging.warning("Too many results were found. This indicates a bad filter.")
-        results = results[:max_results]
+        results = results[:MAX_RESULTS]
         if isinstance(results, pd.Series):
             results = results.to_frame()
 
-    # Call LLM to get user response
-    yield from _create_final_response(message, results, search_criterias, history)
+    with trace.stage("render"):
+        rendered = _render_results(results, builder.is_aggregated())
+
+    cache.RESULTS_CACHE.put(RACE_RESULTS_VERSION, key, rendered)
+
+    return rendered
 
 
 def _get_filtered_results(
@@ -82,17 +295,98 @@ def _get_filtered_results(
     mask = pd.Series(True, index=race_results.index)
 
     for header_name, patterns in search_criterias.items():
-        # Convert to lower case when column contains strings
-        if race_results[header_name].dtype == "object":
-            lower_col_values = race_results[header_name].astype(str).str.lower()
-            lower_patterns = {p.lower() for p in patterns}
+        # Combine different column criterias per logical AND
+        mask &= _get_column_mask(race_results, header_name, patterns)
 
-            # Apply the filter
-            mask &= lower_col_values.isin(lower_patterns)
-        else:
+    return _apply_mask(race_results, mask)
+
+
+def _get_partitioned_results(
+    race_partitions: partitions.PartitionedResults, search_criterias: Dict
+) -> pd.DataFrame:
+    """
+    Filter only the partitions that can contain rows matching the search
+    criteria. The other partitions are neither loaded nor scanned.
+    """
+    selected = race_partitions.prune(search_criterias)
+    logging.info(
+        f"Searching {len(selected)} of {len(race_partitions.entries)} partitions"
+    )
+
+    # All partitions share the categories, so the codes of the matching
+    # categories are looked up only once.
+    matching = {}
+    for header_name, patterns in search_criterias.items():
+        column = race_partitions.template[header_name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            categories = _matching_categories(column, patterns)
+            matching[header_name] = column.cat.categories.get_indexer(categories)
+
+    found = []
+    for partition in selected:
+        rows = race_partitions.load(partition)
+
+        mask = np.ones(len(rows), dtype=bool)
+        for header_name, patterns in search_criterias.items():
             # Combine different column criterias per logical AND
-            mask &= race_results[header_name].isin(patterns)
+            if header_name in matching:
+                codes = rows[header_name].array.codes
+                mask &= np.isin(codes, matching[header_name])
+            else:
+                mask &= _get_column_mask(rows, header_name, patterns).to_numpy()
+
+        if mask.any():
+            found.append(rows[mask])
+
+    if len(found) == 0:
+        return race_partitions.template
+
+    found = pd.concat(found)
+
+    return _apply_mask(found, pd.Series(True, index=found.index))
+
+
+def _get_rows(
+    race_results: pd.DataFrame,
+    race_partitions: Optional[partitions.PartitionedResults],
+    row_ids,
+) -> pd.DataFrame:
+    if race_partitions is not None:
+        return race_partitions.rows(row_ids)
+
+    return race_results.loc[row_ids]
+
+
+def _get_column_mask(
+    race_results: pd.DataFrame, header_name: str, patterns: List
+) -> pd.Series:
+    column = race_results[header_name]
+
+    # Compare strings in lower case
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.isin(_matching_categories(column, patterns))
+    elif column.dtype == "object":
+        lower_col_values = column.astype(str).str.lower()
+        lower_patterns = {p.lower() for p in patterns}
 
+        return lower_col_values.isin(lower_patterns)
+    else:
+        return column.isin(patterns)
+
+
+def _matching_categories(column: pd.Series, patterns: List) -> pd.Index:
+    # Only the few distinct values are compared, not every row
+    lower_patterns = {str(p).lower() for p in patterns}
+    categories = column.cat.categories
+
+    return categories[categories.str.lower().isin(lower_patterns)]
+
+
+def _is_text_column(column: pd.Series) -> bool:
+    return column.dtype == "object" or isinstance(column.dtype, pd.CategoricalDtype)
+
+
+def _apply_mask(race_results: pd.DataFrame, mask: pd.Series) -> pd.DataFrame:
     # Apply the resulting mask to the data frame
     filtered_df = race_results[mask]
     logging.info(f"Filtered search found {len(filtered_df)} results")
@@ -102,7 +396,7 @@ def _get_filtered_results(
 
     # Sort dataframe by year, round, and position
     sorted_df = filtered_df.sort_values(
-        by=["year", "race_date", "class_name", "position"]
+        by=["year", "race_day", "class_name", "position"]
     )
 
     results = sorted_df
@@ -114,46 +408,391 @@ def _get_filtered_results(
 
 
 def _get_search_criterias(race_results: pd.DataFrame, headlines: List[str]) -> Dict:
-    search = {}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        builder = _SearchCriteriaBuilder(race_results, executor)
+        for column in headlines:
+            builder.add(column)
+
+        search_criterias, _ = builder.build()
+
+    return search_criterias
+
+
+class _SearchCriteriaBuilder:
+    """
+    Builds the search criteria and the filter mask from the lines of the
+    headline response while this response is still streamed.
+
+    Driver and track names are collected until flush() is called. Then each
+    vector database is queried once for all collected names in the background.
+    Values of all other columns are filtered immediately.
+
+    With a session state, names resolved in earlier turns are not resolved
+    again, and the filter is evaluated only on the rows of the previous turn
+    as long as the new criteria narrow the previous ones.
+
+    With the SQLite query engine, lines with ranges, comparisons, prefixes and
+    aggregates are collected in a QuerySpec and the whole search is executed
+    by the engine in build().
+
+    With partitioned race results, race_results holds no rows. The filter is
+    then evaluated in filter() only on the partitions that can contain rows
+    matching the resolved search criteria.
+    """
 
-    for column in headlines:
+    def __init__(
+        self,
+        race_results: pd.DataFrame,
+        executor: ThreadPoolExecutor,
+        session_state: Optional[session.SessionState] = None,
+        race_partitions: Optional[partitions.PartitionedResults] = None,
+    ):
+        self.race_results = race_results
+        self.redirected = False
+        self.table_only = False
+
+        self._executor = executor
+        self._session_state = session_state
+        self._search = {}
+        self._masks = {}
+        self._driver_names = []
+        self._track_names = []
+        self._pending = []
+        self._use_engine = query.QUERY_ENGINE == "sqlite"
+        self._spec = query.QuerySpec()
+        self._partitions = race_partitions
+
+        # Filter only the rows found in the previous turn of the session until
+        # it turns out that the new criteria are no refinement.
+        if (
+            not self._use_engine
+            and session_state is not None
+            and session_state.row_ids is not None
+        ):
+            self._candidates = _get_rows(
+                race_results, race_partitions, session_state.row_ids
+            )
+        else:
+            self._candidates = race_results
+
+    def add(self, column: str):
         logging.info(f"search criteria: {column}")
-        if "driver_name:" in column:
+
+        if "REDIRECT_TO_NEXT_LLM" in column:
+            self.redirected = True
+        elif "driver_name:" in column:
             driver = column.split(":")[1].strip()
             logging.info(f"Found driver name: {driver}")
 
-            patterns = drivers.get_drivers(race_results, driver)
-
-            search.setdefault("driver_name", []).extend(patterns)
-            logging.info("We look for driver_name: {}".format(search["driver_name"]))
+            if not self._add_resolved_name("driver_name", driver):
+                self._driver_names.append(driver)
         elif "track_name:" in column:
             track_name = column.split(":")[1].strip()
             logging.info(f"Found track name: {track_name}")
 
-            patterns = tracks.get_tracks(race_results, track_name)
-
-            search.setdefault("track_name", []).extend(patterns)
-            logging.info("We look for track_name: {}".format(search["track_name"]))
+            if not self._add_resolved_name("track_name", track_name):
+                self._track_names.append(track_name)
         else:
             if column.find(":") >= 0:
                 lst = column.split(":")
                 key = lst[0].strip()
                 value = lst[1].strip()
             else:
-                logging.error("unexpected answer from LLM: {column}")
+                logging.error(f"unexpected answer from LLM: {column}")
                 key = column
                 value = ""
 
-            if race_results[key].dtype == "object":
-                search.setdefault(key, []).append(value)
-            else:
-                search.setdefault(key, []).append(pd.to_numeric(value))
+            if key == "format":
+                self.table_only = value.lower() == "table"
+                return
+
+            if self._use_engine and query.is_query_line(key, value):
+                self._add_query_line(key, value)
+                return
+
+            if key not in self.race_results.columns:
+                logging.error(f"LLM answered with unknown column: {column}")
+                return
+
+            if not _is_text_column(self.race_results[key]):
+                try:
+                    value = pd.to_numeric(value)
+                except ValueError:
+                    logging.error(f"LLM answered with invalid value: {column}")
+                    return
+
+            self._add_patterns(key, [value])
+
+    def flush(self):
+        """Start resolving all driver and track names collected so far."""
+        if len(self._driver_names) > 0:
+            future = self._executor.submit(
+                _resolve_names, self.race_results, "driver_name", self._driver_names
+            )
+            self._pending.append(("driver_name", self._driver_names, future))
+            self._driver_names = []
+
+        if len(self._track_names) > 0:
+            future = self._executor.submit(
+                _resolve_names, self.race_results, "track_name", self._track_names
+            )
+            self._pending.append(("track_name", self._track_names, future))
+            self._track_names = []
+
+    def is_empty(self) -> bool:
+        return (
+            len(self._search) == 0
+            and len(self._pending) == 0
+            and len(self._driver_names) == 0
+            and len(self._track_names) == 0
+            and self._spec.is_empty()
+        )
+
+    def is_aggregated(self) -> bool:
+        """Return True if the results are aggregates and no race rows."""
+        return self._use_engine and self._spec.is_aggregated()
+
+    def build(self) -> Tuple[Dict, pd.DataFrame]:
+        """
+        Wait for all name resolutions and return the search criteria together
+        with the filtered race results.
+        """
+        search_criterias = self.resolve()
+
+        return search_criterias, self.filter()
+
+    def resolve(self) -> Dict:
+        """Wait for all name resolutions and return the search criteria."""
+        self.flush()
+
+        for header_name, names, future in self._pending:
+            for name, patterns in zip(names, future.result()):
+                if self._session_state is not None:
+                    self._session_state.resolved_names[(header_name, name)] = patterns
+                self._add_patterns(header_name, patterns)
+            logging.info(
+                "We look for {}: {}".format(header_name, self._search[header_name])
+            )
+        self._pending = []
+
+        return self._search
+
+    def cache_key(self) -> Tuple:
+        """Return the key of the resolved search criteria in the results cache."""
+        if self._use_engine:
+            return cache.canonical_criteria(self._search, self._spec)
+
+        return cache.canonical_criteria(self._search)
+
+    def filter(self) -> pd.DataFrame:
+        """Return the race results found for the resolved search criteria."""
+        if self._use_engine:
+            results = self._execute_query()
+            self.remember(None if self.is_aggregated() else results.index)
+            return results
+
+        if self._candidates is not self.race_results and not (
+            self._session_state.is_refinement(self._search)
+        ):
+            logging.info("Search criteria do not refine the previous search")
+            self._candidates = self.race_results
+            if self._partitions is None:
+                self._masks = {
+                    header_name: _get_column_mask(
+                        self.race_results, header_name, patterns
+                    )
+                    for header_name, patterns in self._search.items()
+                }
+
+        if self._filters_partitions():
+            results = _get_partitioned_results(self._partitions, self._search)
+        else:
+            mask = pd.Series(True, index=self._candidates.index)
+            for column_mask in self._masks.values():
+                # Combine different column criterias per logical AND
+                mask &= column_mask
+
+            results = _apply_mask(self._candidates, mask)
+
+        self.remember(results.index)
+
+        return results
+
+    def remember(self, row_ids):
+        """
+        Keep the search criteria and the rows found for them in the session.
+        Aggregated rows cannot be refined by the next turn, so they are given
+        as None.
+        """
+        if self._session_state is not None:
+            self._session_state.remember(self._search, row_ids)
+
+    def _execute_query(self) -> pd.DataFrame:
+        for header_name, patterns in self._search.items():
+            self._spec.add_values(header_name, patterns)
+
+        race_results = self.race_results
+        if self._partitions is not None:
+            # The SQLite database holds all rows anyway
+            race_results = self._partitions.load_all()
+
+        return query.get_engine(race_results).execute(self._spec)
+
+    def _add_query_line(self, key: str, value: str):
+        columns = self.race_results.columns
+        column = value if key == "group_by" else key
+
+        if key not in ("aggregate", "top") and column not in columns:
+            logging.error(f"LLM answered with unknown column: {key}: {value}")
+            return
+
+        numeric = key in columns and not _is_text_column(self.race_results[key])
+        try:
+            self._spec.add_line(key, value, numeric)
+        except ValueError as e:
+            logging.error(f"LLM answered with invalid query: {key}: {value} ({e})")
+
+    def _add_resolved_name(self, header_name: str, name: str) -> bool:
+        if self._session_state is None:
+            return False
+
+        patterns = self._session_state.resolved_names.get((header_name, name))
+        if patterns is None:
+            return False
+
+        logging.info(f"{name} was already resolved in this session: {patterns}")
+        self._add_patterns(header_name, patterns)
+
+        return True
+
+    def _add_patterns(self, header_name: str, patterns: List):
+        self._search.setdefault(header_name, []).extend(patterns)
+
+        if self._use_engine or self._filters_partitions():
+            return
+
+        # Values of the same column are combined per logical OR
+        column_mask = _get_column_mask(self._candidates, header_name, patterns)
+        if header_name in self._masks:
+            self._masks[header_name] |= column_mask
+        else:
+            self._masks[header_name] = column_mask
+
+    def _filters_partitions(self) -> bool:
+        # Partitions are pruned only when all criteria are known, so the masks
+        # cannot be made while the headline response is streamed.
+        return self._partitions is not None and self._candidates is self.race_results
+
+
+def _resolve_names(
+    race_results: pd.DataFrame, header_name: str, names: List[str]
+) -> List[List[str]]:
+    """
+    Resolve driver or track names with the vector database. Identical lookups
+    in flight at the same time are sent only once.
+    """
+    if header_name == "driver_name":
+        resolve = drivers.get_drivers_batch
+    else:
+        resolve = tracks.get_tracks_batch
+
+    if not COALESCE_REQUESTS:
+        return resolve(race_results, names)
+
+    patterns, _ = FLIGHTS.do(
+        ("names", header_name, tuple(names)), lambda: resolve(race_results, names)
+    )
+
+    return patterns
+
+
+def _coalesced_stream(stage: str, model: str, messages: List, trace: metrics.Trace):
+    """
+    Stream the LLM response to the messages. Identical requests in flight at
+    the same time share one upstream response.
+    """
+    key = (stage, model, json.dumps(messages, sort_keys=True))
+    # The response is streamed by another thread, which is profiled as part
+    # of the chat call that started it.
+    responses, leader = FLIGHTS.stream(
+        key,
+        lambda: profiler.PROFILER.attach(
+            _LLM_chat_completion_stream(model=model, messages=messages, trace=trace),
+            trace,
+        ),
+    )
+    if not leader:
+        logging.info(f"Response of {stage} is shared with an identical request")
+        trace.count(f"coalesced_{stage}", 1)
+
+    return responses
+
 
-    return search
+def _stream_results_table(results: pd.DataFrame, trace: metrics.Trace):
+    """
+    This function is a generator. It yields the growing Markdown table of the
+    results like the LLM yields its growing response.
+    """
+    start = time.perf_counter()
+
+    lines = [
+        f"Here are the {len(results)} race results I found:",
+        "",
+        "| Year | Date | Track | Class | Position | Number | Driver | Bike |",
+        "|------|------|-------|-------|----------|--------|--------|------|",
+    ]
+    trace.mark("first_token")
+    yield "\n".join(lines)
+
+    rows = zip(
+        results["year"],
+        results["race_date"],
+        results["track_name"],
+        results["class_name"],
+        results["position"],
+        results["number"],
+        results["driver_name"],
+        results["mx_bike"],
+    )
+    for i, (year, race_date, track, class_name, pos, num, driver, bike) in enumerate(
+        rows, start=1
+    ):
+        cells = [
+            _table_cell(int(year) if pd.notna(year) else None),
+            _table_cell(race_date),
+            _table_cell(track),
+            _table_cell(class_name),
+            _table_cell(pos),
+            _table_cell(num),
+            _table_cell(driver),
+            _table_cell(bike),
+        ]
+        lines.append(f"| {' | '.join(cells)} |")
+
+        if i % TABLE_ROWS_PER_UPDATE == 0:
+            yield "\n".join(lines)
+
+    lines.append("")
+    lines.append("More details are available at https://americanmotocrossresults.com/")
+    yield "\n".join(lines)
+
+    trace.add_duration("final_response", time.perf_counter() - start)
+
+
+def _table_cell(value) -> str:
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+
+    return str(value).replace("|", "\\|")
 
 
 def _create_final_response(
-    user_query: str, results: pd.DataFrame, search_criterias: Dict, history: List
+    user_query: str,
+    rendered: "RenderedResults",
+    search_criterias: Dict,
+    history: List,
+    summary: str = "",
+    trace: Optional[metrics.Trace] = None,
 ):
     """
     This function uses RAG to give the LLM the necessary details for a proper
@@ -162,44 +801,138 @@ def _create_final_response(
     Take results and insert them into prompt. Then call LLM and return its
     response to the caller.
     """
+    if trace is None:
+        trace = metrics.Trace()
 
-    drivers = search_criterias.get("driver_name")
-    if drivers is None:
-        drivers = []
+    with trace.stage("final_prompt"):
+        messages = _create_final_messages(
+            user_query, rendered, search_criterias, history, summary
+        )
+
+    _dump_llm_conversation(messages)
+
+    trace.count("results", rendered.num_of_results)
+    trace.count(
+        "final_prompt_tokens",
+        sum(metrics.estimate_tokens(msg["content"]) for msg in messages),
+    )
+
+    if COALESCE_ANSWERS:
+        responses = _coalesced_stream(
+            "answers", MODEL_FOR_USER_RESPONSE, messages, trace
+        )
+    else:
+        responses = _LLM_chat_completion_stream(
+            model=MODEL_FOR_USER_RESPONSE, messages=messages, trace=trace
+        )
+
+    start = time.perf_counter()
+    first_token = True
+    with trace.tag("final_response"):
+        for response in responses:
+            if first_token:
+                trace.mark("first_token")
+                first_token = False
+            yield response
+    trace.add_duration("final_response", time.perf_counter() - start)
+
+
+class RenderedResults:
+    """
+    Race results rendered for the prompt of the final LLM call together with
+    the row ids they were rendered from.
+    """
+
+    __slots__ = ("results_txt", "num_of_results", "aggregated", "row_ids")
 
+    def __init__(
+        self, results_txt: str, num_of_results: int, aggregated: bool, row_ids
+    ):
+        self.results_txt = results_txt
+        self.num_of_results = num_of_results
+        self.aggregated = aggregated
+        self.row_ids = row_ids
+
+
+def _render_results(results: pd.DataFrame, aggregated: bool = False) -> RenderedResults:
+    """
+    Render the results for the final prompt. Aggregated results of the query
+    engine with group_by or aggregate are no race rows and are given as table.
+    """
     num_of_results = int(len(results))
 
-    if num_of_results > 0:
+    if aggregated and num_of_results > 0:
+        results_txt = results.to_string(index=False)
+    elif num_of_results > 0:
         lst = []
-        race_results = from_dataframe_to_race_results(results)
 
-        if num_of_results > 1000:
+        max_position = _max_position(num_of_results)
+        if max_position < 50:
             lst.append(
-                f"Since we found {num_of_results} results in the archive, we only give you top 3 positions."
+                f"Since we found {num_of_results} results in the archive, we only give you top {max_position} positions."
             )
 
-            lst.extend([result.as_prompt(only_top3=True) for result in race_results])
-        elif num_of_results > 100:
-            lst.append(
-                f"Since we found {num_of_results} results in the archive, we only give you top 10 positions."
-            )
-
-            lst.extend([result.as_prompt(only_top10=True) for result in race_results])
+        if RESULTS_FORMAT == "compact":
+            lst.append(compact.render_compact_results(results, max_position))
+        elif RACE_PROMPT_BLOCKS is not None:
+            lst.extend(RACE_PROMPT_BLOCKS.render(results, max_position))
         else:
-            lst.extend([result.as_prompt() for result in race_results])
+            race_results = from_dataframe_to_race_results(results)
+            lst.extend(
+                [
+                    result.as_prompt(
+                        only_top10=max_position == 10, only_top3=max_position == 3
+                    )
+                    for result in race_results
+                ]
+            )
 
         results_txt = "\n".join(lst)
     else:
         results_txt = ""
 
-    env = Environment(loader=FileSystemLoader(MODULE_DIR))
+    row_ids = None if aggregated else results.index.to_numpy()
+
+    return RenderedResults(results_txt, num_of_results, aggregated, row_ids)
+
+
+def _max_position(num_of_results: int) -> int:
+    """Return the last position of every race given to the LLM."""
+    if num_of_results > 1000:
+        return 3
+    elif num_of_results > 100:
+        return 10
+
+    return 50
+
+
+def _create_final_messages(
+    user_query: str,
+    rendered: RenderedResults,
+    search_criterias: Dict,
+    history: List,
+    summary: str = "",
+) -> List[Dict]:
+    """
+    Create the messages of the final response. The system prompt and the
+    instructions come first and are the same for every request, so that the
+    upstream can reuse its cache of this prefix. The earlier conversation
+    follows, the results and the user query are in the last message.
+    """
+    drivers = search_criterias.get("driver_name")
+    if drivers is None:
+        drivers = []
+
+    env = _template_environment()
+    instructions = env.get_template(J2_FILE_INSTRUCTIONS_FINAL_OUTPUT).render()
     template = env.get_template(J2_FILE_PROMPT_FINAL_OUTPUT)
     rendered = template.render(
         {
             "user_query": user_query,
             "drivers": drivers,
-            "results_txt": results_txt,
-            "num_of_results": num_of_results,
+            "results_txt": rendered.results_txt,
+            "num_of_results": rendered.num_of_results,
+            "aggregated": rendered.aggregated,
             "today": date.today(),
         }
     )
@@ -207,59 +940,93 @@ def _create_final_response(
     messages = copy.deepcopy(history)
     messages.append({"role": "user", "content": rendered})
 
+    if summary:
+        messages.insert(
+            0,
+            {
+                "role": "system",
+                "content": f"Earlier in this conversation the user searched for:\n{summary}",
+            },
+        )
+
+    messages.insert(0, {"role": "system", "content": instructions})
     messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT_FOR_FINAL_OUTPUT})
 
-    _dump_llm_conversation(messages)
+    return messages
 
-    yield from _LLM_chat_completion_stream(
-        model=MODEL_FOR_USER_RESPONSE, messages=messages
-    )
 
+def _template_environment():
+    def create():
+        global TEMPLATE_ENVIRONMENT
 
-def _find_csv_headlines(
-    race_results: pd.DataFrame, user_query: str, history: List
-) -> List[str]:
-    """
-    This function returns a list of column names of the race result CSV that
-    need to be searched for values contained in the user query.
+        # jinja2 is imported with the first prompt, the server starts faster.
+        from jinja2 import Environment, FileSystemLoader
 
-    For example, the user query
-    "I need all results from 2004 from Jeffrey Herlings."
-    should be answered by the LLM with
-    ```
-    driver_name: Jeffrey Herlings
-    year: 2004
-    ```
-    """
-    sample = (
-        race_results.sample(n=10, random_state=42)
-        .drop(columns=["source"])
-        .to_string(index=False)
-    )
+        TEMPLATE_ENVIRONMENT = Environment(loader=FileSystemLoader(MODULE_DIR))
+
+    TEMPLATE_ONCE.do(lambda: TEMPLATE_ENVIRONMENT is None, create)
+
+    return TEMPLATE_ENVIRONMENT
 
-    track_list = race_results["track_name"].unique().tolist()
 
-    env = Environment(loader=FileSystemLoader(MODULE_DIR))
+def _create_headline_messages(
+    race_results: pd.DataFrame,
+    user_query: str,
+    history: List,
+    summary: str = "",
+) -> List[Dict]:
+    """
+    Create the messages of the headline extraction. All messages but the last
+    are the same for every request, so that the upstream can reuse its cache
+    of this prefix. Everything that depends on the request is in the last one.
+    """
+    headline = HEADLINE_DATA or _headline_data(race_results)
+    if HEADLINE_PROMPT == "full":
+        sample = headline["sample"]
+        schema = None
+        track_list = headline["tracks"]
+        candidate_tracks = []
+    else:
+        sample = None
+        schema = headline["schema"]
+        track_list = ""
+        queries = [msg["content"] for msg in history if msg["role"] == "user"]
+        candidate_tracks = _candidate_tracks(race_results, queries[-1:] + [user_query])
+
+    env = _template_environment()
     template = env.get_template(J2_FILE_PROMPT_HEADLINES)
 
     rendered = template.render(
         {
             "random_sample_from_csv": sample,
-            "history": history,
-            "tracks": "\n".join(track_list),
-            "today": date.today(),
+            "schema": schema,
+            "tracks": track_list,
+            "query_engine": query.QUERY_ENGINE,
         }
     )
 
     messages = _create_user_assistant_chat([rendered], ["OK"])
 
     user_content = []
+    if summary:
+        user_content.append(f"Earlier searches of the user:\n{summary}")
     for msg in history:
         if msg["role"] == "user":
             user_content.append(f"{msg["content"]}")
     previous_user_content = "\n".join(user_content)
 
+    tracks_txt = ""
+    if candidate_tracks:
+        candidates = "\n".join(candidate_tracks)
+        tracks_txt = f"""
+Please take attention to column track_name. These values of this column are
+similar to names in the user query:
+{candidates}
+"""
+
     instruct_llm = f"""
+Today is the {date.today()}.
+{tracks_txt}
 The user gave the following queries in the past:
 {previous_user_content}
 
@@ -277,19 +1044,75 @@ refers to.
         0, {"role": "system", "content": SYSTEM_PROMPT_FOR_FINDING_HEADLINES}
     )
 
+    return messages
+
+
+def _find_csv_headlines(
+    race_results: pd.DataFrame,
+    user_query: str,
+    history: List,
+    summary: str = "",
+    trace: Optional[metrics.Trace] = None,
+) -> Iterator[List[str]]:
+    """
+    This function is a generator. It yields lists of column names of the race
+    result CSV that need to be searched for values contained in the user query
+    as soon as the LLM has completed the corresponding lines of its response.
+    In case the LLM answers with REDIRECT_TO_NEXT_LLM this is yielded as line
+    as well.
+
+    For example, the user query
+    "I need all results from 2004 from Jeffrey Herlings."
+    should be answered by the LLM with
+    ```
+    driver_name: Jeffrey Herlings
+    year: 2004
+    ```
+    """
+    messages = _create_headline_messages(race_results, user_query, history, summary)
+
     _dump_llm_conversation(messages)
 
-    response = _LLM_chat_completion(model=MODEL_FOR_CSV_HEADER, messages=messages)
+    if trace is None:
+        trace = metrics.Trace()
+
+    trace.count(
+        "headline_prompt_tokens",
+        sum(metrics.estimate_tokens(msg["content"]) for msg in messages),
+    )
+
+    # The response is streamed and every complete line is handed to the caller
+    # immediately, so that the retrieval can start before the response ends.
+    if COALESCE_REQUESTS:
+        responses = _coalesced_stream(
+            "headlines", MODEL_FOR_CSV_HEADER, messages, trace
+        )
+    else:
+        responses = _LLM_chat_completion_stream(
+            model=MODEL_FOR_CSV_HEADER, messages=messages, trace=trace
+        )
+
+    response = ""
+    consumed = 0
+    for response in responses:
+        if response is None:
+            break
+
+        end = response.rfind("\n") + 1
+        if end > consumed:
+            yield _get_headline_lines(response[consumed:end])
+            consumed = end
+
     logging.info(response)
 
-    if response is None:
-        return []
-    if response is not None and "REDIRECT_TO_NEXT_LLM" in response:
-        return []
+    if response is not None and consumed < len(response):
+        yield _get_headline_lines(response[consumed:])
+
 
+def _get_headline_lines(text: str) -> List[str]:
     cols = []
-    for line in response.split("\n"):
-        if "```" in line:
+    for line in text.split("\n"):
+        if "```" in line or len(line.strip()) == 0:
             continue
         else:
             cols.append(line)
@@ -297,104 +1120,200 @@ refers to.
     return cols
 
 
-def _load_results_csv() -> pd.DataFrame:
-    return pd.read_csv(RACE_RESULTS_CSV_FILENAME)
+def _headline_data(race_results: pd.DataFrame) -> Dict[str, str]:
+    """
+    Return the data of the CSV file shown in the headline prompt, which is the
+    same for every request.
+    """
+    sample = (
+        race_results.sample(n=10, random_state=42)
+        .drop(columns=["source", "race_day"])
+        .to_string(index=False)
+    )
 
+    return {
+        "schema": _describe_columns(race_results),
+        "sample": sample,
+        "tracks": "\n".join(race_results["track_name"].unique().tolist()),
+    }
 
-def _create_user_assistant_chat(user: List[str], assistant: List[str]) -> List:
-    if len(user) != len(assistant):
-        logging.error(
-            "Cannot create user, assistant chat with arrays not having the same size."
-        )
+
+def _describe_columns(race_results: pd.DataFrame) -> str:
+    """
+    Describe every column of the CSV file data with one line. Columns with few
+    values list all of them, others their range or most frequent values.
+    """
+    lines = []
+    for column, description in COLUMN_DESCRIPTIONS.items():
+        values = race_results[column].dropna()
+        if isinstance(values.dtype, pd.CategoricalDtype) and (
+            len(values.cat.categories) <= 12
+        ):
+            examples = "one of " + "; ".join(map(str, values.cat.categories))
+        elif pd.api.types.is_numeric_dtype(values.dtype):
+            examples = f"{values.min()} to {values.max()}"
+        else:
+            most_frequent = values.value_counts().index[:3]
+            examples = "e.g. " + "; ".join(map(str, most_frequent))
+
+        lines.append(f"{column} ({description}): {examples}")
+
+    return "\n".join(lines)
+
+
+def _build_track_index(race_results: pd.DataFrame) -> names.LocalNameIndex:
+    return names.LocalNameIndex(names.column_names(race_results["track_name"]))
+
+
+def _candidate_tracks(race_results: pd.DataFrame, queries: List[str]) -> List[str]:
+    """
+    Return the tracks whose names are similar to words or pairs of adjacent
+    words of the given queries, the most similar first.
+    """
+    phrases = []
+    for text in queries:
+        words = re.findall(r"[\w'-]+", text)
+        phrases += [word for word in words if len(word) >= 3]
+        for first, second in zip(words, words[1:]):
+            # Pairs also with the words joined, e.g. "Red Bud" for REDBUD
+            phrases += [f"{first} {second}", f"{first}{second}"]
+
+    if len(phrases) == 0 or HEADLINE_CANDIDATE_TRACKS <= 0:
         return []
 
-    messages = []
-    for q, a in zip(user, assistant):
-        messages.append({"role": "user", "content": q})
-        messages.append({"role": "assistant", "content": a})
+    track_index = HEADLINE_TRACK_INDEX
+    if track_index is None:
+        track_index = _build_track_index(race_results)
 
-    return messages
+    nearest_tracks = track_index.query(query_texts=phrases, n_results=2)
 
+    distances = {}
+    for documents, track_distances in zip(
+        nearest_tracks["documents"], nearest_tracks["distances"]
+    ):
+        for track, distance in zip(documents, track_distances):
+            if distance <= HEADLINE_TRACK_MAX_DISTANCE:
+                distances[track] = min(distance, distances.get(track, distance))
 
-def _LLM_chat_completion(model: str, messages: List) -> Optional[str]:
-    if model.startswith("gpt-"):
-        return _OpenAI_chat_completion(model, messages)
-    else:
-        raise ValueError("Other LLMs than gpt-* are not implemented yet")
+    return sorted(distances, key=distances.get)[:HEADLINE_CANDIDATE_TRACKS]
 
 
-def _LLM_chat_completion_stream(model: str, messages: List):
-    if model.startswith("gpt-"):
-        yield from _OpenAI_chat_completion_stream(model, messages)
-    else:
-        raise ValueError("Other LLMs than gpt-* are not implemented yet")
+def _ensure_snapshot():
+    """
+    Load the CSV file data unless it is loaded. Requests that come while it
+    is loaded wait for it instead of loading it again.
+    """
+    SNAPSHOT_ONCE.do(lambda: RACE_RESULTS is None, _load_snapshot)
 
 
-def _OpenAI_chat_completion(model: str, messages: List) -> Optional[str]:
+def _load_snapshot():
     """
-    Call OpenAI API and return complete response.
+    Load the CSV file data together with its version, the prompt text of all
+    races and the data of the headline prompt. With partitions, only their
+    catalog is loaded and the prompt text is rendered per loaded partition.
     """
-    if len(messages) == 0:
-        return None
+    global RACE_RESULTS
+    global RACE_RESULTS_VERSION
+    global RACE_PROMPT_BLOCKS
+    global RACE_PARTITIONS
+    global HEADLINE_DATA
+    global HEADLINE_TRACK_INDEX
+
+    if partitions.PARTITIONS_DIR:
+        race_partitions = partitions.PartitionedResults(partitions.PARTITIONS_DIR)
+        version = race_partitions.version
+        if os.path.exists(RACE_RESULTS_CSV_FILENAME) and (
+            version != _get_dataset_version()
+        ):
+            logging.warning(
+                f"Partitions in {partitions.PARTITIONS_DIR} were not written from the current CSV file"
+            )
+        race_results = race_partitions.template
+        prompt_blocks = race_partitions.prompt_blocks
+        headline = race_partitions.headline
+    else:
+        race_partitions = None
+        version = _get_dataset_version()
+        race_results = _load_results_csv()
+        prompt_blocks = RacePromptBlocks(race_results)
+        headline = _headline_data(race_results)
+    track_index = _build_track_index(race_results)
+
+    RACE_RESULTS_VERSION = version
+    RACE_PROMPT_BLOCKS = prompt_blocks
+    RACE_PARTITIONS = race_partitions
+    HEADLINE_DATA = headline
+    HEADLINE_TRACK_INDEX = track_index
+    # Set last, requests that find it read the other globals without a lock
+    RACE_RESULTS = race_results
 
-    try:
-        response = openai.OpenAI().chat.completions.create(
-            model=model, messages=messages
-        )
-        logging.info(f"OpenAI response: {response}")
 
-        # Validate response structure before accessing elements
-        if not response or not hasattr(response, "choices") or not response.choices:
-            logging.warning("OpenAI response has no choices.")
+def _load_results_csv() -> pd.DataFrame:
+    race_results = pd.read_csv(RACE_RESULTS_CSV_FILENAME, dtype=RACE_RESULTS_DTYPES)
+    race_results["race_day"] = _parse_race_dates(race_results["race_date"])
+    race_results["mx_brand"] = _get_bike_brands(race_results["mx_bike"])
+
+    return race_results
 
-            return None
 
-        content = response.choices[0].message.content
-        return content if content else None
+def _parse_race_dates(race_dates: pd.Series) -> pd.Series:
+    """
+    Parse dates like "MAY 21-22, 2005", "JUNE 30-JULY 1, 2007" or
+    "JUN 13, 2009" into the date of the first day. Only the distinct dates are
+    parsed.
+    """
+    categories = race_dates.cat.categories
+    first_days = categories.str.replace(r"-[A-Z ]*[0-9]+,", ",", regex=True)
+    parsed = pd.to_datetime(first_days, format="%B %d, %Y", errors="coerce")
+    abbreviated = pd.to_datetime(first_days, format="%b %d, %Y", errors="coerce")
+    parsed = parsed.where(parsed.notna(), abbreviated)
 
-    except openai.OpenAIError as e:
-        logging.error(f"OpenAI API error: {e}")
-        return f"Error: OpenAI API failed - {str(e)}"
+    codes = race_dates.cat.codes.to_numpy()
+    race_days = parsed.to_numpy()[codes]
+    race_days[codes < 0] = np.datetime64("NaT", "ns")
 
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
-        return f"Error: Unexpected issue - {str(e)}"
+    return pd.Series(race_days, index=race_dates.index)
 
 
-def _OpenAI_chat_completion_stream(model: str, messages: List):
+def _get_bike_brands(mx_bikes: pd.Series) -> pd.Series:
     """
-    This function is a generator.
-    Call to OpenAI and generate stream of tokens as response.
+    Return the brand of every bike, so that e.g. "YAM YZ450F" and
+    "Yamaha YZ 250F" are both found as Yamaha. Only the distinct bikes are
+    looked at.
     """
+    brands = {bike: get_bike_brand(bike) for bike in mx_bikes.cat.categories}
 
-    if len(messages) == 0:
-        yield None
+    return mx_bikes.map(brands).astype("category")
 
-    # Check whether there is already a system prompt, otherwise set it.
-    if messages[0]["role"] != "system":
-        logging.error("You need to give a system prompt.")
-        sys.exit(1)
 
-    try:
-        response = openai.OpenAI().chat.completions.create(
-            model=model, messages=messages, stream=True
+def _get_dataset_version() -> str:
+    stat = os.stat(RACE_RESULTS_CSV_FILENAME)
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _create_user_assistant_chat(user: List[str], assistant: List[str]) -> List:
+    if len(user) != len(assistant):
+        logging.error(
+            "Cannot create user, assistant chat with arrays not having the same size."
         )
+        return []
 
-        accumulated_response = ""
+    messages = []
+    for q, a in zip(user, assistant):
+        messages.append({"role": "user", "content": q})
+        messages.append({"role": "assistant", "content": a})
 
-        for chunk in response:
-            if chunk.choices and chunk.choices[0].delta.content:
-                token = chunk.choices[0].delta.content
-                accumulated_response += token
-                yield accumulated_response
+    return messages
 
-    except openai.OpenAIError as e:
-        logging.error(f"OpenAI API error: {e}")
-        yield f"Error: OpenAI API failed - {str(e)}"
 
-    except Exception as e:
-        logging.error(f"Unexpected error: {e}")
-        yield f"Error: Unexpected issue - {str(e)}"
+def _LLM_chat_completion(model: str, messages: List) -> Optional[str]:
+    return llm.chat_completion(model, messages)
+
+
+def _LLM_chat_completion_stream(
+    model: str, messages: List, trace: Optional[metrics.Trace] = None
+):
+    yield from llm.chat_completion_stream(model, messages, trace)
 
 
 def _dump_llm_conversation(messages: List[Dict]):
@@ -0,0 +1,151 @@
+import csv
+import io
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Explanation of the format in front of the results
+COMPACT_RESULTS_INTRO = (
+    "Race results. A line with # names track | location | date of an event, "
+    "a line with ## the class of a race at this event. Every row below it is "
+    "position,number,driver,bike of one driver. Keys like D1 and B1 stand for "
+    "the drivers and bikes of the legends."
+)
+
+# Written for values missing in the data
+UNKNOWN = "unknown"
+
+# Shorter values like "HON" take no more tokens than a key and are not given one
+LEGEND_MIN_LENGTH = 8
+
+# Characters of a legend entry besides key and value, i.e. "; " and " = "
+_LEGEND_ENTRY_OVERHEAD = 5
+
+
+def render_compact_results(df: "pd.DataFrame", max_position: int = 50) -> str:
+    """
+    Render race results for the prompt with far fewer tokens than
+    RaceResult.as_prompt. Races of the same track and date share one header,
+    results are rows of comma-separated values without padding, and drivers
+    and bikes that repeat often enough are written as keys of a legend.
+    """
+    sorted_df = df.sort_values(by=["source", "position"])
+    sorted_df = sorted_df[sorted_df["position"] <= max_position]
+
+    # Grouping in plain Python is much faster than grouping the categorical
+    # columns with pandas, which visits all categories for every group.
+    driver_names = [_text(value) for value in sorted_df["driver_name"].tolist()]
+    bikes = [_text(value, "") for value in sorted_df["mx_bike"].tolist()]
+    driver_keys = _legend(driver_names, "D")
+    bike_keys = _legend(bikes, "B")
+
+    # Races by event in the order of their first race
+    events = {}
+    rows = zip(
+        sorted_df["track_name"].tolist(),
+        sorted_df["track_location"].tolist(),
+        sorted_df["race_date"].tolist(),
+        sorted_df["class_name"].tolist(),
+        sorted_df["source"].tolist(),
+        sorted_df["position"].tolist(),
+        sorted_df["number"].tolist(),
+        driver_names,
+        bikes,
+    )
+    for track, location, race_date, class_name, source, pos, num, name, bike in rows:
+        header = f"# {_text(track)} | {_text(location)} | {_text(race_date)}"
+        races = events.setdefault(header, {})
+        race = races.setdefault(source, (f"## {_text(class_name)}", []))
+        race[1].append(
+            (int(pos), int(num), driver_keys.get(name, name), bike_keys.get(bike, bike))
+        )
+
+    lines = [COMPACT_RESULTS_INTRO]
+    if driver_keys:
+        lines.append(_legend_line("Drivers", driver_keys))
+    if bike_keys:
+        lines.append(_legend_line("Bikes", bike_keys))
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    for header, races in events.items():
+        lines.append(header)
+        for class_line, race_rows in races.values():
+            lines.append(class_line)
+            output.seek(0)
+            output.truncate()
+            writer.writerows(race_rows)
+            lines.append(output.getvalue().rstrip("\n"))
+
+    return "\n".join(lines) + "\n"
+
+
+def parse_compact_results(text: str) -> List[Dict]:
+    """
+    Return the results of a text of render_compact_results as one dict per
+    row with the values of the data, which shows that the format loses
+    nothing. Missing values are None.
+    """
+    legend = {}
+    results = []
+    event = None
+    class_name = None
+    for line in text.split("\n")[1:]:
+        if line.startswith("Drivers: ") or line.startswith("Bikes: "):
+            entries = line.split(": ", 1)[1].split("; ")
+            legend.update(entry.split(" = ", 1) for entry in entries)
+        elif line.startswith("## "):
+            class_name = _value(line[3:])
+        elif line.startswith("# "):
+            event = [_value(part) for part in line[2:].split(" | ")]
+        elif line:
+            pos, num, driver_name, bike = next(csv.reader([line]))
+            results.append(
+                {
+                    "track_name": event[0],
+                    "track_location": event[1],
+                    "race_date": event[2],
+                    "class_name": class_name,
+                    "position": int(pos),
+                    "number": int(num),
+                    "driver_name": legend.get(driver_name, driver_name),
+                    "mx_bike": legend.get(bike, bike) or None,
+                }
+            )
+
+    return results
+
+
+def _legend(values: List[str], prefix: str) -> Dict[str, str]:
+    """
+    Return the keys of the values that take fewer characters with a legend
+    entry and a key in every row than written out in every row.
+    """
+    legend = {}
+    for value, count in Counter(values).items():
+        if len(value) < LEGEND_MIN_LENGTH:
+            continue
+
+        key = f"{prefix}{len(legend) + 1}"
+        with_legend = len(value) + len(key) + _LEGEND_ENTRY_OVERHEAD + count * len(key)
+        if with_legend < count * len(value):
+            legend[value] = key
+
+    return legend
+
+
+def _legend_line(title: str, legend: Dict[str, str]) -> str:
+    return f"{title}: " + "; ".join(f"{key} = {value}" for value, key in legend.items())
+
+
+def _text(value, missing: str = UNKNOWN) -> str:
+    if value is None or value != value:
+        return missing
+
+    return str(value)
+
+
+def _value(text: str):
+    return None if text == UNKNOWN else text
@@ -0,0 +1,86 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+# Number of most recent turns of the conversation that are sent verbatim to
+# the LLM. Older turns are replaced by a compact summary.
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "3"))
+
+# Upper bound of entries in the summary of older turns
+SUMMARY_MAX_ITEMS = 10
+
+# Older user queries are shortened to this length when no search criteria are
+# known for them.
+SUMMARY_MAX_QUERY_LENGTH = 100
+
+
+def bound_history(
+    history: List[Dict],
+    criteria_history: List[Dict],
+    max_turns: Optional[int] = None,
+) -> Tuple[List[Dict], str]:
+    """
+    Return the last max_turns turns of the history together with a summary of
+    all older turns. A turn starts with a user message and contains all
+    following assistant messages, which carry the bulky result tables.
+
+    criteria_history holds the search criteria of every previous turn in
+    order. The summary lists the criteria of the dropped turns. Without them
+    it lists the dropped user queries.
+    """
+    if max_turns is None:
+        max_turns = HISTORY_MAX_TURNS
+
+    turn_starts = [i for i, msg in enumerate(history) if msg["role"] == "user"]
+
+    if len(turn_starts) <= max_turns:
+        older = []
+        recent = history
+    elif max_turns == 0:
+        older = history
+        recent = []
+    else:
+        split = turn_starts[-max_turns]
+        older = history[:split]
+        recent = history[split:]
+
+    # Only role and content are sent to the LLM.
+    recent = [{"role": msg["role"], "content": msg["content"]} for msg in recent]
+
+    if len(older) == 0:
+        return recent, ""
+
+    # The last entries of the criteria history belong to the last turns.
+    dropped_turns = len(turn_starts) - max_turns
+    offset = len(criteria_history) - len(turn_starts)
+    dropped_criteria = [
+        criteria_history[offset + i] for i in range(dropped_turns) if offset + i >= 0
+    ]
+
+    return recent, _summarize(older, dropped_criteria)
+
+
+def _summarize(older: List[Dict], dropped_criteria: List[Dict]) -> str:
+    items = []
+
+    for search_criterias in dropped_criteria:
+        if not search_criterias:
+            continue
+
+        item = ", ".join(
+            f"{header_name}: {' or '.join(str(p) for p in patterns)}"
+            for header_name, patterns in search_criterias.items()
+        )
+        if item not in items:
+            items.append(item)
+
+    if len(items) == 0:
+        for msg in older:
+            if msg["role"] != "user" or not isinstance(msg["content"], str):
+                continue
+
+            query = " ".join(msg["content"].split())
+            if len(query) > SUMMARY_MAX_QUERY_LENGTH:
+                query = query[:SUMMARY_MAX_QUERY_LENGTH] + " ..."
+            items.append(query)
+
+    return "\n".join(f"- {item}" for item in items[-SUMMARY_MAX_ITEMS:])
@@ -1,27 +1,45 @@
-import chromadb
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
 import sys
 import os
 import pandas as pd
 from typing import List
 import logging
 
+from . import names
+from . import once
+
 # Global vector database for driver names
 DRIVERS_VEC_DB = None
 
+# Loads the vector database once for all requests
+_DB_ONCE = once.Once("Vector database with drivers")
+
 # Storage path for persistence
 DRIVERS_DB_PATH = "./chroma_db_drivers"
 
 
 def get_drivers(race_results: pd.DataFrame, driver: str) -> List[str]:
+    return get_drivers_batch(race_results, [driver])[0]
+
+
+def get_drivers_batch(
+    race_results: pd.DataFrame, driver_names: List[str]
+) -> List[List[str]]:
+    """
+    Resolve several driver names with one query to the vector database. The
+    query texts are embedded together, so the latency does not grow with the
+    number of names. The result contains one list of drivers per given name.
+    """
     global DRIVERS_VEC_DB
 
+    if len(driver_names) == 0:
+        return []
+
     _init_db(race_results)
 
     if DRIVERS_VEC_DB is None:
-        return []
+        return [[] for _ in driver_names]
 
-    nearest_drivers = DRIVERS_VEC_DB.query(query_texts=[driver], n_results=5)
+    nearest_drivers = DRIVERS_VEC_DB.query(query_texts=driver_names, n_results=5)
 
     # Check that response is as expected
     if (
@@ -29,22 +47,33 @@ def get_drivers(race_results: pd.DataFrame, driver: str) -> List[str]:
         or not isinstance(nearest_drivers, dict)
         or nearest_drivers.get("documents") is None
         or nearest_drivers.get("distances") is None
+        or len(nearest_drivers["documents"]) != len(driver_names)
     ):
         logging.error(
-            f"Query to driver vector database for driver '{driver}' had an unexpected result: {nearest_drivers}"
+            f"Query to driver vector database for drivers {driver_names} had an unexpected result: {nearest_drivers}"
         )
-        return []
+        return [[] for _ in driver_names]
 
     assert nearest_drivers is not None
     assert nearest_drivers["documents"] is not None
     assert nearest_drivers["distances"] is not None
 
-    logging.info(f"{nearest_drivers["documents"][0]}")
-    logging.info(f"{nearest_drivers["distances"][0]}")
+    result = []
+    for documents, distances in zip(
+        nearest_drivers["documents"], nearest_drivers["distances"]
+    ):
+        logging.info(f"{documents}")
+        logging.info(f"{distances}")
+
+        result.append(_select_drivers(documents, distances))
 
+    return result
+
+
+def _select_drivers(documents: List[str], distances: List[float]) -> List[str]:
     drivers = []
-    for index, dist in enumerate(nearest_drivers["distances"][0]):
-        d = nearest_drivers["documents"][0][index]
+    for index, dist in enumerate(distances):
+        d = documents[index]
         # If we have exact match then take this driver and return
         if dist <= 0.1:
             # Just take current driver and end search.
@@ -57,13 +86,20 @@ def get_drivers(race_results: pd.DataFrame, driver: str) -> List[str]:
 
 
 def _init_db(race_results: pd.DataFrame):
-    """Initializes the vector database and persists it to disk."""
+    _DB_ONCE.do(lambda: DRIVERS_VEC_DB is None, lambda: _load_db(race_results))
+
+
+def _load_db(race_results: pd.DataFrame):
+    """Loads the vector database that was persisted to disk by build_index."""
 
     global DRIVERS_VEC_DB
     global DRIVERS_DB_PATH
 
-    if DRIVERS_VEC_DB is not None:
-        logging.info("Vector database with drivers was already initialized.")
+    if names.NAME_INDEX_BACKEND == "local":
+        logging.info("Initialization of local drivers name index ...")
+        DRIVERS_VEC_DB = names.LocalNameIndex(
+            names.column_names(race_results["driver_name"])
+        )
         return
 
     logging.info("Initialization of drivers vector database ...")
@@ -75,6 +111,10 @@ def _init_db(race_results: pd.DataFrame):
         )
         raise ValueError("OPENAI_API_KEY is not set")
 
+    # chromadb is imported only if the backend is used, it is slow to import.
+    import chromadb
+    from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
     embedding_function = OpenAIEmbeddingFunction(
         api_key=api_key, model_name="text-embedding-3-small"
     )
@@ -83,24 +123,22 @@ def _init_db(race_results: pd.DataFrame):
 
     collection_name = "drivers"
 
-    # Check if the collection already exists
-    if collection_name in chroma_client.list_collections():
-        logging.info("Loading existing vector database from disk ...")
-        DRIVERS_VEC_DB = chroma_client.get_collection(
-            name=collection_name, embedding_function=embedding_function
-        )
-    else:
-        logging.info("Creating new vector database from scratch ...")
-        collection = chroma_client.create_collection(
-            name=collection_name, embedding_function=embedding_function
+    # The vector database is built offline, see module build_index
+    if collection_name not in chroma_client.list_collections():
+        logging.error(
+            f"Vector database with drivers is missing in {DRIVERS_DB_PATH}. Build it with python -m americanmotocrossresults.build_index"
         )
+        raise ValueError("Vector database with drivers is missing")
 
-        drivers = race_results["driver_name"].unique().tolist()
+    logging.info("Loading existing vector database from disk ...")
+    collection = chroma_client.get_collection(
+        name=collection_name, embedding_function=embedding_function
+    )
 
-        collection.add(
-            documents=drivers,
-            ids=[str(i) for i in range(0, len(drivers))],
+    num_of_names = len(names.column_names(race_results["driver_name"]))
+    if collection.count() < num_of_names:
+        logging.warning(
+            f"Vector database with drivers contains {collection.count()} of {num_of_names} names. Resume its build with python -m americanmotocrossresults.build_index"
         )
-        logging.info("done")
 
-        DRIVERS_VEC_DB = collection
+    DRIVERS_VEC_DB = collection
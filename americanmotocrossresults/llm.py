@@ -0,0 +1,486 @@
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from . import admission
+from . import metrics
+from . import once
+
+# openai is slow to import, so it is imported when an OpenAI backend is used
+# first.
+if TYPE_CHECKING:
+    import openai
+
+# Registry of LLM backends by name. A model is given either as plain OpenAI
+# model name such as "gpt-4o-mini" or as "<backend>:<model>", e.g.
+# "vllm:meta-llama/Llama-3.1-8B-Instruct" or "fake:headlines".
+BACKENDS = {}
+
+DEFAULT_BACKEND = "openai"
+
+# Attempts of a request that the upstream rejects with 429
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+
+
+class OpenAIBackend:
+    """
+    Backend for the OpenAI API and for every server that provides an
+    OpenAI-compatible API, e.g. vLLM or the llama.cpp server.
+    """
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._client = None
+        self._client_once = once.Once("OpenAI client")
+
+    def client(self) -> "openai.OpenAI":
+        # The client keeps a connection pool, so it is created only once.
+        self._client_once.do(lambda: self._client is None, self._create_client)
+
+        return self._client
+
+    def _create_client(self):
+        import openai
+
+        if self.base_url is None:
+            self._client = openai.OpenAI()
+        else:
+            # Local servers usually do not check the API key but the client
+            # requires one.
+            self._client = openai.OpenAI(
+                base_url=self.base_url, api_key=self.api_key or "EMPTY"
+            )
+
+    def chat_completion(
+        self, model: str, messages: List, on_usage: Optional[Callable] = None
+    ) -> Optional[str]:
+        """
+        Call OpenAI API and return complete response.
+        """
+        if len(messages) == 0:
+            return None
+
+        import openai
+
+        try:
+            response = self.client().chat.completions.create(
+                model=model, messages=messages
+            )
+            logging.info(f"OpenAI response: {response}")
+
+            if on_usage is not None and getattr(response, "usage", None):
+                on_usage(*_prompt_usage(response.usage))
+
+            # Validate response structure before accessing elements
+            if not response or not hasattr(response, "choices") or not response.choices:
+                logging.warning("OpenAI response has no choices.")
+
+                return None
+
+            content = response.choices[0].message.content
+            return content if content else None
+
+        except openai.RateLimitError as e:
+            raise admission.RateLimitedError(str(e), _retry_after(e)) from e
+
+        except openai.OpenAIError as e:
+            logging.error(f"OpenAI API error: {e}")
+            return f"Error: OpenAI API failed - {str(e)}"
+
+        except Exception as e:
+            logging.error(f"Unexpected error: {e}")
+            return f"Error: Unexpected issue - {str(e)}"
+
+    def chat_completion_stream(
+        self, model: str, messages: List, on_usage: Optional[Callable] = None
+    ):
+        """
+        This function is a generator.
+        Call to OpenAI and generate stream of tokens as response. The usage of
+        the request is sent with the last chunk and handed to on_usage.
+        """
+
+        if len(messages) == 0:
+            yield None
+
+        # Check whether there is already a system prompt, otherwise set it.
+        if messages[0]["role"] != "system":
+            logging.error("You need to give a system prompt.")
+            sys.exit(1)
+
+        import openai
+
+        try:
+            response = self.client().chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+
+            accumulated_response = ""
+
+            for chunk in response:
+                if on_usage is not None and getattr(chunk, "usage", None):
+                    on_usage(*_prompt_usage(chunk.usage))
+
+                if chunk.choices and chunk.choices[0].delta.content:
+                    token = chunk.choices[0].delta.content
+                    accumulated_response += token
+                    yield accumulated_response
+
+        except openai.RateLimitError as e:
+            raise admission.RateLimitedError(str(e), _retry_after(e)) from e
+
+        except openai.OpenAIError as e:
+            logging.error(f"OpenAI API error: {e}")
+            yield f"Error: OpenAI API failed - {str(e)}"
+
+        except Exception as e:
+            logging.error(f"Unexpected error: {e}")
+            yield f"Error: Unexpected issue - {str(e)}"
+
+    def embeddings(self, model: str, texts: List[str]) -> List[List[float]]:
+        """
+        Call the embeddings API and return the embedding of every text in the
+        order of the texts. Errors other than 429 are raised as they are.
+        """
+        import openai
+
+        try:
+            response = self.client().embeddings.create(model=model, input=texts)
+        except openai.RateLimitError as e:
+            raise admission.RateLimitedError(str(e), _retry_after(e)) from e
+
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+
+class FakeBackend:
+    """
+    Deterministic backend that replays recorded responses without any network
+    access. It is meant for load tests and benchmarks.
+
+    Each recording is a dict with the key "response" and the optional keys
+    "model" and "match". Of all recordings whose model equals the requested
+    model and whose match is contained in the last user message, the one
+    matching last in the message is replayed. A recording without match is
+    replayed if no other one matches.
+    The latency is the time until the first token, the token rate the pace of
+    all following tokens. With a prompt token rate, the time to process the
+    prompt is added to the latency. With a minimum of cached tokens, prompts
+    are cached like by the OpenAI API: the longest prefix of at least this many
+    tokens in steps of 128 tokens that was sent before is not processed again.
+    With a concurrency limit, requests beyond this limit are rejected like by
+    an upstream answering with 429.
+    """
+
+    def __init__(
+        self,
+        recordings: List[Dict],
+        default_response: str = "REDIRECT_TO_NEXT_LLM",
+        latency: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        concurrency_limit: Optional[int] = None,
+        prompt_tokens_per_second: Optional[float] = None,
+        prompt_cache_min_tokens: Optional[int] = None,
+    ):
+        self.recordings = recordings
+        self.default_response = default_response
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.concurrency_limit = concurrency_limit
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.prompt_cache_min_tokens = prompt_cache_min_tokens
+
+        self._active = 0
+        self._lock = threading.Lock()
+        self._cached_prefixes = set()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "FakeBackend":
+        with open(path, "r") as file:
+            recordings = json.load(file)
+
+        return cls(recordings, **kwargs)
+
+    def chat_completion(
+        self, model: str, messages: List, on_usage: Optional[Callable] = None
+    ) -> Optional[str]:
+        response = None
+        for response in self.chat_completion_stream(model, messages, on_usage):
+            pass
+
+        return response
+
+    def chat_completion_stream(
+        self, model: str, messages: List, on_usage: Optional[Callable] = None
+    ):
+        if len(messages) == 0:
+            yield None
+            return
+
+        response = self._find_response(model, messages)
+
+        with self._lock:
+            if self.concurrency_limit and self._active >= self.concurrency_limit:
+                raise admission.RateLimitedError("Fake backend is overloaded")
+            self._active += 1
+
+        try:
+            prompt_tokens = sum(
+                metrics.estimate_tokens(msg["content"]) for msg in messages
+            )
+            cached_tokens = self._cache_prompt(messages)
+
+            latency = self.latency
+            if self.prompt_tokens_per_second:
+                latency += (
+                    prompt_tokens - cached_tokens
+                ) / self.prompt_tokens_per_second
+            time.sleep(latency)
+
+            if on_usage is not None:
+                on_usage(prompt_tokens, cached_tokens)
+
+            accumulated_response = ""
+            for token in _split_into_tokens(response):
+                if self.tokens_per_second:
+                    time.sleep(1.0 / self.tokens_per_second)
+                accumulated_response += token
+                yield accumulated_response
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    def _cache_prompt(self, messages: List) -> int:
+        """Cache the prompt and return its tokens cached before."""
+        if self.prompt_cache_min_tokens is None:
+            return 0
+
+        prompt = "".join(f"{msg["role"]}\n{msg["content"]}\n" for msg in messages)
+
+        # Prefixes in steps of 128 tokens of four characters
+        step = 128 * 4
+        prefixes = [hash(prompt[:end]) for end in range(step, len(prompt) + 1, step)]
+
+        with self._lock:
+            cached = 0
+            for i, prefix in enumerate(prefixes):
+                if prefix not in self._cached_prefixes:
+                    break
+                cached = (i + 1) * 128
+            self._cached_prefixes.update(prefixes)
+
+        return cached if cached >= self.prompt_cache_min_tokens else 0
+
+    def _find_response(self, model: str, messages: List) -> str:
+        user_content = ""
+        for msg in messages:
+            if msg["role"] == "user":
+                user_content = msg["content"]
+
+        # The match found last in the message wins, because the current user
+        # query follows the previous ones.
+        response = self.default_response
+        best_position = None
+        for recording in self.recordings:
+            if recording.get("model", model) != model:
+                continue
+
+            match = recording.get("match")
+            position = user_content.rfind(match) if match else -1
+            if match and position < 0:
+                continue
+
+            if best_position is None or position > best_position:
+                response = recording["response"]
+                best_position = position
+
+        return response
+
+
+def _split_into_tokens(text: str) -> List[str]:
+    # Words with their trailing whitespace come close enough to real tokens.
+    return re.findall(r"\s*\S+\s*", text) or [text]
+
+
+def register_backend(name: str, backend):
+    BACKENDS[name] = backend
+
+
+def get_backend(model: str) -> Tuple[object, str]:
+    """
+    Return the backend for the given model together with the model name the
+    backend expects.
+    """
+    name, separator, model_name = model.partition(":")
+    if separator and name in BACKENDS:
+        return BACKENDS[name], model_name
+
+    if model.startswith("gpt-"):
+        return BACKENDS[DEFAULT_BACKEND], model
+
+    raise ValueError(f"No LLM backend is registered for model {model}")
+
+
+def chat_completion(model: str, messages: List) -> Optional[str]:
+    backend, model_name = get_backend(model)
+    controller = admission.get_controller(model)
+
+    def on_usage(prompt_tokens: int, cached_tokens: int):
+        _record_usage(model, prompt_tokens, cached_tokens)
+
+    error = None
+    for _ in range(LLM_MAX_ATTEMPTS):
+        try:
+            with controller.admit():
+                response = backend.chat_completion(model_name, messages, on_usage)
+            controller.succeeded()
+            return response
+        except admission.AdmissionTimeout as e:
+            logging.error(f"LLM request for {model} was not admitted: {e}")
+            return f"Error: Too many requests - {str(e)}"
+        except admission.RateLimitedError as e:
+            controller.rate_limited(e.retry_after)
+            error = e
+
+    logging.error(f"LLM rate limit error: {error}")
+    return f"Error: OpenAI API failed - {str(error)}"
+
+
+def chat_completion_stream(
+    model: str, messages: List, trace: Optional[metrics.Trace] = None
+):
+    """
+    This function is a generator. The request waits for admission by the
+    controller of the model and is sent again after a backoff if the upstream
+    rejects it with 429. The time waited for admission is recorded as stage
+    "llm_queue" of the trace, the prompt tokens and the prompt tokens the
+    upstream had cached as its counters.
+    """
+    backend, model_name = get_backend(model)
+    controller = admission.get_controller(model)
+
+    def on_usage(prompt_tokens: int, cached_tokens: int):
+        _record_usage(model, prompt_tokens, cached_tokens, trace)
+
+    error = None
+    for _ in range(LLM_MAX_ATTEMPTS):
+        try:
+            with controller.admit() as waited:
+                if trace is not None:
+                    trace.add_duration("llm_queue", waited)
+                yield from backend.chat_completion_stream(
+                    model_name, messages, on_usage
+                )
+            controller.succeeded()
+            return
+        except admission.AdmissionTimeout as e:
+            logging.error(f"LLM request for {model} was not admitted: {e}")
+            yield f"Error: Too many requests - {str(e)}"
+            return
+        except admission.RateLimitedError as e:
+            controller.rate_limited(e.retry_after)
+            if trace is not None:
+                trace.count("llm_rate_limited", 1)
+            error = e
+
+    logging.error(f"LLM rate limit error: {error}")
+    yield f"Error: OpenAI API failed - {str(error)}"
+
+
+def _record_usage(
+    model: str,
+    prompt_tokens: int,
+    cached_tokens: int,
+    trace: Optional[metrics.Trace] = None,
+):
+    logging.info(f"LLM {model} prompt tokens: {prompt_tokens}, cached: {cached_tokens}")
+
+    if trace is not None:
+        trace.count("llm_prompt_tokens", prompt_tokens)
+        trace.count("llm_cached_tokens", cached_tokens)
+
+
+def _prompt_usage(usage) -> Tuple[int, int]:
+    """Return the prompt tokens and the cached prompt tokens of the usage."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", None) or 0
+
+    return usage.prompt_tokens or 0, cached_tokens
+
+
+def _retry_after(error: "openai.APIStatusError") -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _register_backends_from_env():
+    """
+    Register the backends configured per environment variables:
+
+    LLM_BACKENDS="vllm=http://localhost:8000/v1,llamacpp=http://localhost:8080/v1"
+    registers OpenAI-compatible servers by name. The API key of a server is read
+    from <NAME>_API_KEY, e.g. VLLM_API_KEY.
+
+    FAKE_LLM_RECORDINGS=recordings.json registers the fake backend with name
+    "fake". FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SECOND and
+    FAKE_LLM_PROMPT_TOKENS_PER_SECOND configure its pace,
+    FAKE_LLM_PROMPT_CACHE_MIN_TOKENS its prompt cache,
+    FAKE_LLM_CONCURRENCY_LIMIT the concurrent requests it accepts.
+    """
+    register_backend(DEFAULT_BACKEND, OpenAIBackend())
+
+    for entry in os.getenv("LLM_BACKENDS", "").split(","):
+        if entry.strip() == "":
+            continue
+
+        name, separator, base_url = entry.partition("=")
+        if not separator:
+            logging.error(f"LLM backend '{entry}' is not given as <name>=<url>")
+            continue
+
+        name = name.strip()
+        api_key = os.getenv(f"{name.upper()}_API_KEY")
+        register_backend(
+            name, OpenAIBackend(base_url=base_url.strip(), api_key=api_key)
+        )
+
+    recordings = os.getenv("FAKE_LLM_RECORDINGS")
+    if recordings:
+        tokens_per_second = os.getenv("FAKE_LLM_TOKENS_PER_SECOND")
+        concurrency_limit = os.getenv("FAKE_LLM_CONCURRENCY_LIMIT")
+        prompt_tokens_per_second = os.getenv("FAKE_LLM_PROMPT_TOKENS_PER_SECOND")
+        prompt_cache_min_tokens = os.getenv("FAKE_LLM_PROMPT_CACHE_MIN_TOKENS")
+        register_backend(
+            "fake",
+            FakeBackend.from_file(
+                recordings,
+                latency=float(os.getenv("FAKE_LLM_LATENCY", "0")),
+                tokens_per_second=(
+                    float(tokens_per_second) if tokens_per_second else None
+                ),
+                concurrency_limit=(
+                    int(concurrency_limit) if concurrency_limit else None
+                ),
+                prompt_tokens_per_second=(
+                    float(prompt_tokens_per_second)
+                    if prompt_tokens_per_second
+                    else None
+                ),
+                prompt_cache_min_tokens=(
+                    int(prompt_cache_min_tokens) if prompt_cache_min_tokens else None
+                ),
+            ),
+        )
+
+
+_register_backends_from_env()
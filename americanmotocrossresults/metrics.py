@@ -0,0 +1,71 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+# Functions that are called with the trace of every finished chat call, e.g.
+# by the benchmark suite to collect latencies per stage.
+TRACE_HANDLERS: List[Callable[["Trace"], None]] = []
+
+
+class Trace:
+    """
+    Durations of the pipeline stages and counters of one chat call.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+
+        # Names of the pipeline steps running at the moment, the innermost
+        # last. The profiler tags its samples with them.
+        self.running: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            with self.tag(name):
+                yield
+        finally:
+            self.add_duration(name, time.perf_counter() - start)
+
+    @contextmanager
+    def tag(self, name: str):
+        """
+        Mark the code running in this block as pipeline step without recording
+        its duration, e.g. for steps that yield to the caller.
+        """
+        self.running.append(name)
+        try:
+            yield
+        finally:
+            self.running.pop()
+
+    def add_duration(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def mark(self, name: str):
+        """Record the time elapsed since the start of the chat call."""
+        self.stages[name] = time.perf_counter() - self.started
+
+    def count(self, name: str, value: int):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        self.mark("total")
+
+        stages = ", ".join(
+            f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.stages.items()
+        )
+        logging.info(f"Pipeline stages: {stages}, counters: {self.counters}")
+
+        for handler in TRACE_HANDLERS:
+            handler(self)
+
+
+def estimate_tokens(text: str) -> int:
+    # English text has about four characters per token with the OpenAI
+    # tokenizers. This is good enough to compare prompt sizes.
+    return (len(text) + 3) // 4
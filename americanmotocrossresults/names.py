@@ -0,0 +1,77 @@
+import os
+import zlib
+import numpy as np
+from typing import Dict, List
+
+# Backend for the lookup of driver and track names. "chroma" uses the persisted
+# vector databases with OpenAI embeddings, "local" uses LocalNameIndex which
+# needs neither network access nor an API key.
+NAME_INDEX_BACKEND = os.getenv("NAME_INDEX_BACKEND", "chroma")
+
+_DIMENSIONS = 1024
+
+
+class LocalNameIndex:
+    """
+    In-process index of names that can stand in for a Chroma collection.
+
+    Names are embedded as hashed character trigrams instead of calling an
+    embedding API. query() answers like a Chroma collection with the squared L2
+    distance of the normalized vectors, so the distance thresholds used for
+    the vector databases keep their meaning.
+    """
+
+    def __init__(self, names: List[str]):
+        self.names = list(names)
+
+        if len(self.names) > 0:
+            self._vectors = np.vstack([_embed(name) for name in self.names])
+        else:
+            self._vectors = np.zeros((0, _DIMENSIONS), dtype=np.float32)
+
+    def query(self, query_texts: List[str], n_results: int = 10) -> Dict:
+        n = min(n_results, len(self.names))
+        if len(query_texts) == 0 or n == 0:
+            return {
+                "documents": [[] for _ in query_texts],
+                "distances": [[] for _ in query_texts],
+            }
+
+        queries = np.vstack([_embed(text) for text in query_texts])
+        similarities = queries @ self._vectors.T
+
+        documents = []
+        distances = []
+        for row in similarities:
+            nearest = np.argsort(-row, kind="stable")[:n]
+            documents.append([self.names[i] for i in nearest])
+            distances.append([float(2.0 - 2.0 * row[i]) for i in nearest])
+
+        return {"documents": documents, "distances": distances}
+
+
+def column_names(column) -> List[str]:
+    """
+    Return the distinct names of a column of the race results. Categorical
+    columns give their categories, which are known even if no row of the race
+    results is loaded.
+    """
+    if hasattr(column, "cat"):
+        return [str(name) for name in column.cat.categories]
+
+    return column.dropna().unique().tolist()
+
+
+def _embed(text: str) -> np.ndarray:
+    vector = np.zeros(_DIMENSIONS, dtype=np.float32)
+
+    padded = f"  {text.lower().strip()} "
+    for i in range(len(padded) - 2):
+        trigram = padded[i : i + 3].encode()
+        vector[zlib.crc32(trigram) % _DIMENSIONS] += 1.0
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+
+    return vector
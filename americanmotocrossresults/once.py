@@ -0,0 +1,39 @@
+import logging
+import threading
+from typing import Callable
+
+
+class Once:
+    """
+    Lazy initialization that runs once although many threads need it at the
+    same time, e.g. the first requests of a burst after the start of the
+    server. The first caller runs the initialization, callers arriving while
+    it runs wait for it instead of running it again. If it raises, the error
+    is raised to its caller and the next caller runs it again.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+
+        self._lock = threading.Lock()
+
+    def do(self, needed: Callable[[], bool], initialize: Callable[[], None]) -> bool:
+        """
+        Run initialize if needed returns True and return whether this caller
+        ran it. needed must turn False once initialize has finished, e.g. by
+        checking the global initialize sets last.
+        """
+        # Initialized values are read without the lock
+        if not needed():
+            return False
+
+        with self._lock:
+            if not needed():
+                logging.info(f"{self.name} was initialized by another request")
+                return False
+
+            initialize()
+            self.runs += 1
+
+        return True
@@ -0,0 +1,216 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+from . import RacePromptBlocks
+
+# Directory with the race results written as partitions by year and class, see
+# main(). Without it, the whole CSV file is loaded into memory.
+PARTITIONS_DIR = os.getenv("RACE_RESULTS_PARTITIONS_DIR", "")
+
+CATALOG_FILENAME = "catalog.json"
+
+# Empty data frame with the columns and categories of all partitions
+TEMPLATE_FILENAME = "template.pkl"
+
+# Number of the partition of every row id
+ROW_PARTITIONS_FILENAME = "row_partitions.npy"
+
+PARTITION_COLUMNS = ["year", "class_name"]
+
+
+def write_partitions(
+    race_results: pd.DataFrame, directory: str, version: str, headline: Dict
+):
+    """
+    Write the race results as one file per year and class together with the
+    catalog of these partitions. All rows of a race have the same year and
+    class, so every race is in one partition. Categorical columns are stored
+    as codes of the categories of the template, which all partitions share.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    categorical = [
+        column
+        for column in race_results.columns
+        if isinstance(race_results[column].dtype, pd.CategoricalDtype)
+    ]
+
+    row_partitions = np.full(race_results.index.max() + 1, -1, dtype=np.int16)
+    entries = []
+    groups = race_results.groupby(
+        PARTITION_COLUMNS, sort=True, observed=True, dropna=False
+    )
+    for i, ((year, class_name), rows) in enumerate(groups):
+        filename = f"part-{i:04d}.pkl"
+
+        stored = rows.copy()
+        for column in categorical:
+            stored[column] = stored[column].cat.codes
+        stored.to_pickle(os.path.join(directory, filename))
+
+        row_partitions[rows.index.to_numpy()] = i
+        entries.append(
+            {
+                "file": filename,
+                "year": None if pd.isna(year) else int(year),
+                "class_name": None if pd.isna(class_name) else str(class_name),
+                "rows": len(rows),
+                "tracks": sorted(rows["track_name"].dropna().unique().astype(str)),
+            }
+        )
+
+    race_results.head(0).to_pickle(os.path.join(directory, TEMPLATE_FILENAME))
+    np.save(os.path.join(directory, ROW_PARTITIONS_FILENAME), row_partitions)
+
+    catalog = {
+        "version": version,
+        "categorical": categorical,
+        "headline": headline,
+        "partitions": entries,
+    }
+    with open(os.path.join(directory, CATALOG_FILENAME), "w") as file:
+        json.dump(catalog, file, indent=2)
+
+    logging.info(f"Wrote {len(entries)} partitions of race results to {directory}")
+
+
+class PartitionedResults:
+    """
+    Race results written by write_partitions(). Only the catalog is read when
+    they are opened. A partition is loaded when it is needed for the first
+    time and then kept, so the memory grows with the partitions touched. The
+    prompt blocks of the races are rendered when their partition is loaded.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, CATALOG_FILENAME), "r") as file:
+            catalog = json.load(file)
+
+        self.directory = directory
+        self.version = catalog["version"]
+        self.headline = catalog["headline"]
+        self.entries = catalog["partitions"]
+        self.template = pd.read_pickle(os.path.join(directory, TEMPLATE_FILENAME))
+        self.prompt_blocks = RacePromptBlocks()
+
+        self._categorical = catalog["categorical"]
+        self._row_partitions = np.load(
+            os.path.join(directory, ROW_PARTITIONS_FILENAME), mmap_mode="r"
+        )
+        self._loaded = {}
+        self._all = None
+        self._lock = threading.RLock()
+
+    def prune(self, search_criterias: Dict) -> List[int]:
+        """
+        Return the partitions that can contain rows matching the search
+        criteria. Only year, class and track are known from the catalog,
+        criteria of other columns do not prune any partition.
+        """
+        years = search_criterias.get("year")
+        classes = _lower(search_criterias.get("class_name"))
+        tracks = _lower(search_criterias.get("track_name"))
+
+        selected = []
+        for i, entry in enumerate(self.entries):
+            if years is not None and (
+                entry["year"] is None or entry["year"] not in years
+            ):
+                continue
+            if classes is not None and str(entry["class_name"]).lower() not in classes:
+                continue
+            if tracks is not None and tracks.isdisjoint(_lower(entry["tracks"])):
+                continue
+            selected.append(i)
+
+        return selected
+
+    def load(self, partition: int) -> pd.DataFrame:
+        """Return the rows of the partition and load it if needed."""
+        rows = self._loaded.get(partition)
+        if rows is not None:
+            return rows
+
+        with self._lock:
+            rows = self._loaded.get(partition)
+            if rows is not None:
+                return rows
+
+            entry = self.entries[partition]
+            logging.info(
+                f"Loading partition {entry['file']} of {entry['year']} {entry['class_name']}"
+            )
+            rows = pd.read_pickle(os.path.join(self.directory, entry["file"]))
+            for column in self._categorical:
+                rows[column] = pd.Categorical.from_codes(
+                    rows[column], dtype=self.template[column].dtype
+                )
+
+            self.prompt_blocks.add(rows)
+            self._loaded[partition] = rows
+
+        return rows
+
+    def rows(self, row_ids) -> pd.DataFrame:
+        """Return the rows of the given ids in this order."""
+        row_ids = np.asarray(row_ids)
+        if len(row_ids) == 0:
+            return self.template
+
+        partitions = np.unique(self._row_partitions[row_ids])
+        rows = pd.concat([self.load(int(partition)) for partition in partitions])
+
+        return rows.loc[row_ids]
+
+    def load_all(self) -> pd.DataFrame:
+        """
+        Return the rows of all partitions in one data frame, which is made only
+        once, e.g. for the SQLite query engine.
+        """
+        with self._lock:
+            if self._all is None:
+                rows = pd.concat([self.load(i) for i in range(len(self.entries))])
+                self._all = rows.sort_index()
+
+        return self._all
+
+    def loaded_partitions(self) -> int:
+        return len(self._loaded)
+
+
+def _lower(values: Optional[List]) -> Optional[set]:
+    if values is None:
+        return None
+
+    return {str(value).lower() for value in values}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write the race results CSV file as partitions by year and class"
+    )
+    parser.add_argument("directory", nargs="?", default=PARTITIONS_DIR or "partitions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # The chat module imports this module
+    from . import chat
+
+    race_results = chat._load_results_csv()
+    write_partitions(
+        race_results,
+        args.directory,
+        chat._get_dataset_version(),
+        chat._headline_data(race_results),
+    )
+
+
+if __name__ == "__main__":
+    main()
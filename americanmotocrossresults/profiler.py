@@ -0,0 +1,161 @@
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from . import metrics
+
+# The profiler can be started per HTTP API only if this is set, see module api
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+
+# Seconds between two samples of a profiled chat call
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler of chat calls. After start(n) the next n chat
+    calls are profiled: while a step of one of them runs, a background thread
+    takes the stack of the thread running it every interval seconds. Waiting
+    for the network is sampled like computing, and a thread streaming the LLM
+    response for the call is sampled next to the thread waiting for it. The
+    samples are counted per
+    stack in the folded format of flamegraph.pl, with the pipeline steps
+    running at the time as the first frames.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._active_calls = 0
+        self._profiled_calls = 0
+        self._traces = set()
+        self._threads: Dict[int, metrics.Trace] = {}
+        self._samples: Dict[str, int] = {}
+        self._sampler = None
+
+    def start(self, calls: int, interval: Optional[float] = None):
+        """Profile the next calls and drop the samples of earlier ones."""
+        with self._lock:
+            self._remaining = calls
+            self._profiled_calls = 0
+            self._samples = {}
+            if interval is not None:
+                self.interval = interval
+
+        logging.info(f"Profiling the next {calls} chat calls")
+
+    def profile(self, updates: Iterator, trace: metrics.Trace) -> Iterator:
+        """
+        Return the updates of a chat call, which are profiled if the call is
+        one of the calls to profile.
+        """
+        with self._lock:
+            if self._remaining <= 0:
+                return updates
+
+            self._remaining -= 1
+            self._active_calls += 1
+            self._traces.add(trace)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, daemon=True)
+                self._sampler.start()
+
+        return self._run(updates, trace)
+
+    def attach(self, updates: Iterator, trace: metrics.Trace) -> Iterator:
+        """
+        Return the updates of a part of a chat call that may run in another
+        thread, e.g. the LLM response shared by identical requests. They are
+        profiled if the chat call is profiled.
+        """
+        with self._lock:
+            if trace not in self._traces:
+                return updates
+
+        return self._steps(updates, trace)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "remaining_calls": self._remaining,
+                "active_calls": self._active_calls,
+                "profiled_calls": self._profiled_calls,
+                "samples": sum(self._samples.values()),
+                "interval": self.interval,
+            }
+
+    def folded(self) -> str:
+        """Return the samples in the folded format, one stack per line."""
+        with self._lock:
+            samples = sorted(self._samples.items())
+
+        return "".join(f"{stack} {count}\n" for stack, count in samples)
+
+    def _run(self, updates: Iterator, trace: metrics.Trace):
+        try:
+            yield from self._steps(updates, trace)
+        finally:
+            with self._lock:
+                self._active_calls -= 1
+                self._profiled_calls += 1
+                self._traces.discard(trace)
+
+    def _steps(self, updates: Iterator, trace: metrics.Trace):
+        # A generator may be resumed by another thread for every update, so the
+        # thread is registered for each step.
+        try:
+            while True:
+                thread_id = threading.get_ident()
+                with self._lock:
+                    self._threads[thread_id] = trace
+                try:
+                    update = next(updates)
+                except StopIteration:
+                    return
+                finally:
+                    with self._lock:
+                        self._threads.pop(thread_id, None)
+
+                yield update
+        finally:
+            updates.close()
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+
+            with self._lock:
+                if self._active_calls == 0:
+                    self._sampler = None
+                    return
+
+                for thread_id, trace in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stack = _folded_stack(frame, trace)
+                        self._samples[stack] = self._samples.get(stack, 0) + 1
+
+
+def _folded_stack(frame, trace: metrics.Trace) -> str:
+    # Frames of the server that called the chat are left out
+    names = []
+    while frame is not None and frame.f_code is not _STEPS_CODE:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+
+    names.reverse()
+
+    return ";".join(["chat"] + list(trace.running) + names)
+
+
+_STEPS_CODE = SamplingProfiler._steps.__code__
+
+# Profiler of the chat calls of this process
+PROFILER = SamplingProfiler()
@@ -0,0 +1,248 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+# Engine that executes the filter of the race results. "pandas" filters the
+# data frame with equality criteria only. "sqlite" executes a QuerySpec with
+# ranges, comparisons, prefixes, aggregates and group-by on an in-memory
+# SQLite database of the race results.
+QUERY_ENGINE = os.getenv("QUERY_ENGINE", "pandas")
+
+# Aggregates the LLM may ask for and their SQL expressions
+AGGREGATES = {
+    "count": "COUNT(*)",
+    "wins": "SUM(position = 1)",
+    "podiums": "SUM(position <= 3)",
+    "best_position": "MIN(position)",
+    "average_position": "ROUND(AVG(position), 1)",
+}
+
+# Aggregates for which a lower value is better
+_ASCENDING_AGGREGATES = {"best_position", "average_position"}
+
+# Upper bound of rows a query may ask for with "top"
+MAX_LIMIT = 1000
+
+_RANGE_PATTERN = re.compile(r"^(-?[0-9.]+)\s*\.\.\s*(-?[0-9.]+)$")
+_COMPARISON_PATTERN = re.compile(r"^(<=|>=|<|>)\s*(-?[0-9.]+)$")
+
+# Keys of the headline response that are no columns of the race results
+SPEC_KEYS = ("group_by", "aggregate", "top")
+
+# Columns the race results may be grouped by. Other columns like source or
+# position are unique per race or row and give no meaningful groups.
+GROUP_BY_COLUMNS = (
+    "driver_name",
+    "track_name",
+    "year",
+    "class_name",
+    "mx_bike",
+    "mx_brand",
+)
+
+
+class QuerySpec:
+    """
+    Constrained query over the race results. Values of the same column are
+    combined per logical OR, the columns per logical AND.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, List] = {}
+        self.conditions: List[Tuple[str, str, object]] = []
+        self.group_by: List[str] = []
+        self.aggregates: List[str] = []
+        self.limit: Optional[int] = None
+
+    def add_values(self, column: str, values: List):
+        self.values.setdefault(column, []).extend(values)
+
+    def add_line(self, key: str, value: str, numeric: bool):
+        """
+        Add one line of the headline response which is either a range
+        "year: 2010..2015", a comparison "position: <= 3", a prefix
+        "class_name: 450*" or one of the keys group_by, aggregate and top.
+        """
+        if key == "group_by":
+            if value not in GROUP_BY_COLUMNS:
+                raise ValueError(f"Cannot group by {value}")
+            self.group_by.append(value)
+        elif key == "aggregate":
+            if value.lower() not in AGGREGATES:
+                raise ValueError(f"Unknown aggregate {value}")
+            self.aggregates.append(value.lower())
+        elif key == "top":
+            limit = int(value)
+            if not 0 < limit <= MAX_LIMIT:
+                raise ValueError(f"Limit must be between 1 and {MAX_LIMIT}")
+            self.limit = limit
+        elif _RANGE_PATTERN.match(value):
+            low, high = _RANGE_PATTERN.match(value).groups()
+            self.conditions.append((key, "between", (float(low), float(high))))
+        elif _COMPARISON_PATTERN.match(value):
+            op, number = _COMPARISON_PATTERN.match(value).groups()
+            self.conditions.append((key, op, float(number)))
+        elif value.endswith("*") and not numeric:
+            self.conditions.append((key, "prefix", value.rstrip("*").strip()))
+        else:
+            raise ValueError(f"Unsupported query line '{key}: {value}'")
+
+    def is_empty(self) -> bool:
+        return (
+            len(self.values) == 0
+            and len(self.conditions) == 0
+            and not (self.is_aggregated())
+        )
+
+    def is_aggregated(self) -> bool:
+        return len(self.aggregates) > 0 or len(self.group_by) > 0
+
+
+def is_query_line(key: str, value: str) -> bool:
+    """
+    Return True if the line of the headline response needs the query engine
+    and cannot be expressed as equality criterion.
+    """
+    return (
+        key in SPEC_KEYS
+        or _RANGE_PATTERN.match(value) is not None
+        or _COMPARISON_PATTERN.match(value) is not None
+        or value.endswith("*")
+    )
+
+
+class QueryEngine:
+    """
+    In-memory SQLite database with a snapshot of the race results that executes
+    validated QuerySpecs.
+    """
+
+    def __init__(self, race_results: pd.DataFrame):
+        self.columns = list(race_results.columns)
+        self.numeric_columns = {
+            column
+            for column in self.columns
+            if pd.api.types.is_numeric_dtype(race_results[column])
+        }
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+
+        race_results.to_sql(
+            "race_results", self._connection, index=True, index_label="row_id"
+        )
+        for column in ("year", "class_name", "driver_name", "track_name"):
+            if column in self.columns:
+                self._connection.execute(
+                    f'CREATE INDEX "idx_{column}" ON race_results ("{column}")'
+                )
+
+    def execute(self, spec: QuerySpec) -> pd.DataFrame:
+        sql, params = self.to_sql(spec)
+        logging.info(f"SQL query: {sql} with {params}")
+
+        with self._lock:
+            results = pd.read_sql_query(sql, self._connection, params=params)
+
+        if not spec.is_aggregated():
+            # Rows keep the index of the race results data frame.
+            results = results.set_index("row_id")
+            results.index.name = None
+
+        return results
+
+    def to_sql(self, spec: QuerySpec) -> Tuple[str, List]:
+        """
+        Translate the spec into SQL. Column names and aggregates are checked
+        against the known ones, all values are passed as parameters.
+        """
+        where = []
+        params = []
+
+        for column, values in spec.values.items():
+            self._validate_column(column)
+
+            placeholders = ", ".join("?" for _ in values)
+            if column in self.numeric_columns:
+                where.append(f'"{column}" IN ({placeholders})')
+                params.extend(float(v) for v in values)
+            else:
+                where.append(f'LOWER("{column}") IN ({placeholders})')
+                params.extend(str(v).lower() for v in values)
+
+        for column, op, value in spec.conditions:
+            self._validate_column(column)
+
+            if op == "between":
+                where.append(f'"{column}" BETWEEN ? AND ?')
+                params.extend(value)
+            elif op == "prefix":
+                where.append(f'LOWER("{column}") LIKE ?')
+                params.append(str(value).lower() + "%")
+            elif op in ("<", "<=", ">", ">="):
+                where.append(f'"{column}" {op} ?')
+                params.append(value)
+            else:
+                raise ValueError(f"Unknown operator {op}")
+
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+
+        limit = spec.limit
+        if limit is not None and not (0 < limit <= MAX_LIMIT):
+            raise ValueError(f"Limit must be between 1 and {MAX_LIMIT}")
+
+        if spec.is_aggregated():
+            for column in spec.group_by:
+                self._validate_column(column)
+                if column not in GROUP_BY_COLUMNS:
+                    raise ValueError(f"Cannot group by {column}")
+            for aggregate in spec.aggregates:
+                if aggregate not in AGGREGATES:
+                    raise ValueError(f"Unknown aggregate {aggregate}")
+
+            aggregates = spec.aggregates or ["count"]
+            select = [f'"{column}"' for column in spec.group_by]
+            select += [f"{AGGREGATES[a]} AS {a}" for a in aggregates]
+
+            sql = f"SELECT {', '.join(select)} FROM race_results{where_sql}"
+            if spec.group_by:
+                group_by = ", ".join(f'"{column}"' for column in spec.group_by)
+                direction = "ASC" if aggregates[0] in _ASCENDING_AGGREGATES else "DESC"
+                sql += f" GROUP BY {group_by} ORDER BY {aggregates[0]} {direction}"
+        else:
+            sql = (
+                f"SELECT * FROM race_results{where_sql}"
+                " ORDER BY year, race_day, class_name, position"
+            )
+
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        return sql, params
+
+    def _validate_column(self, column: str):
+        if column not in self.columns:
+            raise ValueError(f"Unknown column {column}")
+
+
+_ENGINE = None
+_ENGINE_SOURCE = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine(race_results: pd.DataFrame) -> QueryEngine:
+    """Return the query engine for the given race results."""
+    global _ENGINE
+    global _ENGINE_SOURCE
+
+    with _ENGINE_LOCK:
+        if _ENGINE is None or _ENGINE_SOURCE is not race_results:
+            logging.info("Loading race results into SQLite query engine ...")
+            _ENGINE = QueryEngine(race_results)
+            _ENGINE_SOURCE = race_results
+
+        return _ENGINE
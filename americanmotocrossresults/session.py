@@ -0,0 +1,124 @@
+import logging
+import os
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Upper bound of sessions kept in memory. The least recently used session is
+# dropped first.
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+
+# Sessions without a chat turn for this many seconds are dropped.
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+
+# Number of turns whose search criteria are kept for the summary of older turns
+SESSION_MAX_CRITERIA_HISTORY = 20
+
+
+class SessionState:
+    """
+    Retrieval state of one conversation. Follow-up questions usually narrow
+    the previous search, e.g. "and in 2020?", so the rows found for the last
+    search criteria and all resolved driver and track names are kept.
+    """
+
+    def __init__(self):
+        self.search_criterias: Optional[Dict] = None
+        self.row_ids: Optional[np.ndarray] = None
+        self.resolved_names: Dict[Tuple[str, str], List[str]] = {}
+        self.criteria_history: List[Dict] = []
+        self.last_used = time.monotonic()
+
+    def remember(self, search_criterias: Dict, row_ids):
+        self.search_criterias = {
+            header_name: list(patterns)
+            for header_name, patterns in search_criterias.items()
+        }
+        self.row_ids = None if row_ids is None else np.asarray(row_ids)
+        self._add_to_criteria_history(self.search_criterias)
+
+    def remember_no_search(self):
+        """Record a turn that did not search the race results."""
+        self._add_to_criteria_history({})
+
+    def _add_to_criteria_history(self, search_criterias: Dict):
+        self.criteria_history.append(search_criterias)
+        del self.criteria_history[:-SESSION_MAX_CRITERIA_HISTORY]
+
+    def is_refinement(self, search_criterias: Dict) -> bool:
+        """
+        Return True if the given search criteria can only match rows that were
+        found for the previous search criteria. This is the case if every
+        column of the previous search is searched again with a subset of its
+        previous values.
+        """
+        if self.search_criterias is None or self.row_ids is None:
+            return False
+
+        for header_name, previous_patterns in self.search_criterias.items():
+            patterns = search_criterias.get(header_name)
+            if patterns is None:
+                return False
+
+            if not _normalize(patterns) <= _normalize(previous_patterns):
+                return False
+
+        return True
+
+
+class SessionStore:
+    """
+    Thread-safe store of session states bounded by number of sessions and idle
+    time.
+    """
+
+    def __init__(self, max_sessions: int, idle_seconds: float):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionState:
+        now = time.monotonic()
+
+        with self._lock:
+            self._evict_idle(now)
+
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = SessionState()
+                self._sessions[session_id] = state
+
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    logging.info(f"Session {evicted} dropped from session store")
+            else:
+                self._sessions.move_to_end(session_id)
+
+            state.last_used = now
+
+            return state
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict_idle(self, now: float):
+        # Sessions are ordered by last use, so the idle ones are at the front.
+        while len(self._sessions) > 0:
+            session_id, state = next(iter(self._sessions.items()))
+            if now - state.last_used <= self.idle_seconds:
+                break
+
+            del self._sessions[session_id]
+            logging.info(f"Idle session {session_id} dropped from session store")
+
+
+def _normalize(patterns: List) -> set:
+    return {str(p).lower() for p in patterns}
+
+
+SESSIONS = SessionStore(SESSION_MAX_COUNT, SESSION_IDLE_SECONDS)
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Deduplication of identical calls in flight at the same time. The first
+    caller of a key runs the call, all callers of the same key arriving before
+    it is finished get its result instead of calling again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._streams: Dict[Hashable, "_SharedStream"] = {}
+
+    def do(self, key: Hashable, function: Callable) -> Tuple[object, bool]:
+        """
+        Return the result of the call together with True if this caller ran
+        the call and False if it got the result of another caller.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result(), False
+
+        try:
+            result = function()
+            future.set_result(result)
+            return result, True
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stream(self, key: Hashable, function: Callable) -> Tuple[Iterator, bool]:
+        """
+        Return an iterator over the items of the generator returned by the
+        function together with True if this caller started the generator.
+        The generator runs in a thread of its own and its items are handed to
+        every caller of the same key, also to those that join late. It runs to
+        its end even if no caller reads anymore.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = _SharedStream()
+                self._streams[key] = shared
+
+        if leader:
+            threading.Thread(
+                target=self._pump, args=(key, shared, function), daemon=True
+            ).start()
+
+        return shared.read(), leader
+
+    def _pump(self, key: Hashable, shared: "_SharedStream", function: Callable):
+        try:
+            for item in function():
+                shared.append(item)
+            shared.close()
+        except BaseException as e:
+            shared.close(e)
+        finally:
+            with self._lock:
+                del self._streams[key]
+
+
+class _SharedStream:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._items: List = []
+        self._closed = False
+        self._error: Optional[BaseException] = None
+
+    def append(self, item):
+        with self._condition:
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def close(self, error: Optional[BaseException] = None):
+        with self._condition:
+            self._closed = True
+            self._error = error
+            self._condition.notify_all()
+
+    def read(self) -> Iterator:
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._items) and not self._closed:
+                    self._condition.wait()
+
+                items = self._items[index:]
+                index += len(items)
+                closed = self._closed
+
+            yield from items
+
+            if closed:
+                if self._error is not None:
+                    raise self._error
+                return
@@ -1,27 +1,44 @@
-import chromadb
-from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
 import sys
 import os
 import pandas as pd
 from typing import List
 import logging
 
+from . import names
+from . import once
+
 # Global vector database for track names
 TRACKS_VEC_DB = None
 
+# Loads the vector database once for all requests
+_DB_ONCE = once.Once("Vector database with tracks")
+
 # Storage path for persistence
 TRACKS_DB_PATH = "./chroma_db_tracks"
 
 
 def get_tracks(race_results: pd.DataFrame, track: str) -> List[str]:
+    return get_tracks_batch(race_results, [track])[0]
+
+
+def get_tracks_batch(
+    race_results: pd.DataFrame, track_names: List[str]
+) -> List[List[str]]:
+    """
+    Resolve several track names with one query to the vector database. The
+    result contains one list of tracks per given name.
+    """
     global TRACKS_VEC_DB
 
+    if len(track_names) == 0:
+        return []
+
     _init_db(race_results)
 
     if TRACKS_VEC_DB is None:
-        return []
+        return [[] for _ in track_names]
 
-    nearest_tracks = TRACKS_VEC_DB.query(query_texts=[track], n_results=5)
+    nearest_tracks = TRACKS_VEC_DB.query(query_texts=track_names, n_results=5)
 
     # Check that response is as expected
     if (
@@ -29,22 +46,33 @@ def get_tracks(race_results: pd.DataFrame, track: str) -> List[str]:
         or not isinstance(nearest_tracks, dict)
         or nearest_tracks.get("documents") is None
         or nearest_tracks.get("distances") is None
+        or len(nearest_tracks["documents"]) != len(track_names)
     ):
         logging.error(
-            f"Query to track vector database for track '{track}' had an unexpected result: {nearest_tracks}"
+            f"Query to track vector database for tracks {track_names} had an unexpected result: {nearest_tracks}"
         )
-        return []
+        return [[] for _ in track_names]
 
     assert nearest_tracks is not None
     assert nearest_tracks["documents"] is not None
     assert nearest_tracks["distances"] is not None
 
-    logging.info(f"{nearest_tracks["documents"][0]}")
-    logging.info(f"{nearest_tracks["distances"][0]}")
+    result = []
+    for documents, distances in zip(
+        nearest_tracks["documents"], nearest_tracks["distances"]
+    ):
+        logging.info(f"{documents}")
+        logging.info(f"{distances}")
+
+        result.append(_select_tracks(documents, distances))
 
+    return result
+
+
+def _select_tracks(documents: List[str], distances: List[float]) -> List[str]:
     tracks = []
-    for index, dist in enumerate(nearest_tracks["distances"][0]):
-        d = nearest_tracks["documents"][0][index]
+    for index, dist in enumerate(distances):
+        d = documents[index]
         if dist <= 1.5:
             tracks.append(d)
 
@@ -52,13 +80,20 @@ def get_tracks(race_results: pd.DataFrame, track: str) -> List[str]:
 
 
 def _init_db(race_results: pd.DataFrame):
-    """Initializes the vector database and persists it to disk."""
+    _DB_ONCE.do(lambda: TRACKS_VEC_DB is None, lambda: _load_db(race_results))
+
+
+def _load_db(race_results: pd.DataFrame):
+    """Loads the vector database that was persisted to disk by build_index."""
 
     global TRACKS_VEC_DB
     global TRACKS_DB_PATH
 
-    if TRACKS_VEC_DB is not None:
-        logging.info("Vector database with tracks was already initialized.")
+    if names.NAME_INDEX_BACKEND == "local":
+        logging.info("Initialization of local tracks name index ...")
+        TRACKS_VEC_DB = names.LocalNameIndex(
+            names.column_names(race_results["track_name"])
+        )
         return
 
     logging.info("Initialization of tracks vector database ...")
@@ -70,6 +105,10 @@ def _init_db(race_results: pd.DataFrame):
         )
         raise ValueError("OPENAI_API_KEY is not set")
 
+    # chromadb is imported only if the backend is used, it is slow to import.
+    import chromadb
+    from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
     embedding_function = OpenAIEmbeddingFunction(
         api_key=api_key, model_name="text-embedding-3-small"
     )
@@ -78,24 +117,22 @@ def _init_db(race_results: pd.DataFrame):
 
     collection_name = "tracks"
 
-    # Check if the collection already exists
-    if collection_name in chroma_client.list_collections():
-        logging.info("Loading existing vector database from disk ...")
-        TRACKS_VEC_DB = chroma_client.get_collection(
-            name=collection_name, embedding_function=embedding_function
-        )
-    else:
-        logging.info("Creating new vector database from scratch ...")
-        collection = chroma_client.create_collection(
-            name=collection_name, embedding_function=embedding_function
+    # The vector database is built offline, see module build_index
+    if collection_name not in chroma_client.list_collections():
+        logging.error(
+            f"Vector database with tracks is missing in {TRACKS_DB_PATH}. Build it with python -m americanmotocrossresults.build_index"
         )
+        raise ValueError("Vector database with tracks is missing")
 
-        tracks = race_results["track_name"].unique().tolist()
+    logging.info("Loading existing vector database from disk ...")
+    collection = chroma_client.get_collection(
+        name=collection_name, embedding_function=embedding_function
+    )
 
-        collection.add(
-            documents=tracks,
-            ids=[str(i) for i in range(0, len(tracks))],
+    num_of_names = len(names.column_names(race_results["track_name"]))
+    if collection.count() < num_of_names:
+        logging.warning(
+            f"Vector database with tracks contains {collection.count()} of {num_of_names} names. Resume its build with python -m americanmotocrossresults.build_index"
         )
-        logging.info("done")
 
-        TRACKS_VEC_DB = collection
+    TRACKS_VEC_DB = collection
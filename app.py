@@ -1,22 +1,108 @@
+import argparse
 import os
 import sys
+import time
 import gradio as gr
+import uvicorn
 
+from fastapi import FastAPI
+
+from americanmotocrossresults import api
 from americanmotocrossresults.chat import chat
 
+# Address and port of the web server
+SERVER_NAME = os.getenv("SERVER_NAME", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "7860"))
+
+# Chat requests that are answered at the same time. They spend most of their
+# time waiting for the LLM, so this can be far more than the number of CPUs.
+CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", "16"))
+
+# Chat requests waiting for an answer beyond this are rejected. 0 does not
+# limit the queue.
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "0"))
 
-def chatbot_handler(message, history):
-    yield from chat(message, history)
+# Seconds between the updates of an answer sent to the browser. 0 sends every
+# token.
+STREAM_INTERVAL = float(os.getenv("STREAM_INTERVAL", "0.1"))
 
 
-def show_ui():
+def create_ui(stream_interval: float = STREAM_INTERVAL) -> gr.ChatInterface:
+    def chatbot_handler(message, history, request: gr.Request):
+        # The session hash identifies the browser session, so that follow-up
+        # questions can reuse the retrieval of previous turns.
+        updates = chat(message, history, session_id=request.session_hash)
+        yield from _throttle(updates, stream_interval)
+
     chatbot = gr.Chatbot(type="messages")
-    chat_interface = gr.ChatInterface(
+    return gr.ChatInterface(
         fn=chatbot_handler, chatbot=chatbot, type="messages", multimodal=False
     )
 
+
+def create_app(
+    concurrency_limit: int = CONCURRENCY_LIMIT,
+    max_queue_size: int = MAX_QUEUE_SIZE,
+    stream_interval: float = STREAM_INTERVAL,
+) -> FastAPI:
+    """
+    Create the web application with the chat UI at / and the HTTP API for
+    programmatic clients at /api, see module api.
+    """
+    chat_interface = create_ui(stream_interval)
+    _configure_queue(chat_interface, concurrency_limit, max_queue_size)
+
+    return gr.mount_gradio_app(api.create_api(), chat_interface, path="/")
+
+
+def _configure_queue(
+    chat_interface: gr.ChatInterface, concurrency_limit: int, max_queue_size: int
+):
+    # Every running chat request occupies a thread of the server. The queue
+    # sizes its workers from max_threads when it is created, so it is set first.
+    chat_interface.max_threads = max(40, concurrency_limit)
+    chat_interface.queue(
+        default_concurrency_limit=concurrency_limit,
+        max_size=max_queue_size if max_queue_size > 0 else None,
+    )
+
+
+def show_ui(
+    server_name: str = SERVER_NAME,
+    server_port: int = SERVER_PORT,
+    concurrency_limit: int = CONCURRENCY_LIMIT,
+    max_queue_size: int = MAX_QUEUE_SIZE,
+    stream_interval: float = STREAM_INTERVAL,
+):
+    app = create_app(concurrency_limit, max_queue_size, stream_interval)
+
     print("Start MX chatbot now ...", file=sys.stderr)
-    chat_interface.launch()
+    uvicorn.run(app, host=server_name, port=server_port)
+
+
+def _throttle(updates, interval: float):
+    """
+    Yield the updates at most every interval seconds. Each update contains the
+    whole answer so far, so skipped updates are not missed. The last update is
+    always yielded.
+    """
+    if interval <= 0:
+        yield from updates
+        return
+
+    sent = None
+    pending = None
+    for update in updates:
+        now = time.monotonic()
+        if sent is None or now - sent >= interval:
+            yield update
+            sent = now
+            pending = None
+        else:
+            pending = update
+
+    if pending is not None:
+        yield pending
 
 
 def _requirements():
@@ -29,7 +115,26 @@ def _requirements():
         sys.exit(1)
 
 
+def _parse_args():
+    parser = argparse.ArgumentParser(description="MX chatbot")
+    parser.add_argument("--host", default=SERVER_NAME)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--concurrency-limit", type=int, default=CONCURRENCY_LIMIT)
+    parser.add_argument("--max-queue-size", type=int, default=MAX_QUEUE_SIZE)
+    parser.add_argument("--stream-interval", type=float, default=STREAM_INTERVAL)
+
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = _parse_args()
+
     _requirements()
 
-    show_ui()
+    show_ui(
+        server_name=args.host,
+        server_port=args.port,
+        concurrency_limit=args.concurrency_limit,
+        max_queue_size=args.max_queue_size,
+        stream_interval=args.stream_interval,
+    )
@@ -0,0 +1,95 @@
+"""
+Benchmark of the admission control of LLM requests under a traffic spike.
+
+Many sessions ask at once while the fake LLM accepts only a few concurrent
+requests and rejects all others with 429. Without admission control most
+answers are errors. Retries after a backoff and finally a concurrency limit
+per model let the requests wait instead. The time waited for admission is printed separately from
+the LLM latency:
+
+    python benchmarks/admission.py --sessions 64 --upstream-limit 8
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import fakes
+from pipeline import percentile
+from americanmotocrossresults import admission, chat, llm, metrics
+
+
+def run(queries, sessions: int, max_concurrency: int, max_attempts: int):
+    admission.LLM_MAX_CONCURRENCY = max_concurrency
+    admission._CONTROLLERS.clear()
+    llm.LLM_MAX_ATTEMPTS = max_attempts
+
+    traces = []
+    answers = []
+
+    def _session(i: int):
+        response = ""
+        for response in chat.chat(queries[i % len(queries)]["query"], []):
+            pass
+        answers.append(response)
+
+    metrics.TRACE_HANDLERS.append(traces.append)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=sessions) as executor:
+                list(executor.map(_session, range(sessions)))
+    finally:
+        metrics.TRACE_HANDLERS.remove(traces.append)
+
+    errors = sum(1 for answer in answers if answer.startswith("Error:"))
+    queue = [trace.stages.get("llm_queue", 0.0) * 1000 for trace in traces]
+    total = [trace.stages["total"] * 1000 for trace in traces]
+    rate_limited = sum(trace.counters.get("llm_rate_limited", 0) for trace in traces)
+
+    return errors, rate_limited, queue, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--upstream-limit", type=int, default=8)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    # Identical questions must reach the upstream separately
+    chat.COALESCE_REQUESTS = False
+    chat.COALESCE_ANSWERS = False
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries,
+        latency=0.2,
+        tokens_per_second=200,
+        embedding_latency=0.0,
+        concurrency_limit=args.upstream_limit,
+    )
+
+    # Both models share the fake upstream, so each one gets half of its limit.
+    for name, max_concurrency, max_attempts in (
+        ("no retry", args.sessions, 1),
+        ("retry", args.sessions, llm.LLM_MAX_ATTEMPTS),
+        ("admission", max(args.upstream_limit // 2, 1), llm.LLM_MAX_ATTEMPTS),
+    ):
+        errors, rate_limited, queue, total = run(
+            queries, args.sessions, max_concurrency, max_attempts
+        )
+        print(
+            f"{name:10s} {errors:3d} of {args.sessions} answers are errors, "
+            f"{rate_limited:3d} requests hit 429, "
+            f"queue p50 {percentile(queue, 50):6.0f} ms p95 "
+            f"{percentile(queue, 95):6.0f} ms, "
+            f"total p50 {percentile(total, 50):6.0f} ms p95 "
+            f"{percentile(total, 95):6.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
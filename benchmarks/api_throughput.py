@@ -0,0 +1,156 @@
+"""
+Benchmark of the HTTP API against the Gradio UI of the server of app.py with
+fake LLM and name index backends.
+
+The server is started in this process. At several levels of simultaneous
+sessions every session asks one query of benchmarks/queries.json once with the
+Gradio client and once with POST /api/chat, which streams the answer as
+Server-Sent Events. Printed are the throughput, the time until the first
+update and the time until the answer is complete. Requests of the API do not
+wait in the queue of the Gradio UI. At last the rows of a query
+are fetched from POST /api/rows without any LLM call:
+
+    python benchmarks/api_throughput.py --sessions 8 32
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+from gradio_client import Client
+
+import fakes
+from americanmotocrossresults import cache
+from load_test import start_server
+
+# The repository is on the path after the import of fakes
+import app  # noqa: E402
+
+
+def ask_gradio(url: str, query: str, answers: List[str]):
+    client = Client(url, verbose=False)
+
+    def _ask():
+        first_update = None
+        job = client.submit(message=query, api_name="/chat")
+        for _ in job:
+            if first_update is None:
+                first_update = time.perf_counter()
+        answers.append(job.result())
+        return first_update
+
+    return _ask
+
+
+def ask_api(url: str, query: str, answers: List[str]):
+    client = httpx.Client(base_url=url, timeout=120)
+
+    def _ask():
+        first_update = None
+        answer = ""
+        with client.stream("POST", "/api/chat", json={"query": query}) as response:
+            event = None
+            for line in response.iter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: ") :]
+                elif line.startswith("data: "):
+                    if first_update is None:
+                        first_update = time.perf_counter()
+                    text = json.loads(line[len("data: ") :])["text"]
+                    if event == "delta":
+                        answer += text
+                    elif event == "replace":
+                        answer = text
+        answers.append(answer)
+        return first_update
+
+    return _ask
+
+
+def run_level(url: str, queries: List[Dict], sessions: int, client) -> Dict:
+    answers = []
+    # The clients connect before the measurement
+    asks = [
+        client(url, queries[i % len(queries)]["query"], answers)
+        for i in range(sessions)
+    ]
+
+    def _session(ask):
+        start = time.perf_counter()
+        first_update = ask()
+        finished = time.perf_counter()
+        return (first_update or finished) - start, finished - start
+
+    # Both clients start with an empty results cache
+    cache.RESULTS_CACHE.clear()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        timings = list(executor.map(_session, asks))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "throughput": len(timings) / elapsed,
+        "first_update": statistics.median(t[0] for t in timings) * 1000,
+        "total": statistics.median(t[1] for t in timings) * 1000,
+        "empty_answers": sum(not answer for answer in answers),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--concurrency-limit", type=int, default=app.CONCURRENCY_LIMIT)
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries, latency=args.llm_latency, tokens_per_second=args.tokens_per_second
+    )
+    url, server = start_server(app.create_app(concurrency_limit=args.concurrency_limit))
+
+    failed = False
+    try:
+        for sessions in args.sessions:
+            for name, client in (("gradio", ask_gradio), ("sse api", ask_api)):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = run_level(url, queries, sessions, client)
+                failed = failed or result["empty_answers"] > 0
+
+                print(
+                    f"{sessions:4d} sessions {name:8s} "
+                    f"{result['throughput']:5.2f} answers/s, first update median "
+                    f"{result['first_update']:6.0f} ms, total median "
+                    f"{result['total']:6.0f} ms, {result['empty_answers']} empty"
+                )
+
+        start = time.perf_counter()
+        response = httpx.post(
+            f"{url}api/rows",
+            json={"criteria": {"driver_name": ["Eli Tomac"], "year": [2019]}},
+        )
+        rows = response.json()
+        print(
+            f"rows api: {rows['num_of_results']} rows of {rows['criteria']} in "
+            f"{(time.perf_counter() - start) * 1000:.0f} ms"
+        )
+    finally:
+        server.should_exit = True
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of coalescing identical requests in flight.
+
+Many sessions ask the same question at the same moment, like right after a
+race ended. Printed are the upstream LLM calls, the name index queries and the
+latency with and without coalescing:
+
+    python benchmarks/coalescing.py --sessions 32
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fakes
+from pipeline import percentile
+from americanmotocrossresults import cache, chat, drivers, llm, tracks
+
+
+class _Counting:
+    """Count the calls of a method of the wrapped object."""
+
+    def __init__(self, wrapped, method: str):
+        self.wrapped = wrapped
+        self.method = method
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.wrapped, name)
+        if name != self.method:
+            return attribute
+
+        def _counted(*args, **kwargs):
+            with self._lock:
+                self.calls += 1
+            return attribute(*args, **kwargs)
+
+        return _counted
+
+
+def run(question: str, sessions: int, coalesce: bool):
+    chat.COALESCE_REQUESTS = coalesce
+    chat.COALESCE_ANSWERS = coalesce
+    cache.RESULTS_CACHE.clear()
+
+    backend = _Counting(llm.BACKENDS["fake"], "chat_completion_stream")
+    llm.register_backend("fake", backend)
+    driver_index = _Counting(drivers.DRIVERS_VEC_DB, "query")
+    track_index = _Counting(tracks.TRACKS_VEC_DB, "query")
+    drivers.DRIVERS_VEC_DB = driver_index
+    tracks.TRACKS_VEC_DB = track_index
+
+    def _session(_):
+        start = time.perf_counter()
+        for _ in chat.chat(question, []):
+            pass
+        return time.perf_counter() - start
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=sessions) as executor:
+                latencies = list(executor.map(_session, range(sessions)))
+    finally:
+        llm.register_backend("fake", backend.wrapped)
+        drivers.DRIVERS_VEC_DB = driver_index.wrapped
+        tracks.TRACKS_VEC_DB = track_index.wrapped
+
+    return backend.calls, driver_index.calls + track_index.calls, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=32)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(queries)
+    question = queries[0]["query"]
+
+    for name, coalesce in (("separate", False), ("coalesced", True)):
+        llm_calls, index_queries, latencies = run(question, args.sessions, coalesce)
+        latencies = [latency * 1000 for latency in latencies]
+        print(
+            f"{name:10s} {llm_calls:3d} LLM calls, {index_queries:3d} name index "
+            f"queries, latency p50 {percentile(latencies, 50):6.0f} ms "
+            f"p95 {percentile(latencies, 95):6.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Report of the memory of the race results data frame, loaded once without a
+schema and once with the declared schema of categoricals and small integers.
+
+Each variant is loaded in a fresh process, so that the growth of the resident
+memory is not hidden by memory the other variant left behind:
+
+    python benchmarks/dataset_memory.py
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+
+from americanmotocrossresults import chat  # noqa: E402
+from soak_memory import resident_memory_mb  # noqa: E402
+
+
+def measure(variant: str) -> dict:
+    gc.collect()
+    before = resident_memory_mb()
+
+    if variant == "schema":
+        race_results = chat._load_results_csv()
+    else:
+        race_results = pd.read_csv(chat.RACE_RESULTS_CSV_FILENAME)
+
+    gc.collect()
+    after = resident_memory_mb()
+
+    return {
+        "rows": len(race_results),
+        "deep_mb": race_results.memory_usage(deep=True).sum() / 1024 / 1024,
+        "rss_mb": after - before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--variant", choices=["plain", "schema"])
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        print(json.dumps(measure(args.variant)))
+        return
+
+    for variant in ("plain", "schema"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--variant", variant],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        report = json.loads(output.strip().split("\n")[-1])
+        print(
+            f"{variant:7s} {report['rows']} rows: data frame "
+            f"{report['deep_mb']:6.2f} MB, resident memory {report['rss_mb']:+6.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Fake LLM and name index backends shared by the benchmarks. They make the
+chatbot pipeline run without network access and without an API key.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from americanmotocrossresults import chat, drivers, llm, names, tracks  # noqa: E402
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUERIES_FILENAME = os.path.join(BENCHMARK_DIR, "queries.json")
+
+FINAL_RESPONSE = """What a career! Here are the results you asked for:
+
+| Year | Track | Class | Position |
+|------|-------|-------|----------|
+| 2019 | HANGTOWN | 450MX | 1 |
+| 2019 | FOX RACEWAY | 450MX | 2 |
+| 2019 | THUNDER VALLEY | 450MX | 1 |
+
+Three podiums in a row, two of them wins. That is championship form in the big
+450 class. If you want more details, have a look at
+https://americanmotocrossresults.com/
+"""
+
+
+def load_queries() -> List[Dict]:
+    with open(QUERIES_FILENAME, "r") as file:
+        return json.load(file)
+
+
+def setup_fake_backends(
+    queries: List[Dict],
+    latency: float = 0.4,
+    tokens_per_second: float = 80.0,
+    embedding_latency: float = 0.15,
+    concurrency_limit: Optional[int] = None,
+    prompt_tokens_per_second: Optional[float] = None,
+    prompt_cache_min_tokens: Optional[int] = None,
+):
+    """
+    Route both LLM stages to the fake backend, which replays the headlines of
+    the query corpus, and resolve names with the local name index. The latency
+    of an embedding call is simulated for every query of the name index. With
+    a concurrency limit, the fake backend rejects requests beyond it with 429.
+    With a prompt token rate, the fake backend takes longer for longer prompts,
+    with a minimum of cached tokens it caches prompt prefixes.
+    """
+    recordings = [
+        {"model": "headlines", "match": query["query"], "response": query["headlines"]}
+        for query in queries
+    ]
+    recordings.append({"model": "answer", "response": FINAL_RESPONSE})
+
+    llm.register_backend(
+        "fake",
+        llm.FakeBackend(
+            recordings,
+            latency=latency,
+            tokens_per_second=tokens_per_second,
+            concurrency_limit=concurrency_limit,
+            prompt_tokens_per_second=prompt_tokens_per_second,
+            prompt_cache_min_tokens=prompt_cache_min_tokens,
+        ),
+    )
+    chat.MODEL_FOR_CSV_HEADER = "fake:headlines"
+    chat.MODEL_FOR_USER_RESPONSE = "fake:answer"
+
+    chat._ensure_snapshot()
+
+    names.NAME_INDEX_BACKEND = "local"
+    drivers.DRIVERS_VEC_DB = _SlowIndex(
+        names.LocalNameIndex(names.column_names(chat.RACE_RESULTS["driver_name"])),
+        embedding_latency,
+    )
+    tracks.TRACKS_VEC_DB = _SlowIndex(
+        names.LocalNameIndex(names.column_names(chat.RACE_RESULTS["track_name"])),
+        embedding_latency,
+    )
+
+
+class _SlowIndex:
+    def __init__(self, index: names.LocalNameIndex, latency: float):
+        self.index = index
+        self.latency = latency
+
+    def query(self, query_texts: List[str], n_results: int = 10) -> Dict:
+        # One embedding call per query no matter how many texts
+        time.sleep(self.latency)
+
+        return self.index.query(query_texts=query_texts, n_results=n_results)
@@ -0,0 +1,124 @@
+"""
+Benchmark of the time to first token of the final answer with and without
+overlapping the headline extraction with the retrieval.
+
+The LLM and the vector databases are replaced by mocks with realistic pacing,
+so the benchmark runs without network access:
+
+    python benchmarks/headline_prefetch.py
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from americanmotocrossresults import cache, chat, drivers, tracks  # noqa: E402
+
+HEADLINE_RESPONSE = """```
+driver_name: Eli Tomac
+driver_name: Ken Roczen
+driver_name: Jason Anderson
+track_name: HANGTOWN
+year: 2019
+year: 2020
+```"""
+
+FINAL_RESPONSE = "Eli Tomac won at Hangtown in 2019."
+
+
+def _mock_stream(seconds_per_token: float, first_token_latency: float):
+    def _stream(model, messages, trace=None):
+        if messages[0]["content"] == chat.SYSTEM_PROMPT_FOR_FINDING_HEADLINES:
+            response = HEADLINE_RESPONSE
+        else:
+            response = FINAL_RESPONSE
+
+        time.sleep(first_token_latency)
+
+        # Roughly four characters per token
+        accumulated = ""
+        for i in range(0, len(response), 4):
+            accumulated += response[i : i + 4]
+            time.sleep(seconds_per_token)
+            yield accumulated
+
+    return _stream
+
+
+def _mock_resolver(latency: float):
+    def _resolve(race_results, names):
+        time.sleep(latency)
+        return [[name] for name in names]
+
+    return _resolve
+
+
+def _serial_pipeline(message: str):
+    """The pipeline before the headline stream was overlapped with retrieval."""
+    headlines = []
+    for lines in chat._find_csv_headlines(chat.RACE_RESULTS, message, []):
+        headlines.extend(lines)
+
+    search_criterias = chat._get_search_criterias(chat.RACE_RESULTS, headlines)
+    results = chat._get_filtered_results(chat.RACE_RESULTS, search_criterias)
+    rendered = chat._render_results(results)
+
+    yield from chat._create_final_response(message, rendered, search_criterias, [])
+
+
+def _streamed_pipeline(message: str):
+    yield from chat.chat(message, [])
+
+
+def _time_to_first_token(pipeline, message: str) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in pipeline(message):
+            return time.perf_counter() - start
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seconds-per-token", type=float, default=0.02)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--resolver-latency", type=float, default=0.4)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    chat._load_snapshot()
+
+    # Every run asks the same question, which must not be served from cache
+    cache.RESULTS_CACHE.max_entries = 0
+    chat._LLM_chat_completion_stream = _mock_stream(
+        args.seconds_per_token, args.first_token_latency
+    )
+    drivers.get_drivers_batch = _mock_resolver(args.resolver_latency)
+    tracks.get_tracks_batch = _mock_resolver(args.resolver_latency)
+
+    message = "Tomac vs Roczen vs Anderson at Hangtown in 2019 and 2020"
+
+    for name, pipeline in [
+        ("serial", _serial_pipeline),
+        ("streamed", _streamed_pipeline),
+    ]:
+        timings = [_time_to_first_token(pipeline, message) for _ in range(args.runs)]
+        print(
+            f"{name:10s} time to first token: "
+            f"median {statistics.median(timings) * 1000:.0f} ms, "
+            f"min {min(timings) * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
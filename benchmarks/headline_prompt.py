@@ -0,0 +1,93 @@
+"""
+Benchmark of the headline prompt with a sample of the CSV file and all tracks
+against the compact prompt with the description of the columns and the
+candidate tracks of the user query.
+
+Every query of benchmarks/queries.json is sent to the fake LLM, which takes
+longer for longer prompts like a real one. Printed are the estimated input
+tokens and the latency of the headline stage per prompt. For queries that name
+a track it is checked that the compact prompt lists this track:
+
+    python benchmarks/headline_prompt.py --prompt-tokens-per-second 2000
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import re
+import statistics
+import time
+
+import fakes
+from americanmotocrossresults import chat, metrics, tracks
+
+
+def run(queries, prompt: str):
+    chat.HEADLINE_PROMPT = prompt
+
+    tokens = []
+    timings = []
+    for query in queries:
+        trace = metrics.Trace()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in chat._find_csv_headlines(
+                chat.RACE_RESULTS, query["query"], [], "", trace
+            ):
+                pass
+        timings.append((time.perf_counter() - start) * 1000)
+        tokens.append(trace.counters["headline_prompt_tokens"])
+
+    return tokens, timings
+
+
+def missing_tracks(queries):
+    """Return the queries whose track is not among the candidate tracks."""
+    missing = []
+    for query in queries:
+        match = re.search(r"track_name: (.*)", query["headlines"])
+        if match is None:
+            continue
+
+        expected = tracks.get_tracks(chat.RACE_RESULTS, match.group(1))
+        candidates = chat._candidate_tracks(chat.RACE_RESULTS, [query["query"]])
+        if not set(expected) & set(candidates):
+            missing.append(query["query"])
+
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries,
+        embedding_latency=0.0,
+        prompt_tokens_per_second=args.prompt_tokens_per_second,
+    )
+
+    for prompt in ("full", "compact"):
+        tokens, timings = run(queries, prompt)
+        print(
+            f"{prompt:8s} input tokens median {statistics.median(tokens):6.0f}, "
+            f"max {max(tokens):6d}, headline stage median "
+            f"{statistics.median(timings):6.0f} ms, max {max(timings):6.0f} ms"
+        )
+
+    missing = missing_tracks(queries)
+    print(f"queries with their track missing in the candidates: {len(missing)}")
+    for query in missing:
+        print(f"  {query}")
+
+    if missing:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
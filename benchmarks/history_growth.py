@@ -0,0 +1,80 @@
+"""
+Benchmark of the prompt size per turn over a long chat session.
+
+A session of many turns cycles through the query corpus with fake LLM and
+name index backends. The estimated prompt tokens of both LLM calls are printed
+per turn, once with all turns sent verbatim and once with the bounded history.
+Turns answered with a table without the final LLM call show 0 final tokens:
+
+    python benchmarks/history_growth.py --turns 30
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+from typing import Dict, List
+
+import fakes
+from americanmotocrossresults import chat, conversation, metrics
+
+
+def run_session(queries: List[Dict], turns: int, session_id: str) -> List[Dict]:
+    traces = []
+    metrics.TRACE_HANDLERS.append(traces.append)
+
+    history = []
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for turn in range(turns):
+                query = queries[turn % len(queries)]["query"]
+
+                response = ""
+                for response in chat.chat(query, history, session_id=session_id):
+                    pass
+
+                history.append({"role": "user", "content": query})
+                history.append({"role": "assistant", "content": response})
+    finally:
+        metrics.TRACE_HANDLERS.remove(traces.append)
+
+    return [trace.counters for trace in traces]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument(
+        "--max-turns",
+        type=int,
+        default=conversation.HISTORY_MAX_TURNS,
+        help="turns sent verbatim with bounded history",
+    )
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries, latency=0.0, tokens_per_second=None, embedding_latency=0.0
+    )
+
+    conversation.HISTORY_MAX_TURNS = args.turns
+    unbounded = run_session(queries, args.turns, "unbounded")
+
+    conversation.HISTORY_MAX_TURNS = args.max_turns
+    bounded = run_session(queries, args.turns, "bounded")
+
+    print(f"estimated prompt tokens per turn (bounded to {args.max_turns} turns)")
+    print("turn   headline unbounded   bounded   final unbounded   bounded")
+    for turn, (before, after) in enumerate(zip(unbounded, bounded), start=1):
+        print(
+            f"{turn:4d}   {before['headline_prompt_tokens']:18d} "
+            f"{after['headline_prompt_tokens']:9d}   "
+            f"{before.get('final_prompt_tokens', 0):15d} "
+            f"{after.get('final_prompt_tokens', 0):9d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Import time of the entry points against a budget relative to the import time
+of a baseline module, measured with python -X importtime in a fresh
+interpreter.
+
+Every entry point is imported --runs times in a new process. Printed are the
+median import time, the modules that took the most time themselves and the
+heavy dependencies that were imported although the entry point must not need
+them, e.g. pandas for the parser or chromadb for the server with the local
+name index. Budgets are multiples of the import time of a dependency the entry
+point cannot do without, e.g. gradio for the server, so that they hold on
+slower machines as well. The script exits with 1 if an entry point exceeds its
+budget or imports such a dependency, so that it can run as a check before a
+release. The checks of the dependencies also run with the tests in
+tests/test_imports.py:
+
+    python benchmarks/import_time.py --runs 5 --scale 1.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["chromadb", "gradio", "jinja2", "numpy", "openai", "pandas"]
+
+# Entry point, baseline module, budget as multiple of the import time of the
+# baseline and the heavy modules it must not import
+ENTRY_POINTS = [
+    # Parser of the result files
+    ("americanmotocrossresults", "pandas", 0.25, HEAVY_MODULES),
+    # Chat pipeline, e.g. for the benchmarks
+    (
+        "americanmotocrossresults.chat",
+        "pandas",
+        2.0,
+        ["chromadb", "gradio", "jinja2", "openai"],
+    ),
+    # Server with UI and HTTP API
+    ("app", "gradio", 2.0, ["chromadb", "openai"]),
+]
+
+# Written to stderr right before the import, the imports of the interpreter
+# startup come before it
+MARKER = "-- import of entry point --"
+
+
+def import_once(module: str) -> Tuple[float, Dict[str, int], List[str]]:
+    """
+    Import the module in a new interpreter and return the import time in
+    milliseconds, the own import time of every module in microseconds and the
+    heavy modules that were imported.
+    """
+    code = (
+        "import json, sys\n"
+        f"sys.stderr.write({MARKER!r} + '\\n')\n"
+        f"import {module}\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPOSITORY_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+    lines = process.stderr.split(MARKER, 1)[1].splitlines()
+    total_us = 0
+    self_us = {}
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        if not own.strip().isdigit():
+            # Header line
+            continue
+
+        self_us[name.strip()] = int(own)
+        # Nested imports are indented and part of the cumulative time of the
+        # module importing them
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+
+    return total_us / 1000, self_us, json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    baselines = {}
+    failed = False
+    for module, baseline, factor, forbidden in ENTRY_POINTS:
+        if baseline not in baselines:
+            baselines[baseline] = statistics.median(
+                import_once(baseline)[0] for _ in range(args.runs)
+            )
+        budget_ms = baselines[baseline] * factor * args.scale
+        runs = [import_once(module) for _ in range(args.runs)]
+        median_ms = statistics.median(ms for ms, _, _ in runs)
+        self_us = runs[-1][1]
+        imported = sorted(set(runs[-1][2]) & set(forbidden))
+
+        over = median_ms > budget_ms
+        failed = failed or over or len(imported) > 0
+        print(
+            f"{module:30s} {median_ms:7.0f} ms of {budget_ms:5.0f} ms "
+            f"({factor} x {baseline})"
+            f"{'  OVER BUDGET' if over else ''}"
+        )
+        for name, us in sorted(self_us.items(), key=lambda item: -item[1])[: args.top]:
+            print(f"  {name:40s} {us / 1000:7.1f} ms")
+        if imported:
+            print(f"  imports {', '.join(imported)} although it must not")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Benchmark of the offline build of the vector databases of driver and track
+names with a fake embeddings API.
+
+The fake API takes a fixed latency per request plus a time per name and
+rejects requests beyond its concurrency limit with 429. All names of the race
+results are embedded into a new collection once in a single request, like the
+build inside the server did before, and then in batches with several requests
+at the same time. At last a build fails after some batches and is resumed.
+Printed are the build time, the names embedded and the 429 answers:
+
+    python benchmarks/index_build.py --request-latency 0.2 --seconds-per-name 0.0005
+"""
+
+import argparse
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+import chromadb
+
+import fakes  # noqa: F401
+from americanmotocrossresults import admission, build_index, chat, names
+
+
+class FakeEmbeddings:
+    def __init__(
+        self,
+        request_latency: float,
+        seconds_per_name: float,
+        concurrency_limit: int,
+        fail_after: Optional[int] = None,
+    ):
+        self.request_latency = request_latency
+        self.seconds_per_name = seconds_per_name
+        self.concurrency_limit = concurrency_limit
+        self.fail_after = fail_after
+
+        self.requests = 0
+        self.embedded = 0
+        self.rate_limited = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            if self.fail_after is not None and self.requests >= self.fail_after:
+                raise RuntimeError("Connection to embeddings API lost")
+            if self._active >= self.concurrency_limit:
+                self.rate_limited += 1
+                raise admission.RateLimitedError("Fake embeddings API is overloaded")
+            self._active += 1
+            self.requests += 1
+
+        try:
+            time.sleep(self.request_latency + self.seconds_per_name * len(texts))
+        finally:
+            with self._lock:
+                self._active -= 1
+
+        with self._lock:
+            self.embedded += len(texts)
+
+        return [_vector(text) for text in texts]
+
+
+def _vector(text: str) -> List[float]:
+    return [byte / 255.0 for byte in hashlib.sha256(text.encode()).digest()[:16]]
+
+
+def run_build(
+    collection,
+    all_names: List[str],
+    embeddings: FakeEmbeddings,
+    batch_size: int,
+    concurrency: int,
+) -> dict:
+    start = time.perf_counter()
+    error = None
+    try:
+        build_index.build_collection(
+            collection, all_names, embeddings, batch_size, concurrency
+        )
+    except Exception as e:
+        error = e
+
+    return {
+        "seconds": time.perf_counter() - start,
+        "embedded": embeddings.embedded,
+        "rate_limited": embeddings.rate_limited,
+        "count": collection.count(),
+        "error": error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--request-latency", type=float, default=0.2)
+    parser.add_argument("--seconds-per-name", type=float, default=0.0005)
+    parser.add_argument("--concurrency-limit", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    race_results = chat._load_results_csv()
+    all_names = names.column_names(race_results["driver_name"]) + names.column_names(
+        race_results["track_name"]
+    )
+    print(f"{len(all_names)} names")
+
+    def new_embeddings(fail_after: Optional[int] = None) -> FakeEmbeddings:
+        return FakeEmbeddings(
+            args.request_latency,
+            args.seconds_per_name,
+            args.concurrency_limit,
+            fail_after,
+        )
+
+    failed = False
+    with tempfile.TemporaryDirectory() as path:
+        client = chromadb.PersistentClient(path=path)
+
+        scenarios = [
+            ("single request", len(all_names), 1),
+            ("batches of 256", 256, 1),
+            ("256 x 4 at once", 256, 4),
+            ("64 x 8 at once", 64, 8),
+        ]
+        for i, (name, batch_size, concurrency) in enumerate(scenarios):
+            collection = client.create_collection(f"names-{i}")
+            result = run_build(
+                collection, all_names, new_embeddings(), batch_size, concurrency
+            )
+            failed = failed or result["count"] != len(all_names)
+            print(
+                f"{name:16s} {result['seconds']:6.2f} s, {result['embedded']} names "
+                f"embedded, {result['rate_limited']} answers with 429"
+            )
+
+        collection = client.create_collection("names-resumed")
+        interrupted = run_build(collection, all_names, new_embeddings(3), 128, 2)
+        resumed = run_build(collection, all_names, new_embeddings(), 128, 2)
+        again = run_build(collection, all_names, new_embeddings(), 128, 2)
+        failed = (
+            failed
+            or interrupted["error"] is None
+            or resumed["count"] != len(all_names)
+            or again["embedded"] != 0
+        )
+        print(
+            f"interrupted      {interrupted['count']} names added before the error, "
+            f"resumed with {resumed['embedded']} names in {resumed['seconds']:.2f} s, "
+            f"{again['embedded']} names embedded by another build"
+        )
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
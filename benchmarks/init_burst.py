@@ -0,0 +1,127 @@
+"""
+Stress test of the lazy initialization of the race results and the name
+indexes by a burst of first requests after the start of the server.
+
+For every burst size a fresh process starts that many threads at the same
+time. Each thread does what the first steps of a chat request do: it makes
+sure the CSV file data is loaded and resolves a driver and a track name with
+the local name index. Printed are how often the CSV file was loaded and a name
+index was built, the time until all threads were done and the peak resident
+memory. The script exits with 1 if a burst loads more than a single request or
+its peak memory grows by more than allowed:
+
+    python benchmarks/init_burst.py --bursts 1 8 64 --max-growth-mb 20
+"""
+
+import argparse
+import json
+import logging
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import fakes  # noqa: F401
+from americanmotocrossresults import chat, drivers, names, tracks
+
+
+def run_burst(size: int) -> dict:
+    logging.disable(logging.CRITICAL)
+    names.NAME_INDEX_BACKEND = "local"
+
+    counts = {"csv_loads": 0, "index_builds": 0}
+    lock = threading.Lock()
+
+    def count(name: str):
+        with lock:
+            counts[name] += 1
+
+    load_results_csv = chat._load_results_csv
+
+    def counting_load_results_csv():
+        count("csv_loads")
+        return load_results_csv()
+
+    class CountingNameIndex(names.LocalNameIndex):
+        def __init__(self, *args, **kwargs):
+            count("index_builds")
+            super().__init__(*args, **kwargs)
+
+    chat._load_results_csv = counting_load_results_csv
+    names.LocalNameIndex = CountingNameIndex
+
+    barrier = threading.Barrier(size)
+    errors = []
+
+    def first_request():
+        barrier.wait()
+        try:
+            chat._ensure_snapshot()
+            drivers.get_drivers_batch(chat.RACE_RESULTS, ["Eli Tomac"])
+            tracks.get_tracks_batch(chat.RACE_RESULTS, ["Red Bud"])
+        except Exception as e:
+            errors.append(repr(e))
+
+    threads = [threading.Thread(target=first_request) for _ in range(size)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return {
+        **counts,
+        "seconds": time.perf_counter() - start,
+        "peak_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--bursts", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    parser.add_argument("--burst", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.burst is not None:
+        print(json.dumps(run_burst(args.burst)))
+        return
+
+    reports = {}
+    for size in args.bursts:
+        output = subprocess.run(
+            [sys.executable, __file__, "--burst", str(size)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        reports[size] = json.loads(output.strip().split("\n")[-1])
+
+    failed = False
+    first = reports[args.bursts[0]]
+    for size, report in reports.items():
+        print(
+            f"burst of {size:4d}: CSV loaded {report['csv_loads']}x, "
+            f"{report['index_builds']} name indexes built, done after "
+            f"{report['seconds'] * 1000:6.0f} ms, peak memory "
+            f"{report['peak_mb']:6.1f} MB"
+        )
+        for error in report["errors"][:3]:
+            print(f"  {error}")
+
+        failed = (
+            failed
+            or len(report["errors"]) > 0
+            or report["csv_loads"] != first["csv_loads"]
+            or report["index_builds"] != first["index_builds"]
+            or report["peak_mb"] - first["peak_mb"] > args.max_growth_mb
+        )
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Load test of the Gradio UI of the server of app.py with fake LLM and name index
+backends.
+
+The server is started in this process with the given queue settings. Then
+several levels of simultaneous chat sessions each send one query of
+benchmarks/queries.json with the Gradio client. Printed are the throughput,
+the delay until the server starts to answer a request, i.e. the time it waits
+in the queue, the time until the first update and the time until the answer is
+complete:
+
+    python benchmarks/load_test.py --sessions 8 32 128 --concurrency-limit 16
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import uvicorn
+from gradio_client import Client
+
+import fakes
+from americanmotocrossresults import chat
+
+# The repository is on the path after the import of fakes
+import app  # noqa: E402
+
+_started: Dict[str, float] = {}
+
+
+def _recording_chat(message, history, session_id=None):
+    # Time at which the server starts to answer, i.e. leaves the queue
+    _started[message] = time.perf_counter()
+    yield from chat.chat(message, history, session_id=session_id)
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p / 100.0 * len(ordered)))]
+
+
+def run_level(url: str, queries: List[Dict], sessions: int, level: int) -> Dict:
+    clients = [Client(url, verbose=False) for _ in range(sessions)]
+    barrier = threading.Barrier(sessions)
+
+    def _session(i: int):
+        # Unique messages to tell the requests apart on the server
+        message = f"{queries[i % len(queries)]['query']} (session {level}-{i})"
+        barrier.wait()
+
+        submitted = time.perf_counter()
+        first_update = None
+        try:
+            job = clients[i].submit(message=message, api_name="/chat")
+            for _ in job:
+                if first_update is None:
+                    first_update = time.perf_counter()
+            job.result()
+        except Exception as e:
+            logging.error(f"Session {i} failed: {e}")
+            return None
+
+        finished = time.perf_counter()
+        return {
+            "queue": _started[message] - submitted,
+            "first_update": (first_update or finished) - submitted,
+            "total": finished - submitted,
+        }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        results = list(executor.map(_session, range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.close()
+
+    return {
+        "completed": [result for result in results if result is not None],
+        "failed": sum(result is None for result in results),
+        "seconds": elapsed,
+    }
+
+
+def start_server(app) -> Tuple[str, uvicorn.Server]:
+    """Serve the application in a thread and return its URL and server."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error")
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    return f"http://127.0.0.1:{port}/", server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[8, 32, 128])
+    parser.add_argument("--concurrency-limit", type=int, default=app.CONCURRENCY_LIMIT)
+    parser.add_argument("--max-queue-size", type=int, default=app.MAX_QUEUE_SIZE)
+    parser.add_argument("--stream-interval", type=float, default=app.STREAM_INTERVAL)
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.disable(logging.ERROR)
+
+    fakes.setup_fake_backends(
+        fakes.load_queries(),
+        latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+    )
+    app.chat = _recording_chat
+
+    url, server = start_server(
+        app.create_app(
+            concurrency_limit=args.concurrency_limit,
+            max_queue_size=args.max_queue_size,
+            stream_interval=args.stream_interval,
+        )
+    )
+
+    print(
+        f"concurrency limit {args.concurrency_limit}, max queue size "
+        f"{args.max_queue_size or 'unlimited'}, stream interval "
+        f"{args.stream_interval} s"
+    )
+    try:
+        for level, sessions in enumerate(args.sessions):
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_level(url, fakes.load_queries(), sessions, level)
+
+            completed = result["completed"]
+            line = (
+                f"{sessions:4d} sessions: {len(completed) / result['seconds']:5.2f} "
+                f"answers/s, {result['failed']} failed"
+            )
+            for name in ("queue", "first_update", "total"):
+                values = [r[name] * 1000 for r in completed]
+                if values:
+                    line += (
+                        f", {name} p50 {percentile(values, 50):6.0f} ms "
+                        f"p95 {percentile(values, 95):6.0f} ms"
+                    )
+            print(line)
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Benchmark of the race results written as partitions by year and class against
+the whole CSV file data in memory.
+
+The partitions are written to a temporary directory. Then each variant runs
+the searches of the headlines of benchmarks/queries.json in a fresh process,
+so that the resident memory of one variant is not hidden by the other. Printed
+are the time until the data can be searched, the retrieval latency per kind of
+query, the partitions touched and the growth of the resident memory. Both
+variants must find the same rows. With --kinds only the queries of these kinds
+are run, e.g. the ones naming a year or a class:
+
+    python benchmarks/partitions.py --kinds driver_year track_class table
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import logging
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import fakes
+from americanmotocrossresults import chat, partitions
+from soak_memory import resident_memory_mb
+
+
+def load_queries(kinds: Optional[List[str]]) -> List[Dict]:
+    return [
+        query
+        for query in fakes.load_queries()
+        if kinds is None or query["kind"] in kinds
+    ]
+
+
+def measure(variant: str, directory: str, kinds: Optional[List[str]]) -> dict:
+    logging.disable(logging.CRITICAL)
+
+    gc.collect()
+    before = resident_memory_mb()
+
+    if variant == "partitioned":
+        partitions.PARTITIONS_DIR = directory
+
+    start = time.perf_counter()
+    chat._load_snapshot()
+    load_ms = (time.perf_counter() - start) * 1000
+    gc.collect()
+    loaded_mb = resident_memory_mb() - before
+
+    queries = load_queries(kinds)
+    fakes.setup_fake_backends(queries, embedding_latency=0.0)
+
+    latencies = {}
+    touched = {}
+    found = {}
+    for query in queries:
+        lines = chat._get_headline_lines(query["headlines"])
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            builder = chat._SearchCriteriaBuilder(
+                chat.RACE_RESULTS, executor, race_partitions=chat.RACE_PARTITIONS
+            )
+            for line in lines:
+                builder.add(line)
+            search_criterias = builder.resolve()
+
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = builder.filter()
+                chat._render_results(results)
+            elapsed = (time.perf_counter() - start) * 1000
+
+        latencies.setdefault(query["kind"], []).append(elapsed)
+        if chat.RACE_PARTITIONS is not None:
+            touched[query["query"]] = len(chat.RACE_PARTITIONS.prune(search_criterias))
+        found[query["query"]] = sorted(int(row_id) for row_id in results.index)
+
+    gc.collect()
+
+    return {
+        "load_ms": load_ms,
+        "loaded_mb": loaded_mb,
+        "rss_mb": resident_memory_mb() - before,
+        "latencies": latencies,
+        "touched": touched,
+        "found": found,
+        "loaded_partitions": (
+            chat.RACE_PARTITIONS.loaded_partitions()
+            if chat.RACE_PARTITIONS is not None
+            else None
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--variant", choices=["full", "partitioned"])
+    parser.add_argument("--directory")
+    parser.add_argument("--kinds", nargs="+")
+    args = parser.parse_args()
+
+    if args.variant is not None:
+        print(json.dumps(measure(args.variant, args.directory, args.kinds)))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        race_results = chat._load_results_csv()
+        partitions.write_partitions(
+            race_results,
+            directory,
+            chat._get_dataset_version(),
+            chat._headline_data(race_results),
+        )
+        num_of_partitions = race_results.groupby(
+            partitions.PARTITION_COLUMNS, observed=True, dropna=False
+        ).ngroups
+        del race_results
+
+        reports = {}
+        for variant in ("full", "partitioned"):
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--variant",
+                    variant,
+                    "--directory",
+                    directory,
+                ]
+                + (["--kinds"] + args.kinds if args.kinds else []),
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            reports[variant] = json.loads(output.strip().split("\n")[-1])
+
+    for variant, report in reports.items():
+        print(
+            f"{variant:11s} ready after {report['load_ms']:6.0f} ms with "
+            f"{report['loaded_mb']:+6.1f} MB, after all queries {report['rss_mb']:+6.1f} MB"
+        )
+        for kind, latencies in report["latencies"].items():
+            line = (
+                f"  {kind:22s} retrieval median {statistics.median(latencies):6.1f} ms"
+            )
+            if variant == "partitioned":
+                touched = [
+                    report["touched"][query["query"]] for query in load_queries([kind])
+                ]
+                line += (
+                    f", {statistics.median(touched):4.1f} of {num_of_partitions} "
+                    "partitions"
+                )
+            print(line)
+
+    print(
+        f"partitions loaded after all queries: "
+        f"{reports['partitioned']['loaded_partitions']} of {num_of_partitions}"
+    )
+
+    if reports["full"]["found"] != reports["partitioned"]["found"]:
+        different = [
+            query
+            for query, rows in reports["full"]["found"].items()
+            if reports["partitioned"]["found"].get(query) != rows
+        ]
+        print(f"Different rows found for: {different}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+End-to-end benchmark of the chatbot pipeline with fake LLM and name index
+backends.
+
+Every query of benchmarks/queries.json is sent through chat.chat at several
+levels of concurrent sessions. The latency percentiles per pipeline stage, the
+number of retrieved rows, the prompt tokens and the throughput are printed and
+written to a JSON file, so that results of different commits can be compared:
+
+    python benchmarks/pipeline.py --output before.json
+    python benchmarks/pipeline.py --output after.json --compare before.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import fakes
+from americanmotocrossresults import chat, metrics
+
+_current = threading.local()
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentile with the nearest-rank method."""
+    if len(values) == 0:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100.0 * len(ordered)))
+
+    return ordered[rank - 1]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else 0.0,
+    }
+
+
+def run_level(queries: List[Dict], concurrency: int, requests: int) -> Dict:
+    traces = []
+
+    def _collect(trace: metrics.Trace):
+        traces.append((_current.kind, trace))
+
+    def _session(query: Dict):
+        _current.kind = query["kind"]
+        for _ in chat.chat(query["query"], []):
+            pass
+
+    metrics.TRACE_HANDLERS.append(_collect)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [
+                executor.submit(_session, queries[i % len(queries)])
+                for i in range(requests)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - start
+    finally:
+        metrics.TRACE_HANDLERS.remove(_collect)
+
+    stage_names = sorted({name for _, trace in traces for name in trace.stages})
+    counter_names = sorted({name for _, trace in traces for name in trace.counters})
+
+    stages = {
+        name: summarize(
+            [trace.stages[name] * 1000 for _, trace in traces if name in trace.stages]
+        )
+        for name in stage_names
+    }
+    counters = {
+        name: summarize([trace.counters.get(name, 0) for _, trace in traces])
+        for name in counter_names
+    }
+
+    rows_per_kind = {}
+    for kind, trace in traces:
+        rows_per_kind.setdefault(kind, []).append(trace.counters.get("results", 0))
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(traces),
+        "seconds": elapsed,
+        "throughput_rps": len(traces) / elapsed,
+        "stages_ms": stages,
+        "counters": counters,
+        "rows_per_kind": {
+            kind: summarize(rows) for kind, rows in rows_per_kind.items()
+        },
+    }
+
+
+def print_level(level: Dict):
+    print(
+        f"\nconcurrency {level['concurrency']}: {level['requests']} requests in "
+        f"{level['seconds']:.2f} s, {level['throughput_rps']:.2f} requests/s"
+    )
+    for name, stats in level["stages_ms"].items():
+        print(
+            f"  {name:22s} p50 {stats['p50']:8.1f} ms  p95 {stats['p95']:8.1f} ms  "
+            f"p99 {stats['p99']:8.1f} ms"
+        )
+    for name, stats in level["counters"].items():
+        print(f"  {name:22s} mean {stats['mean']:10.1f}  p95 {stats['p95']:10.1f}")
+
+
+def print_comparison(baseline: Dict, report: Dict):
+    print("\nchange against baseline (p50 / p95):")
+    for key, level in report["levels"].items():
+        base = baseline["levels"].get(key)
+        if base is None:
+            continue
+
+        for name, stats in level["stages_ms"].items():
+            base_stats = base["stages_ms"].get(name)
+            if base_stats is None or base_stats["p50"] == 0:
+                continue
+
+            print(
+                f"  concurrency {key:>3s} {name:22s} "
+                f"{_change(base_stats['p50'], stats['p50'])} / "
+                f"{_change(base_stats['p95'], stats['p95'])}"
+            )
+
+
+def _change(before: float, after: float) -> str:
+    if before == 0:
+        return "n/a"
+
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=None,
+        help="requests per concurrency level, default: twice the concurrency "
+        "but at least the size of the query corpus",
+    )
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.15)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="JSON file of a former run")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries,
+        latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        embedding_latency=args.embedding_latency,
+    )
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": vars(args),
+        "levels": {},
+    }
+
+    for concurrency in args.concurrency:
+        requests = args.requests or max(len(queries), 2 * concurrency)
+
+        # The pipeline prints the whole LLM conversation, which is not part
+        # of the benchmark output.
+        with contextlib.redirect_stdout(io.StringIO()):
+            level = run_level(queries, concurrency, requests)
+
+        report["levels"][str(concurrency)] = level
+        print_level(level)
+
+    output = args.output or f"pipeline-{commit}.json"
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare, "r") as file:
+            print_comparison(json.load(file), report)
+
+
+if __name__ == "__main__":
+    main()
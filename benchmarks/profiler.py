@@ -0,0 +1,116 @@
+"""
+Profile of chat calls taken with the sampling profiler of the HTTP API, with
+fake LLM and name index backends.
+
+The server of app.py is started in this process with the profiler enabled.
+The queries of benchmarks/queries.json are sent to POST /api/chat once without
+and once with the profiler started by POST /api/profile. Printed are the
+latency of both rounds, the share of the samples per pipeline step and the
+functions most samples ended in. The folded stacks are written to a file for
+flamegraph.pl:
+
+    python benchmarks/profiler.py --output profile.folded
+    flamegraph.pl profile.folded > profile.svg
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+
+import fakes
+from americanmotocrossresults import profiler
+from load_test import start_server
+
+# The repository is on the path after the import of fakes
+import app  # noqa: E402
+
+
+def run_queries(url: str, queries: List[Dict], sessions: int) -> List[float]:
+    client = httpx.Client(base_url=url, timeout=120)
+
+    def _ask(query: Dict) -> float:
+        start = time.perf_counter()
+        with client.stream("POST", "/api/chat", json={"query": query["query"]}) as r:
+            for _ in r.iter_lines():
+                pass
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        return list(executor.map(_ask, queries))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=profiler.PROFILE_INTERVAL)
+    parser.add_argument("--output", default="profile.folded")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(queries)
+    profiler.PROFILER_ENABLED = True
+    url, server = start_server(app.create_app())
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Untimed round to load everything
+            run_queries(url, queries[:2], 1)
+            plain = run_queries(url, queries, args.sessions)
+
+            response = httpx.post(
+                f"{url}api/profile",
+                json={"calls": len(queries), "interval": args.interval},
+            )
+            response.raise_for_status()
+            profiled = run_queries(url, queries, args.sessions)
+
+        status = httpx.get(f"{url}api/profile").json()
+        folded = httpx.get(f"{url}api/profile/folded").text
+    finally:
+        server.should_exit = True
+
+    with open(args.output, "w") as file:
+        file.write(folded)
+
+    print(
+        f"total median without profiler {statistics.median(plain) * 1000:6.0f} ms, "
+        f"with profiler {statistics.median(profiled) * 1000:6.0f} ms"
+    )
+    print(
+        f"{status['profiled_calls']} calls profiled, {status['samples']} samples "
+        f"every {status['interval'] * 1000:.0f} ms, written to {args.output}"
+    )
+
+    steps = {}
+    leaves = {}
+    for line in folded.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        frames = stack.split(";")
+        step = frames[1] if len(frames) > 1 and ":" not in frames[1] else "other"
+        steps[step] = steps.get(step, 0) + int(count)
+        leaves[frames[-1]] = leaves.get(frames[-1], 0) + int(count)
+
+    total = max(sum(steps.values()), 1)
+    print("samples per pipeline step:")
+    for step, count in sorted(steps.items(), key=lambda item: -item[1]):
+        print(f"  {step:16s} {100 * count / total:5.1f} %")
+
+    print("functions most samples ended in:")
+    for leaf, count in sorted(leaves.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {leaf:48s} {100 * count / total:5.1f} %")
+
+    if status["profiled_calls"] != len(queries) or status["samples"] == 0:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
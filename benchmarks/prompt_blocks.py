@@ -0,0 +1,106 @@
+"""
+Benchmark of rendering result sets of 1,000 races for the prompt, once with
+RaceResult objects formatted per request and once by concatenation of the
+prompt blocks rendered when the race results are loaded. Both texts are
+checked to be equal:
+
+    python benchmarks/prompt_blocks.py --races 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import americanmotocrossresults as amr  # noqa: E402
+from americanmotocrossresults import chat  # noqa: E402
+
+
+def with_races(race_results, races: int):
+    """Repeat the races of the CSV file under other sources up to the count."""
+    copies = [race_results]
+    num_races = race_results["source"].nunique()
+    while len(copies) * num_races < races:
+        copy = race_results.copy()
+        copy["source"] = copy["source"].astype(str) + f"#{len(copies)}"
+        copies.append(copy)
+
+    race_results = pd.concat(copies, ignore_index=True)
+    race_results["source"] = race_results["source"].astype("category")
+
+    return race_results
+
+
+def render_objects(results, max_position: int) -> str:
+    race_results = amr.from_dataframe_to_race_results(results)
+    return "\n".join(
+        race_result.as_prompt(
+            only_top10=max_position == 10, only_top3=max_position == 3
+        )
+        for race_result in race_results
+    )
+
+
+def render_blocks(blocks, results, max_position: int) -> str:
+    return "\n".join(blocks.render(results, max_position))
+
+
+def best_of(runs: int, function, *args):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        text = function(*args)
+        timings.append(time.perf_counter() - start)
+
+    return text, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--races", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    race_results = with_races(chat._load_results_csv(), args.races)
+
+    start = time.perf_counter()
+    blocks = amr.RacePromptBlocks(race_results)
+    print(f"ingestion: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    sources = race_results["source"].drop_duplicates().head(args.races)
+    complete_races = race_results[race_results["source"].isin(sources)]
+    # Every other row, so that no race is complete
+    partial_races = complete_races.iloc[::2]
+
+    failed = False
+    for name, results in (
+        ("complete races", complete_races),
+        ("partial races", partial_races),
+    ):
+        for max_position in amr.RacePromptBlocks.MAX_POSITIONS:
+            expected, objects_time = best_of(
+                args.runs, render_objects, results, max_position
+            )
+            text, blocks_time = best_of(
+                args.runs, render_blocks, blocks, results, max_position
+            )
+            equal = text == expected
+            failed = failed or not equal
+
+            print(
+                f"{name:15s} top {max_position:2d}: {len(results):6d} rows, "
+                f"objects {objects_time * 1000:7.1f} ms, "
+                f"blocks {blocks_time * 1000:6.1f} ms, "
+                f"{'equal' if equal else 'DIFFERENT'}"
+            )
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
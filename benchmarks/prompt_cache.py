@@ -0,0 +1,126 @@
+"""
+Benchmark of the prompt caching of the upstream for both LLM calls.
+
+First it is checked that all messages but the ones of the request are the same
+for every query of benchmarks/queries.json. Then chat sessions of several turns
+cycle through the queries with a fake LLM that caches prompt prefixes like the
+OpenAI API and processes only the prompt tokens not cached. Printed are the
+share of cached prompt tokens and the latency of both LLM stages, once with the
+minimum of cached tokens of the OpenAI API and once without minimum like the
+prefix caching of vLLM:
+
+    python benchmarks/prompt_cache.py --sessions 5 --turns 6
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import statistics
+
+import fakes
+from americanmotocrossresults import chat, metrics
+
+
+def prefix_tokens(queries) -> dict:
+    """
+    Return the estimated tokens of the messages shared by all queries per
+    stage, or None for a stage whose messages before the request differ.
+    """
+    rendered = chat._render_results(chat.RACE_RESULTS.head(0))
+    prefixes = {
+        "headlines": [
+            chat._create_headline_messages(chat.RACE_RESULTS, query["query"], [])[:-1]
+            for query in queries
+        ],
+        "final": [
+            chat._create_final_messages(query["query"], rendered, {}, [])[:-1]
+            for query in queries
+        ],
+    }
+
+    tokens = {}
+    for stage, messages in prefixes.items():
+        if any(prefix != messages[0] for prefix in messages):
+            tokens[stage] = None
+        else:
+            tokens[stage] = sum(
+                metrics.estimate_tokens(msg["content"]) for msg in messages[0]
+            )
+
+    return tokens
+
+
+def run_sessions(queries, sessions: int, turns: int):
+    traces = []
+    metrics.TRACE_HANDLERS.append(traces.append)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(sessions):
+                history = []
+                for turn in range(turns):
+                    query = queries[(i + turn * sessions) % len(queries)]["query"]
+
+                    response = ""
+                    for response in chat.chat(query, history, session_id=str(i)):
+                        pass
+
+                    history.append({"role": "user", "content": query})
+                    history.append({"role": "assistant", "content": response})
+    finally:
+        metrics.TRACE_HANDLERS.remove(traces.append)
+
+    return traces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=2000.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(queries, embedding_latency=0.0)
+
+    for stage, tokens in prefix_tokens(queries).items():
+        if tokens is None:
+            print(f"{stage:9s} messages before the request differ between queries")
+        else:
+            print(f"{stage:9s} shared prefix of {tokens} tokens")
+
+    failed = False
+    for name, min_tokens in (("min 1024", 1024), ("no min", 0)):
+        fakes.setup_fake_backends(
+            queries,
+            tokens_per_second=None,
+            embedding_latency=0.0,
+            prompt_tokens_per_second=args.prompt_tokens_per_second,
+            prompt_cache_min_tokens=min_tokens,
+        )
+        traces = run_sessions(queries, args.sessions, args.turns)
+
+        prompt_tokens = sum(t.counters.get("llm_prompt_tokens", 0) for t in traces)
+        cached_tokens = sum(t.counters.get("llm_cached_tokens", 0) for t in traces)
+        headlines = [t.stages["headlines"] * 1000 for t in traces]
+        final = [
+            t.stages["final_response"] * 1000
+            for t in traces
+            if "final_response" in t.stages
+        ]
+        failed = failed or prompt_tokens == 0
+        print(
+            f"{name:9s} cached {cached_tokens:6d} of {prompt_tokens:6d} prompt "
+            f"tokens ({100 * cached_tokens / max(prompt_tokens, 1):4.1f} %), "
+            f"headlines median {statistics.median(headlines):5.0f} ms, "
+            f"final answer median {statistics.median(final):5.0f} ms"
+        )
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
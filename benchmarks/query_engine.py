@@ -0,0 +1,191 @@
+"""
+Benchmark of the pandas filter against the SQLite query engine for typical
+question types.
+
+Every question is answered once with the headlines the LLM gives without the
+query engine, i.e. lists of single values, and once with the headlines of the
+query engine, i.e. ranges, comparisons and aggregates. Printed are the rows
+handed to the final LLM call, its estimated prompt tokens, the retrieval time
+and whether the rows give the correct answer, which is computed from the whole
+data. The script exits with 1 if an answer is wrong:
+
+    python benchmarks/query_engine.py
+"""
+
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import fakes
+from americanmotocrossresults import chat, metrics, query
+
+
+def is_yamaha(rows: pd.DataFrame) -> pd.Series:
+    # The data spells the brand "Yamaha", "YAM", "YZ" and even "AYMAHA"
+    return rows["mx_bike"].astype(str).str.upper().str.contains("YAM|YZ|AYMAHA")
+
+
+def podiums_2010_2015(rows: pd.DataFrame) -> pd.Series:
+    podiums = rows[rows["year"].between(2010, 2015) & (rows["position"] <= 3)]
+    return podiums["position"]
+
+
+def yamaha_wins_per_driver(rows: pd.DataFrame) -> pd.Series:
+    wins = rows[is_yamaha(rows) & (rows["position"] == 1)]
+    return wins["driver_name"].astype(str).value_counts()
+
+
+def yamaha_wins_2019(rows: pd.DataFrame) -> pd.Series:
+    wins = is_yamaha(rows) & (rows["year"] == 2019) & (rows["position"] == 1)
+    return pd.Series({"wins": int(wins.sum())})
+
+
+def tomac_podiums_per_year(rows: pd.DataFrame) -> pd.Series:
+    tomac = rows[rows["driver_name"] == "Eli Tomac"]
+    return (tomac["position"] <= 3).groupby(tomac["year"], dropna=False).sum()
+
+
+def dungey_2010(rows: pd.DataFrame) -> pd.Series:
+    dungey = rows[(rows["driver_name"] == "Ryan Dungey") & (rows["year"] == 2010)]
+    return dungey["position"]
+
+
+# Question, headlines without and with the query engine and the answer to the
+# question computed from race rows
+QUESTIONS = [
+    (
+        "Podium results from 2010 to 2015",
+        "\n".join(f"year: {year}" for year in range(2010, 2016)),
+        "year: 2010..2015\nposition: <= 3",
+        podiums_2010_2015,
+    ),
+    (
+        "Which drivers won the most races on a Yamaha?",
+        "position: 1",
+        "mx_brand: Yamaha\ngroup_by: driver_name\naggregate: wins\ntop: 10",
+        yamaha_wins_per_driver,
+    ),
+    (
+        "How many races did Yamaha win in 2019?",
+        "year: 2019\nposition: 1",
+        "mx_brand: Yamaha\nyear: 2019\naggregate: wins",
+        yamaha_wins_2019,
+    ),
+    (
+        "How many podiums had Eli Tomac per year?",
+        "driver_name: Eli Tomac",
+        "driver_name: Eli Tomac\ngroup_by: year\naggregate: podiums",
+        tomac_podiums_per_year,
+    ),
+    (
+        "All results of Ryan Dungey in 2010",
+        "driver_name: Ryan Dungey\nyear: 2010",
+        "driver_name: Ryan Dungey\nyear: 2010",
+        dungey_2010,
+    ),
+]
+
+
+def retrieve(question: str, headlines: str, engine: str, runs: int):
+    query.QUERY_ENGINE = engine
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            builder = chat._SearchCriteriaBuilder(chat.RACE_RESULTS, executor)
+            for line in headlines.split("\n"):
+                builder.add(line)
+            search_criterias, results = builder.build()
+        timings.append(time.perf_counter() - start)
+
+    aggregated = builder.is_aggregated()
+    rendered = chat._render_results(results, aggregated)
+    messages = chat._create_final_messages(question, rendered, search_criterias, [])
+    tokens = sum(metrics.estimate_tokens(msg["content"]) for msg in messages)
+
+    return results, aggregated, tokens, min(timings)
+
+
+def get_answer(results: pd.DataFrame, aggregated: bool, answer) -> pd.Series:
+    """
+    Return the answer given by the results. Race rows are answered like the
+    final LLM call would, aggregates are read from the table.
+    """
+    if not aggregated:
+        return answer(chat.RACE_RESULTS.loc[results.index])
+
+    aggregates = [column for column in results.columns if column in query.AGGREGATES]
+    group_by = [column for column in results.columns if column not in aggregates]
+    if not group_by:
+        return results[aggregates].iloc[0]
+
+    return results.set_index(group_by)[aggregates[0]]
+
+
+def is_correct(given: pd.Series, expected: pd.Series) -> bool:
+    """
+    Return True if the answer equals the expected one. An answer limited to
+    the top groups must have the largest values, ties may differ.
+    """
+    if len(given) < len(expected):
+        top = expected.sort_values(ascending=False).head(len(given))
+        expected_values = as_dict(expected)
+        return list(given.sort_values(ascending=False)) == list(top) and all(
+            expected_values.get(key) == value for key, value in as_dict(given).items()
+        )
+
+    return as_dict(given) == as_dict(expected)
+
+
+def as_dict(answer: pd.Series) -> dict:
+    # Missing keys like an unknown year are NaN, which equals no other NaN
+    return {None if pd.isna(key) else key: value for key, value in answer.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    fakes.setup_fake_backends(
+        fakes.load_queries(), latency=0.0, tokens_per_second=None, embedding_latency=0.0
+    )
+
+    # Load the SQLite database before measuring
+    query.get_engine(chat.RACE_RESULTS)
+
+    wrong = []
+    print(
+        f"{'question':48s} {'engine':7s} {'rows':>6s} {'tokens':>7s} {'ms':>7s} "
+        "correct"
+    )
+    for question, pandas_headlines, sqlite_headlines, answer in QUESTIONS:
+        expected = answer(chat.RACE_RESULTS)
+        for engine, headlines in (
+            ("pandas", pandas_headlines),
+            ("sqlite", sqlite_headlines),
+        ):
+            results, aggregated, tokens, seconds = retrieve(
+                question, headlines, engine, args.runs
+            )
+            correct = is_correct(get_answer(results, aggregated, answer), expected)
+            if not correct:
+                wrong.append(f"{question} ({engine})")
+            print(
+                f"{question[:48]:48s} {engine:7s} {len(results):6d} {tokens:7d} "
+                f"{seconds * 1000:7.1f} {'yes' if correct else 'NO'}"
+            )
+
+    if wrong:
+        print(f"Wrong answers for: {wrong}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
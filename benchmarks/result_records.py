@@ -0,0 +1,59 @@
+"""
+Benchmark of time and memory to turn 15,000 retrieved rows into RaceResult
+objects and to render them for the prompt:
+
+    python benchmarks/result_records.py
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import americanmotocrossresults as amr  # noqa: E402
+from americanmotocrossresults import chat  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rows", type=int, default=15000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    df = chat._load_results_csv().head(args.rows)
+
+    timings = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        amr.from_dataframe_to_race_results(df)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    race_results = amr.from_dataframe_to_race_results(df)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    prompt = "\n".join(race_result.as_prompt() for race_result in race_results)
+    render_time = time.perf_counter() - start
+
+    num_results = sum(len(race_result.results) for race_result in race_results)
+    print(f"{len(race_results)} races with {num_results} results")
+    print(f"build:  best {min(timings) * 1000:.1f} ms of {args.runs} runs")
+    print(
+        f"memory: {current / 1024:.0f} KiB retained, {peak / 1024:.0f} KiB peak, "
+        f"{current / max(num_results, 1):.0f} bytes per result"
+    )
+    print(f"render: {render_time * 1000:.1f} ms for {len(prompt)} characters")
+    print(
+        "parse statistics: "
+        f"{len(amr.PARSE_STATISTICS.riders)} riders, "
+        f"{len(amr.PARSE_STATISTICS.race_results)} race results"
+    )
+
+
+if __name__ == "__main__":
+    main()
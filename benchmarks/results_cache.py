@@ -0,0 +1,70 @@
+"""
+Benchmark of the retrieval time with and without the results cache.
+
+The query corpus is asked several times by different sessions, like popular
+riders are asked for by many users. Printed are the median and p95 of the
+retrieval stage, which covers filtering and rendering of the results:
+
+    python benchmarks/results_cache.py --rounds 5
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import statistics
+
+import fakes
+from americanmotocrossresults import cache, chat, metrics
+
+
+def run(queries, rounds: int, cache_size: int):
+    cache.RESULTS_CACHE.max_entries = cache_size
+    cache.RESULTS_CACHE.clear()
+
+    traces = []
+    metrics.TRACE_HANDLERS.append(traces.append)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for round in range(rounds):
+                for i, query in enumerate(queries):
+                    session_id = f"{cache_size}-{round}-{i}"
+                    for _ in chat.chat(query["query"], [], session_id=session_id):
+                        pass
+    finally:
+        metrics.TRACE_HANDLERS.remove(traces.append)
+
+    timings = sorted(
+        trace.stages["retrieval"] * 1000
+        for trace in traces
+        if "retrieval" in trace.stages
+    )
+    hits = sum(trace.counters.get("results_cache_hits", 0) for trace in traces)
+
+    return timings, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--cache-size", type=int, default=cache.RESULTS_CACHE_SIZE)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries, latency=0.0, tokens_per_second=None, embedding_latency=0.0
+    )
+
+    for name, cache_size in (("no cache", 0), ("cache", args.cache_size)):
+        timings, hits = run(queries, args.rounds, cache_size)
+        p95 = timings[int(0.95 * (len(timings) - 1))]
+        print(
+            f"{name:9s} retrieval median {statistics.median(timings):6.1f} ms, "
+            f"p95 {p95:6.1f} ms, {hits} of {len(timings)} from cache"
+        )
+
+
+if __name__ == "__main__":
+    main()
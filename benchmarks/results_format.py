@@ -0,0 +1,203 @@
+"""
+Comparison of the compact format of the race results in the final prompt with
+the Markdown format.
+
+The results of every query of benchmarks/queries.json are rendered in both
+formats. Printed are the estimated tokens of the results and of the whole
+final prompt per kind of query. The rows read back from the compact text must
+equal the retrieved rows, so the compact format drops nothing the LLM needs.
+
+With --model the LLM answers questions with a known answer about the results
+in both formats, e.g. how many results are wins or the race number of a driver
+at an event, and the correct answers are counted per format:
+
+    python benchmarks/results_format.py --model gpt-4o-mini --max-rows 200
+"""
+
+import argparse
+import logging
+import random
+import re
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import fakes
+from americanmotocrossresults import chat, compact, llm, metrics
+
+FORMATS = ["markdown", "compact"]
+
+COLUMNS = [
+    "track_name",
+    "track_location",
+    "race_date",
+    "class_name",
+    "position",
+    "number",
+    "driver_name",
+    "mx_bike",
+]
+
+SYSTEM_PROMPT = "Answer the question about the race results with a number only."
+
+
+def retrieve(query: Dict) -> Tuple[Dict, pd.DataFrame]:
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        builder = chat._SearchCriteriaBuilder(chat.RACE_RESULTS, executor)
+        for line in chat._get_headline_lines(query["headlines"]):
+            builder.add(line)
+        return builder.build()
+
+
+def render(results: pd.DataFrame, results_format: str) -> "chat.RenderedResults":
+    chat.RESULTS_FORMAT = results_format
+    return chat._render_results(results)
+
+
+def listed_rows(results: pd.DataFrame) -> pd.DataFrame:
+    """Return the rows given to the LLM in the order of the compact format."""
+    listed = results.sort_values(by=["source", "position"])
+    return listed[listed["position"] <= chat._max_position(len(results))]
+
+
+def is_lossless(results: pd.DataFrame) -> bool:
+    rendered = compact.render_compact_results(results, chat._max_position(len(results)))
+    parsed = pd.DataFrame(compact.parse_compact_results(rendered), columns=COLUMNS)
+
+    expected = listed_rows(results)[COLUMNS].astype(object)
+    expected = expected.where(expected.notna(), None)
+    # Races of one event are listed together, so the order may differ
+    key = ["track_name", "race_date", "class_name", "position", "driver_name"]
+    parsed = parsed.sort_values(by=key, na_position="first", kind="stable")
+    expected = expected.sort_values(by=key, na_position="first", kind="stable")
+
+    return (
+        parsed.reset_index(drop=True)
+        .astype(str)
+        .equals(expected.reset_index(drop=True).astype(str))
+    )
+
+
+def questions(rows: pd.DataFrame, rng: random.Random) -> List[Tuple[str, int]]:
+    """Return questions about the listed rows together with their answers."""
+    driver = rows["driver_name"].value_counts().index[0]
+    row = rows.iloc[rng.randrange(len(rows))]
+
+    return [
+        (
+            "How many of the listed results are wins, i.e. position 1?",
+            int((rows["position"] == 1).sum()),
+        ),
+        (
+            "How many different drivers are listed?",
+            int(rows["driver_name"].nunique()),
+        ),
+        (
+            f"How many results of {driver} are listed?",
+            int((rows["driver_name"] == driver).sum()),
+        ),
+        (
+            f"Which race number had {row['driver_name']} in class "
+            f"{row['class_name']} at {row['track_name']} on {row['race_date']}?",
+            int(row["number"]),
+        ),
+    ]
+
+
+def ask(model: str, results_txt: str, question: str) -> Optional[int]:
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"{results_txt}\n\n{question}"},
+    ]
+    answer = llm.chat_completion(model, messages) or ""
+    match = re.search(r"-?[0-9]+", answer.replace(",", ""))
+
+    return int(match.group(0)) if match else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--model", help="LLM answering the questions, e.g. gpt-4o-mini")
+    parser.add_argument("--max-rows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(queries, embedding_latency=0.0)
+    rng = random.Random(args.seed)
+
+    tokens = {}
+    lossy = []
+    correct = {results_format: 0 for results_format in FORMATS}
+    asked = 0
+    for query in queries:
+        search_criterias, results = retrieve(query)
+        if len(results) == 0 or "source" not in results.columns:
+            continue
+
+        rendered = {}
+        for results_format in FORMATS:
+            rendered[results_format] = render(results, results_format)
+            messages = chat._create_final_messages(
+                query["query"], rendered[results_format], search_criterias, []
+            )
+            tokens.setdefault(query["kind"], {}).setdefault(results_format, []).append(
+                (
+                    metrics.estimate_tokens(rendered[results_format].results_txt),
+                    sum(metrics.estimate_tokens(msg["content"]) for msg in messages),
+                )
+            )
+
+        if not is_lossless(results):
+            lossy.append(query["query"])
+
+        if args.model is None or len(results) > args.max_rows:
+            continue
+
+        for question, expected in questions(listed_rows(results), rng):
+            asked += 1
+            for results_format in FORMATS:
+                answer = ask(args.model, rendered[results_format].results_txt, question)
+                correct[results_format] += answer == expected
+
+    totals = {results_format: [0, 0] for results_format in FORMATS}
+    for kind, per_format in tokens.items():
+        line = f"{kind:14s}"
+        for results_format in FORMATS:
+            results_tokens = [t for t, _ in per_format[results_format]]
+            prompt_tokens = [t for _, t in per_format[results_format]]
+            totals[results_format][0] += sum(results_tokens)
+            totals[results_format][1] += sum(prompt_tokens)
+            line += (
+                f"  {results_format} results median {statistics.median(results_tokens):7.0f}"
+                f", prompt {statistics.median(prompt_tokens):7.0f}"
+            )
+        print(line)
+
+    markdown, compact_totals = totals["markdown"], totals["compact"]
+    print(
+        f"all queries    results {markdown[0]} -> {compact_totals[0]} tokens "
+        f"({100 * (compact_totals[0] / markdown[0] - 1):+.0f} %), whole prompts "
+        f"{markdown[1]} -> {compact_totals[1]} tokens "
+        f"({100 * (compact_totals[1] / markdown[1] - 1):+.0f} %)"
+    )
+
+    if asked > 0:
+        print(
+            ", ".join(
+                f"{results_format} {correct[results_format]} of {asked} answers correct"
+                for results_format in FORMATS
+            )
+        )
+
+    if lossy:
+        print(f"Compact results differ from the retrieved rows for: {lossy}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Soak test of the memory of a long-running server.
+
+Thousands of chat turns run against fake LLM and name index backends. The
+resident memory after a warm-up is compared with the resident memory at the
+end. The script exits with status 1 if it grew by more than the allowed
+amount:
+
+    python benchmarks/soak_memory.py --turns 5000 --max-growth-mb 20
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import logging
+import os
+import resource
+import sys
+
+import fakes
+import americanmotocrossresults as amr
+from americanmotocrossresults import chat
+
+
+def resident_memory_mb() -> float:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        # Peak instead of current memory on systems without procfs
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_turns(queries, first_turn: int, turns: int, sessions: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(first_turn, first_turn + turns):
+            query = queries[turn % len(queries)]
+            for _ in chat.chat(query["query"], [], session_id=str(turn % sessions)):
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--max-growth-mb", type=float, default=20.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(
+        queries, latency=0.0, tokens_per_second=None, embedding_latency=0.0
+    )
+
+    run_turns(queries, 0, args.warmup, args.sessions)
+    gc.collect()
+    before = resident_memory_mb()
+
+    step = max(args.turns // 10, 1)
+    for first_turn in range(args.warmup, args.warmup + args.turns, step):
+        run_turns(queries, first_turn, step, args.sessions)
+        gc.collect()
+        print(
+            f"after {first_turn + step - args.warmup:6d} turns: "
+            f"{resident_memory_mb():8.1f} MB"
+        )
+
+    after = resident_memory_mb()
+    growth = after - before
+
+    print(f"resident memory {before:.1f} MB -> {after:.1f} MB ({growth:+.1f} MB)")
+    print(f"parse statistics: {len(amr.PARSE_STATISTICS.riders)} riders")
+
+    if growth > args.max_growth_mb or len(amr.PARSE_STATISTICS.riders) > 0:
+        print("FAILED: memory grows with the number of chat turns")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark of answering requests for a plain list of results with a Markdown
+table rendered from the retrieved rows instead of the final LLM call.
+
+The table queries of benchmarks/queries.json are asked once with the table
+fast path turned off and once with it turned on. The fake LLM has realistic
+latency and token rate:
+
+    python benchmarks/table_answers.py
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import statistics
+
+import fakes
+from americanmotocrossresults import cache, chat, metrics
+
+
+def run(queries, runs: int):
+    traces = []
+    metrics.TRACE_HANDLERS.append(traces.append)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(runs):
+                for query in queries:
+                    for _ in chat.chat(query["query"], []):
+                        pass
+    finally:
+        metrics.TRACE_HANDLERS.remove(traces.append)
+
+    return traces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+
+    queries = fakes.load_queries()
+    fakes.setup_fake_backends(queries)
+    table_queries = [query for query in queries if query["kind"] == "table"]
+
+    for name, max_rows in (("LLM", 0), ("table", chat.TABLE_MAX_ROWS)):
+        chat.TABLE_MAX_ROWS = max_rows
+        cache.RESULTS_CACHE.clear()
+
+        traces = run(table_queries, args.runs)
+        final = [trace.stages["final_response"] * 1000 for trace in traces]
+        total = [trace.stages["total"] * 1000 for trace in traces]
+        print(
+            f"{name:6s} final answer median {statistics.median(final):7.1f} ms, "
+            f"total median {statistics.median(total):7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
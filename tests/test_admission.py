@@ -0,0 +1,103 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from americanmotocrossresults import admission
+from americanmotocrossresults.admission import AdmissionController, AdmissionTimeout
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Clock of the admission module that moves only when the test says so."""
+    now = [1000.0]
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    return now
+
+
+def test_token_bucket_admits_burst_then_requests_per_second(clock):
+    controller = AdmissionController(10, requests_per_second=2.0, burst=2)
+
+    controller.acquire()
+    controller.acquire()
+    assert controller._delay(clock[0]) == pytest.approx(0.5)
+
+    clock[0] += 0.5
+    assert controller._delay(clock[0]) == 0.0
+
+
+def test_requests_are_admitted_in_order_of_arrival():
+    controller = AdmissionController(1, queue_timeout=5.0)
+    controller.acquire()
+
+    admitted = []
+
+    def request(i: int):
+        with controller.admit():
+            admitted.append(i)
+
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=request, args=(i,))
+        thread.start()
+        threads.append(thread)
+        # Wait until the request is queued before the next one arrives
+        while len(controller._queue) < i + 1:
+            time.sleep(0.001)
+
+    controller.release()
+    for thread in threads:
+        thread.join()
+
+    assert admitted == [0, 1, 2, 3, 4]
+
+
+def test_request_waiting_beyond_queue_timeout_is_rejected():
+    controller = AdmissionController(1, queue_timeout=0.05)
+    controller.acquire()
+
+    with pytest.raises(AdmissionTimeout):
+        controller.acquire()
+    assert len(controller._queue) == 0
+
+
+def test_rate_limit_pauses_and_doubles_backoff(clock):
+    controller = AdmissionController(10, requests_per_second=8.0, burst=8)
+
+    controller.rate_limited()
+    assert controller._delay(clock[0]) == pytest.approx(1.0)
+    assert controller._rate == 4.0
+
+    # Requests sent before the pause fail together and do not double it
+    controller.rate_limited()
+    assert controller._delay(clock[0]) == pytest.approx(1.0)
+    assert controller._rate == 4.0
+
+    clock[0] += 1.0
+    assert controller._delay(clock[0]) == 0.0
+
+    controller.rate_limited()
+    assert controller._delay(clock[0]) == pytest.approx(2.0)
+    assert controller._rate == 2.0
+
+
+def test_rate_limit_follows_retry_after(clock):
+    controller = AdmissionController(10)
+
+    controller.rate_limited(retry_after=5.0)
+
+    assert controller._delay(clock[0]) == pytest.approx(5.0)
+
+
+def test_success_restores_rate_and_resets_backoff(clock):
+    controller = AdmissionController(10, requests_per_second=8.0, burst=8)
+    controller.rate_limited()
+    clock[0] += 1.0
+
+    controller.succeeded()
+    assert controller._rate == pytest.approx(4.8)
+
+    controller.rate_limited()
+    assert controller._delay(clock[0]) == pytest.approx(1.0)
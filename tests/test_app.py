@@ -0,0 +1,17 @@
+import app
+
+
+def test_queue_runs_as_many_requests_as_the_concurrency_limit():
+    chat_interface = app.create_ui()
+    app._configure_queue(chat_interface, concurrency_limit=64, max_queue_size=0)
+
+    assert chat_interface.max_threads == 64
+    assert chat_interface._queue.max_thread_count == 64
+
+
+def test_queue_keeps_the_default_threads_for_lower_limits():
+    chat_interface = app.create_ui()
+    app._configure_queue(chat_interface, concurrency_limit=16, max_queue_size=8)
+
+    assert chat_interface._queue.max_thread_count == 40
+    assert chat_interface._queue.max_size == 8
@@ -0,0 +1,67 @@
+import json
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+import pytest
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["chromadb", "gradio", "jinja2", "numpy", "openai", "pandas"]
+
+
+def import_in_new_interpreter(module: str) -> Tuple[float, List[str]]:
+    """
+    Import the module in a new interpreter and return the import time in
+    seconds and the heavy modules that were imported.
+    """
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "seconds = time.perf_counter() - start\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps([seconds, heavy]))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=REPOSITORY_DIR,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    seconds, heavy = json.loads(output.strip().splitlines()[-1])
+
+    return seconds, heavy
+
+
+def fastest_import(module: str, runs: int = 3) -> float:
+    return min(import_in_new_interpreter(module)[0] for _ in range(runs))
+
+
+@pytest.mark.parametrize(
+    "module, forbidden",
+    [
+        # Parser of the result files
+        ("americanmotocrossresults", ["pandas", "numpy"]),
+        # Chat pipeline without the LLM client, templates and vector database
+        ("americanmotocrossresults.chat", ["chromadb", "openai", "jinja2"]),
+    ],
+)
+def test_import_does_not_load_heavy_modules(module, forbidden):
+    _, heavy = import_in_new_interpreter(module)
+
+    assert set(heavy) & set(forbidden) == set()
+
+
+def test_package_imports_much_faster_than_pandas():
+    # Times are relative to pandas on the same machine, since absolute times
+    # differ a lot between machines.
+    assert fastest_import("americanmotocrossresults") < 0.5 * fastest_import("pandas")
+
+
+def test_chat_imports_little_besides_pandas():
+    assert fastest_import("americanmotocrossresults.chat") < 2 * fastest_import(
+        "pandas"
+    )
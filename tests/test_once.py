@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from americanmotocrossresults import chat
+from americanmotocrossresults.once import Once
+
+
+def test_burst_of_threads_initializes_once():
+    once = Once("test")
+    values = []
+    calls = []
+
+    def initialize():
+        calls.append(1)
+        # Let the other threads arrive while the initialization runs
+        time.sleep(0.05)
+        values.append("loaded")
+
+    burst = 32
+    barrier = threading.Barrier(burst)
+    ran = []
+
+    def first_request():
+        barrier.wait()
+        ran.append(once.do(lambda: len(values) == 0, initialize))
+
+    threads = [threading.Thread(target=first_request) for _ in range(burst)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert once.runs == 1
+    assert sorted(ran) == [False] * (burst - 1) + [True]
+    assert values == ["loaded"]
+
+
+def test_initialization_is_not_run_when_not_needed():
+    once = Once("test")
+
+    assert not once.do(lambda: False, pytest.fail)
+    assert once.runs == 0
+
+
+def test_next_call_retries_after_initialization_raised():
+    once = Once("test")
+    values = []
+    attempts = []
+
+    def initialize():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("CSV file not readable")
+        values.append("loaded")
+
+    with pytest.raises(OSError):
+        once.do(lambda: len(values) == 0, initialize)
+    assert once.runs == 0
+
+    assert once.do(lambda: len(values) == 0, initialize)
+    assert len(attempts) == 2
+    assert once.runs == 1
+    assert values == ["loaded"]
+
+
+def test_burst_of_first_requests_loads_the_csv_file_once(monkeypatch):
+    loads = []
+    load_results_csv = chat._load_results_csv
+
+    def counting_load_results_csv():
+        loads.append(1)
+        return load_results_csv()
+
+    monkeypatch.setattr(chat, "_load_results_csv", counting_load_results_csv)
+    monkeypatch.setattr(chat, "RACE_RESULTS", None)
+    monkeypatch.setattr(chat, "SNAPSHOT_ONCE", Once("CSV file data"))
+
+    burst = 16
+    barrier = threading.Barrier(burst)
+    errors = []
+
+    def first_request():
+        barrier.wait()
+        try:
+            chat._ensure_snapshot()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=first_request) for _ in range(burst)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(loads) == 1
+    assert chat.RACE_RESULTS is not None
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from americanmotocrossresults.singleflight import SingleFlight
+
+
+def run_followers(flights: SingleFlight, key, count: int, started: threading.Event):
+    """
+    Start count callers of the key once the leader runs and return their
+    results and errors.
+    """
+    outcomes = []
+
+    def follower():
+        try:
+            outcomes.append(flights.do(key, pytest.fail))
+        except Exception as e:
+            outcomes.append(e)
+
+    started.wait()
+    threads = [threading.Thread(target=follower) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+
+    return threads, outcomes
+
+
+def wait_until_waiting(flights: SingleFlight, key, threads):
+    # The followers wait for the future of the leader
+    while any(
+        thread.is_alive() and not flights._calls[key]._waiters for thread in threads
+    ):
+        threading.Event().wait(0.001)
+
+
+def test_identical_calls_in_flight_run_once():
+    flights = SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+    calls = []
+
+    def leader_call():
+        calls.append(1)
+        started.set()
+        finish.wait()
+        return "rows"
+
+    leader = []
+    leader_thread = threading.Thread(
+        target=lambda: leader.append(flights.do("key", leader_call))
+    )
+    leader_thread.start()
+
+    threads, outcomes = run_followers(flights, "key", 4, started)
+    wait_until_waiting(flights, "key", threads)
+    finish.set()
+    leader_thread.join()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert leader == [("rows", True)]
+    assert outcomes == [("rows", False)] * 4
+
+
+def test_error_of_the_leader_reaches_followers():
+    flights = SingleFlight()
+    started = threading.Event()
+    finish = threading.Event()
+
+    def leader_call():
+        started.set()
+        finish.wait()
+        raise TimeoutError("upstream timed out")
+
+    errors = []
+
+    def leader():
+        try:
+            flights.do("key", leader_call)
+        except TimeoutError as e:
+            errors.append(e)
+
+    leader_thread = threading.Thread(target=leader)
+    leader_thread.start()
+
+    threads, outcomes = run_followers(flights, "key", 3, started)
+    wait_until_waiting(flights, "key", threads)
+    finish.set()
+    leader_thread.join()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 1
+    assert len(outcomes) == 3
+    assert all(outcome is errors[0] for outcome in outcomes)
+
+
+def test_call_after_the_flight_runs_again():
+    flights = SingleFlight()
+
+    assert flights.do("key", lambda: 1) == (1, True)
+    assert flights.do("key", lambda: 2) == (2, True)
+
+
+def test_stream_is_shared_with_callers_that_join_late():
+    flights = SingleFlight()
+    first_item = threading.Event()
+    finish = threading.Event()
+
+    def tokens():
+        yield "Eli"
+        first_item.set()
+        finish.wait()
+        yield " Tomac"
+
+    responses, leader = flights.stream("key", tokens)
+    first_item.wait()
+    late_responses, late_leader = flights.stream("key", pytest.fail)
+    finish.set()
+
+    assert (leader, late_leader) == (True, False)
+    assert "".join(responses) == "Eli Tomac"
+    assert "".join(late_responses) == "Eli Tomac"